@@ -0,0 +1,40 @@
+from typing import Annotated, Optional
+import json
+from pathlib import Path
+import typer
+from rich.console import Console
+from rich.table import Table
+
+from mix_metrics import score_samples, summarize
+
+
+def evaluate_model_output(
+    model_outputs: Annotated[list[Path], typer.Argument(exists=True, file_okay=True, dir_okay=False)],
+    output: Annotated[Optional[Path], typer.Option(help="Write the summary and per-sample scores as JSON")] = None,
+):
+    """
+    Score the responses in one or more model output files against their label mixes, without rendering audio.
+    """
+    results = {}
+    for model_output in model_outputs:
+        with open(model_output, "r") as f:
+            samples = score_samples(json.load(f))
+        results[str(model_output)] = dict(summary=summarize(samples), samples=samples.to_dicts())
+
+    table = Table(title="Mix Metrics")
+    columns = ["samples", "json_validity", "precision", "recall", "volume_mae", "random_accuracy"]
+    table.add_column("Model Output", justify="left")
+    for column in columns:
+        table.add_column(column.replace("_", " ").title(), justify="center")
+    for name, result in results.items():
+        summary = result["summary"]
+        table.add_row(name, *("-" if summary[x] is None else f"{summary[x]:.3f}" if isinstance(summary[x], float) else str(summary[x]) for x in columns))
+    Console().print(table)
+
+    if output is not None:
+        with open(output, "w") as f:
+            json.dump(results, f)
+
+
+if __name__ == "__main__":
+    typer.run(evaluate_model_output)
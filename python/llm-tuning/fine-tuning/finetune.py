@@ -1,16 +1,11 @@
 from typing import Annotated, Optional
 import typer
 from pathlib import Path
-from datasets import load_dataset
-import torch
-from transformers import TrainingArguments
-from trl import SFTTrainer
-from random import randint
 from rich.progress import track
 import json
-from unsloth import FastLanguageModel
-from unsloth.chat_templates import get_chat_template
 
+# torch, unsloth and the huggingface packages are imported where they are used. evaluate spawns worker
+# processes that re-import this module, and they only need llama_cpp.
 cli = typer.Typer()
 
 
@@ -21,6 +16,9 @@ def log_into_huggingface(token: str):
 
 
 def process_dataset(dataset_path: Path, tokenizer, output_path: Path, test_size: float):
+    from datasets import load_dataset
+    from unsloth.chat_templates import get_chat_template
+
     # Load dataset
     dataset = load_dataset("json", data_files=str(dataset_path), split="train")
     dataset = dataset.train_test_split(test_size=test_size)
@@ -57,6 +55,8 @@ def process_dataset(dataset_path: Path, tokenizer, output_path: Path, test_size:
 
 
 def create_model(model_id: str | Path, max_seq_length=2048):
+    from unsloth import FastLanguageModel
+
     model, tokenizer = FastLanguageModel.from_pretrained(
         model_name=model_id,
         max_seq_length=max_seq_length,
@@ -68,6 +68,8 @@ def create_model(model_id: str | Path, max_seq_length=2048):
 
 
 def prepare_model(model):
+    from unsloth import FastLanguageModel
+
     # Patch model LORA
     return FastLanguageModel.get_peft_model(
         model,
@@ -92,6 +94,8 @@ def prepare_model(model):
 
 
 def prepare_tokenizer(tokenizer, chat_format):
+    from unsloth.chat_templates import get_chat_template
+
     return get_chat_template(tokenizer, chat_template="chatml", map_eos_token=True)
 
 
@@ -111,6 +115,12 @@ def finetune(
     max_seq_length: int = 2048,
     test_size: float = 0.1,
 ):
+    # unsloth patches transformers and trl, so it is imported first
+    import unsloth  # noqa: F401
+    import torch
+    from transformers import TrainingArguments
+    from trl import SFTTrainer
+
     typer.echo(f"Fine-tuning {model_id} on {dataset_path} for {epochs} epochs")
     typer.echo(f"Learning rate: {learning_rate}, Batch size: {batch_size}")
 
@@ -199,10 +209,19 @@ def evaluate(
     max_seq_length: int = 2048,
     use_gpu: bool = False,
     verbose: bool = False,
+    workers: Annotated[
+        int, typer.Option(help="Number of model instances evaluating in parallel")
+    ] = 1,
+    threads: Annotated[
+        Optional[int],
+        typer.Option(help="Threads per model instance, defaults to the CPU cores split across workers"),
+    ] = None,
+    max_in_flight: Optional[int] = None,
 ):
-    from llama_cpp import Llama, CompletionUsage
     from rich.table import Table
     from rich.console import Console
+    from datasets import load_dataset
+    from parallel_evaluation import iter_evaluations
     import time
 
     console = Console()
@@ -216,65 +235,73 @@ def evaluate(
             typer.echo(f"An error occurred logging into huggingface: {e}")
             exit(1)
 
-    model_dir_or_id = Path(model_dir_or_id)
-    if model_dir_or_id.exists():
-        model = Llama(
-            model_path=str(model_dir_or_id),
-            n_gpu_layers=-1 if use_gpu else 0,
-            n_ctx=max_seq_length,
-            chat_format="chatml",
-            verbose=verbose,
-        )
-    else:
-        model = Llama.from_pretrained(
-            repo_id=str(model_dir_or_id),
-            n_gpu_layers=-1 if use_gpu else 0,
-            n_ctx=max_seq_length,
-            chat_format="chatml",
-            filename="*.gguf",
-            verbose=verbose,
-        )
-
-    def evaluate_prompt(messages: list[dict]) -> tuple[str, CompletionUsage]:
-        model_response = model.create_chat_completion(messages, max_tokens=2048)
-
-        return model_response["choices"][0]["message"]["content"], model_response[
-            "usage"
-        ]
-
-    eval_dataset = load_dataset("json", data_files=str(dataset_path), split="train")
-    rand_idx = randint(0, len(eval_dataset))
+    if use_gpu and workers > 1:
+        typer.echo("Evaluating on the GPU with a single model instance")
+        workers = 1
 
-    typer.echo(f"Query:\n{eval_dataset[rand_idx]['messages'][:-1]}")
-    typer.echo(f"Original Answer:\n{eval_dataset[rand_idx]['messages'][-1]['content']}")
-    typer.echo(
-        f"Generated Answer:\n{evaluate_prompt(eval_dataset[rand_idx]['messages'][:-1])[0].strip()}"
+    model_args = dict(
+        model_dir_or_id=model_dir_or_id,
+        max_seq_length=max_seq_length,
+        use_gpu=use_gpu,
+        threads=threads,
+        verbose=verbose,
     )
 
+    eval_dataset = load_dataset("json", data_files=str(dataset_path), split="train")
+    samples = (s["messages"] for s in eval_dataset.shuffle())
+
     # Track time
     start_time = time.time()
     evaluations = []
-    for s in track(eval_dataset.shuffle(), description="Evaluating..."):
-        sample = s["messages"]
-        response, stats = evaluate_prompt(sample[:-1])
-        evaluations.append(dict(sample=sample, response=response, stats=stats))
+    shown_example = False
+    # Results are streamed to the output file as they complete. The array is closed even if the run fails or
+    # is interrupted, so the output stays valid JSON and keeps the finished samples.
+    with open(output_path, "w") as f:
+        f.write("[")
+        try:
+            for evaluation in track(
+                iter_evaluations(samples, model_args, workers=workers, max_in_flight=max_in_flight),
+                description="Evaluating...",
+                total=len(eval_dataset),
+            ):
+                if "error" in evaluation:
+                    typer.echo(f"Failed to evaluate a sample: {evaluation['error']}", err=True)
+                elif not shown_example:
+                    shown_example = True
+                    typer.echo(f"Query:\n{evaluation['sample'][:-1]}")
+                    typer.echo(f"Original Answer:\n{evaluation['sample'][-1]['content']}")
+                    typer.echo(f"Generated Answer:\n{evaluation['response'].strip()}")
+                if evaluations:
+                    f.write(",\n")
+                json.dump(evaluation, f)
+                f.flush()
+                evaluations.append(evaluation)
+        finally:
+            f.write("]")
     evaluation_time = time.time() - start_time
     typer.echo(
         f"Evaluation time: {evaluation_time:.2f} seconds. Per sample: {evaluation_time/len(eval_dataset):.2f} seconds"
     )
 
+    failed = sum(1 for x in evaluations if "error" in x)
+    if failed:
+        typer.echo(f"Failed to evaluate {failed} of {len(evaluations)} samples", err=True)
+    evaluations = [x for x in evaluations if "error" not in x]
+    if not evaluations:
+        return
+
     # Summarize stats
     def get_stats(evaluations, attr_name):
-        min_prompt_tokens = min(getattr(x["stats"], attr_name) for x in evaluations)
-        max_prompt_tokens = max(getattr(x["stats"], attr_name) for x in evaluations)
+        min_prompt_tokens = min(x["stats"][attr_name] for x in evaluations)
+        max_prompt_tokens = max(x["stats"][attr_name] for x in evaluations)
         avg_prompt_tokens = sum(
-            getattr(x["stats"], attr_name) for x in evaluations
+            x["stats"][attr_name] for x in evaluations
         ) / len(evaluations)
         return min_prompt_tokens, max_prompt_tokens, avg_prompt_tokens
 
-    promp_token_stats = get_stats(evaluations, "PROMPT_TOKENS")
-    response_token_stats = get_stats(evaluations, "RESPONSE_TOKENS")
-    total_token_stats = get_stats(evaluations, "TOTAL_TOKENS")
+    promp_token_stats = get_stats(evaluations, "prompt_tokens")
+    response_token_stats = get_stats(evaluations, "completion_tokens")
+    total_token_stats = get_stats(evaluations, "total_tokens")
     # Print as table with columns Min, Max, Avg and rows Prompt, Response, Total
     table = Table(title="Token Stats")
     table.add_column("Token Type", justify="center")
@@ -287,9 +314,6 @@ def evaluate(
 
     console.print(table)
 
-    with open(output_path, "w") as f:
-        json.dump(evaluations, f)
-
 
 if __name__ == "__main__":
     cli()
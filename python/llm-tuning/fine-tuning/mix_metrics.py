@@ -0,0 +1,131 @@
+from typing import Any, Optional
+import json
+import polars as pl
+
+TRACK_SCHEMA = {
+    "sample": pl.Int64,
+    "name": pl.Utf8,
+    "volume": pl.Float64,
+    "random": pl.Boolean,
+}
+
+
+def sample_messages(evaluation: dict) -> list[dict]:
+    # model-output.json nests the messages in a dict, finetune.py evaluate stores the message list directly
+    sample = evaluation["sample"]
+    return sample["messages"] if isinstance(sample, dict) else sample
+
+
+def parse_number(value: Any) -> Optional[float]:
+    if isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_flag(value: Any) -> Optional[bool]:
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().lower() in ("true", "false"):
+        return value.strip().lower() == "true"
+    return None
+
+
+def parse_mix(content: str) -> Optional[list[dict]]:
+    """
+    Parse a mix, returning None unless it is a JSON list of track objects with a name.
+    """
+    try:
+        mix = json.loads(content)
+    except (json.JSONDecodeError, TypeError):
+        return None
+    if not isinstance(mix, list) or not all(isinstance(x, dict) and isinstance(x.get("name"), str) for x in mix):
+        return None
+    return mix
+
+
+def mix_frame(mixes: list[Optional[list[dict]]]) -> pl.DataFrame:
+    """
+    Flatten mixes into one row per sample and track. Tracks repeated within a mix only count once.
+    """
+    rows = [
+        (sample, track["name"], parse_number(track.get("volume")), parse_flag(track.get("random")))
+        for sample, mix in enumerate(mixes) if mix is not None
+        for track in mix if track["name"] != "-"
+    ]
+    return pl.DataFrame(rows, schema=TRACK_SCHEMA, orient="row").unique(subset=["sample", "name"], keep="first", maintain_order=True)
+
+
+def score_samples(evaluations: list[dict]) -> pl.DataFrame:
+    """
+    Compare the response mix of every evaluation with its label mix.
+
+    Returns:
+        pl.DataFrame: One row per sample with the JSON validity of the response, the number of label, response and
+            matched tracks, precision and recall on track names, the summed absolute volume error and the
+            number of matched tracks with the same random flag. Matched tracks whose label has no random flag are
+            not counted towards the flag, a missing flag in the response counts as a mismatch.
+    """
+    labels = [parse_mix(sample_messages(x)[-1]["content"]) for x in evaluations]
+    responses = [parse_mix(x["response"]) for x in evaluations]
+
+    label_tracks = mix_frame(labels)
+    response_tracks = mix_frame(responses)
+    matched = label_tracks.join(response_tracks, on=["sample", "name"], how="inner", suffix="_response")
+    matched = matched.select(
+        "sample",
+        (pl.col("volume") - pl.col("volume_response")).abs().alias("volume_error"),
+        # A response that leaves out the random flag of a labelled track, or gives an invalid one, is a mismatch
+        pl.when(pl.col("random").is_not_null())
+        .then((pl.col("random") == pl.col("random_response")).fill_null(False))
+        .alias("random_match"),
+    )
+
+    samples = pl.DataFrame({
+        "sample": range(len(evaluations)),
+        "valid_json": [x is not None for x in responses],
+    }, schema={"sample": pl.Int64, "valid_json": pl.Boolean})
+    counts = [
+        label_tracks.group_by("sample").agg(pl.len().alias("label_tracks")),
+        response_tracks.group_by("sample").agg(pl.len().alias("response_tracks")),
+        matched.group_by("sample").agg(
+            pl.len().alias("matched_tracks"),
+            pl.col("volume_error").sum().alias("volume_error"),
+            pl.col("volume_error").is_not_null().sum().alias("volume_pairs"),
+            pl.col("random_match").sum().alias("random_matches"),
+            pl.col("random_match").is_not_null().sum().alias("random_pairs"),
+        ),
+    ]
+    for frame in counts:
+        samples = samples.join(frame, on="sample", how="left")
+
+    count_columns = ["label_tracks", "response_tracks", "matched_tracks", "volume_pairs", "random_matches", "random_pairs"]
+    samples = samples.with_columns(pl.col(count_columns).fill_null(0), pl.col("volume_error").fill_null(0.0))
+    return samples.with_columns(
+        (pl.col("matched_tracks") / pl.col("response_tracks")).alias("precision"),
+        (pl.col("matched_tracks") / pl.col("label_tracks")).alias("recall"),
+    ).with_columns(pl.col(["precision", "recall"]).fill_nan(None))
+
+
+def summarize(samples: pl.DataFrame) -> dict[str, Optional[float]]:
+    """
+    Aggregate per-sample scores into the metrics of a model.
+
+    Precision and recall are micro-averaged over all tracks. Volume MAE and random flag accuracy are taken over
+    the tracks present in both label and response, the accuracy only over those with a random flag in the label.
+    """
+    totals = samples.select(
+        pl.len().alias("samples"),
+        pl.col("valid_json").mean().alias("json_validity"),
+        (pl.col("matched_tracks").sum() / pl.col("response_tracks").sum()).alias("precision"),
+        (pl.col("matched_tracks").sum() / pl.col("label_tracks").sum()).alias("recall"),
+        pl.col("precision").mean().alias("sample_precision"),
+        pl.col("recall").mean().alias("sample_recall"),
+        # Pooled from the per-sample error sums, so the matched tracks never have to be gathered into one array
+        (pl.col("volume_error").sum() / pl.col("volume_pairs").sum()).alias("volume_mae"),
+        (pl.col("random_matches").sum() / pl.col("random_pairs").sum()).alias("random_accuracy"),
+    ).row(0, named=True)
+    # Ratios over empty sets are NaN, report them as missing
+    return {name: None if value is None or value != value else value for name, value in totals.items()}
@@ -0,0 +1,282 @@
+from typing import Optional
+import hashlib
+import json
+import math
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
+from pathlib import Path
+import numpy as np
+import pydub
+from pydub.exceptions import CouldntDecodeError
+import typer
+
+# Frames of the average spectrum used for the spectral centroid of a track
+STATS_FRAME_LENGTH = 2048
+
+
+class EmptyMixError(ValueError):
+    """
+    A mix without a single valid, non-silent track, which has nothing to render.
+    """
+
+
+@dataclass(frozen=True)
+class TrackStats:
+    num_samples: int
+    peak: float
+    rms: float
+    spectral_centroid: float
+
+
+def track_gain(volume: float) -> float:
+    # Linear equivalent of the log10(volume / 100) dB gain the pydub renderer applied
+    return 10 ** (math.log10(volume / 100) / 20)
+
+
+def to_dbfs(value: float) -> float:
+    return 20 * math.log10(value) if value > 0 else -math.inf
+
+
+def decode_track(path: Path, sample_rate: int, channels: int) -> np.ndarray:
+    segment = pydub.AudioSegment.from_file(path).set_frame_rate(sample_rate).set_channels(channels)
+    samples = np.array(segment.get_array_of_samples(), dtype=np.float32).reshape(-1, channels)
+    return samples / float(1 << (8 * segment.sample_width - 1))
+
+
+def compute_stats(pcm: np.ndarray, sample_rate: int) -> TrackStats:
+    mono = pcm.mean(axis=1)
+    num_frames = len(mono) // STATS_FRAME_LENGTH
+    if num_frames:
+        frames = mono[:num_frames * STATS_FRAME_LENGTH].reshape(num_frames, STATS_FRAME_LENGTH)
+        power = (np.abs(np.fft.rfft(frames * np.hanning(STATS_FRAME_LENGTH), axis=1)) ** 2).mean(axis=0)
+        frequencies = np.fft.rfftfreq(STATS_FRAME_LENGTH, 1 / sample_rate)
+        centroid = float((frequencies * power).sum() / power.sum()) if power.sum() > 0 else 0.0
+    else:
+        centroid = 0.0
+    return TrackStats(
+        num_samples=len(pcm),
+        peak=float(np.abs(pcm).max()) if len(pcm) else 0.0,
+        rms=float(np.sqrt(np.mean(np.square(pcm, dtype=np.float64)))) if len(pcm) else 0.0,
+        spectral_centroid=centroid,
+    )
+
+
+class TrackCache:
+    """
+    Decoded tracks as float32 arrays of shape (samples, channels) at a fixed sample rate.
+
+    Tracks are decoded once and kept in an in-memory LRU of max_tracks entries. With a cache_dir, the PCM and
+    the loudness and spectral stats of every track are also written to disk, keyed by the path, size and
+    modification time of the file, and later runs load the PCM memory-mapped instead of decoding again.
+    """
+
+    def __init__(self, sample_rate: int = 44100, channels: int = 2, cache_dir: Optional[Path] = None, max_tracks: int = 64):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.cache_dir = cache_dir
+        self.max_tracks = max_tracks
+        self._pcm = OrderedDict()
+        self._stats = {}
+        if cache_dir is not None:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _key(self, path: Path) -> str:
+        info = path.stat()
+        source = f"{path.resolve()}:{info.st_size}:{info.st_mtime_ns}:{self.sample_rate}:{self.channels}"
+        return hashlib.sha1(source.encode()).hexdigest()
+
+    def pcm(self, path: Path) -> np.ndarray:
+        key = self._key(path)
+        if key in self._pcm:
+            self._pcm.move_to_end(key)
+            return self._pcm[key]
+
+        pcm_path = self.cache_dir / f"{key}.npy" if self.cache_dir is not None else None
+        if pcm_path is not None and pcm_path.exists():
+            pcm = np.load(pcm_path, mmap_mode="r")
+        else:
+            pcm = decode_track(path, self.sample_rate, self.channels)
+            if pcm_path is not None:
+                # Write to a temporary file first so an interrupted run never leaves a truncated array behind
+                partial_path = pcm_path.with_suffix(".partial.npy")
+                np.save(partial_path, pcm)
+                partial_path.replace(pcm_path)
+
+        self._pcm[key] = pcm
+        if len(self._pcm) > self.max_tracks:
+            self._pcm.popitem(last=False)
+        return pcm
+
+    def stats(self, path: Path) -> TrackStats:
+        key = self._key(path)
+        if key in self._stats:
+            return self._stats[key]
+
+        stats_path = self.cache_dir / f"{key}.json" if self.cache_dir is not None else None
+        if stats_path is not None and stats_path.exists():
+            with stats_path.open() as f:
+                stats = TrackStats(**json.load(f))
+        else:
+            stats = compute_stats(self.pcm(path), self.sample_rate)
+            if stats_path is not None:
+                with stats_path.open("w") as f:
+                    json.dump(asdict(stats), f)
+
+        self._stats[key] = stats
+        return stats
+
+
+def mix_layers(tracks: dict[str, Path], mix: list[dict], verbose: bool = True) -> list[tuple[str, Path, float]]:
+    """
+    Resolve the tracks of a mix to their names, files and linear gains, skipping (and reporting if verbose)
+    invalid entries.
+    """
+    layers = []
+    for track in mix:
+        track_name = track["name"]
+        track_volume = track["volume"]
+
+        if track_name == '-':
+            continue
+        if track_name not in tracks:
+            if verbose:
+                typer.echo(f"Track {track_name} not found", err=True)
+            continue
+        if not isinstance(track_volume, (int, float)) or track_volume < 0 or track_volume > 100:
+            if verbose:
+                typer.echo(f"Invalid volume for track {track_name}: {track_volume}", err=True)
+            continue
+        if track_volume == 0:
+            continue
+        layers.append((track_name, tracks[track_name], track_gain(track_volume)))
+    return layers
+
+
+def render_mix(cache: TrackCache, tracks: dict[str, Path], mix: list[dict], duration: Optional[float] = None, fixed_length: bool = False) -> np.ndarray:
+    """
+    Render a mix to a float32 array of shape (samples, channels).
+
+    The mix lasts as long as its longest track, or duration seconds if that is shorter, and every other track
+    loops until the end of the mix. With fixed_length, the mix always lasts duration seconds and every track
+    loops. The sum is clipped to [-1, 1] like pydub's overlay saturates. A mix whose tracks are all invalid,
+    muted or empty raises EmptyMixError instead of rendering nothing or plain silence.
+    """
+    layers = [(cache.pcm(path), gain) for _, path, gain in mix_layers(tracks, mix)]
+    if not any(len(pcm) for pcm, _ in layers):
+        raise EmptyMixError("The mix has no valid track")
+    length = max((len(pcm) for pcm, _ in layers), default=0)
+    if duration is not None:
+        length = int(duration * cache.sample_rate) if fixed_length else min(length, int(duration * cache.sample_rate))
+
+    audio = np.zeros((length, cache.channels), dtype=np.float32)
+    for pcm, gain in layers:
+        if not len(pcm):
+            continue
+        for start in range(0, length, len(pcm)):
+            stop = min(start + len(pcm), length)
+            audio[start:stop] += gain * pcm[:stop - start]
+    return np.clip(audio, -1.0, 1.0, out=audio)
+
+
+def to_segment(audio: np.ndarray, sample_rate: int) -> pydub.AudioSegment:
+    samples = np.round(audio * 32767).astype("<i2")
+    return pydub.AudioSegment(samples.tobytes(), frame_rate=sample_rate, sample_width=2, channels=audio.shape[1])
+
+
+def write_mix(audio: np.ndarray, sample_rate: int, path: Path):
+    to_segment(audio, sample_rate).export(path, format=path.suffix.lstrip(".") or "wav")
+
+
+def energy_shares(cache: TrackCache, tracks: dict[str, Path], mix: list[dict]) -> dict[str, float]:
+    """
+    Share of every track in the energy of a mix, estimated from the track stats without rendering.
+    """
+    energies = {}
+    for name, path, gain in mix_layers(tracks, mix, verbose=False):
+        energies[name] = energies.get(name, 0.0) + (gain * cache.stats(path).rms) ** 2
+    total = sum(energies.values())
+    return {name: energy / total if total > 0 else 0.0 for name, energy in energies.items()}
+
+
+def track_overlap(label_shares: dict[str, float], response_shares: dict[str, float]) -> float:
+    # Histogram intersection: 1 if both mixes use the same tracks at the same relative levels, 0 if no track is shared
+    return sum(min(share, response_shares.get(name, 0.0)) for name, share in label_shares.items())
+
+
+_cache = None
+_tracks = None
+
+
+def _init_worker(sample_rate: int, channels: int, cache_dir: Path, tracks: dict[str, Path]):
+    global _cache, _tracks
+    _cache = TrackCache(sample_rate=sample_rate, channels=channels, cache_dir=cache_dir, max_tracks=16)
+    _tracks = tracks
+
+
+def _cache_track(path: Path):
+    try:
+        _cache.stats(path)
+    except (OSError, CouldntDecodeError) as e:
+        typer.echo(f"Could not decode {path}: {e}", err=True)
+
+
+def _render_sample(index: int, mixes: dict[str, str], duration: float, output_dir: Path) -> dict:
+    result = dict(index=index)
+    shares = {}
+    for name, content in mixes.items():
+        try:
+            mix = json.loads(content)
+            audio = render_mix(_cache, _tracks, mix, duration=duration, fixed_length=True)
+            shares[name] = energy_shares(_cache, _tracks, mix)
+        except (json.JSONDecodeError, KeyError, TypeError, AttributeError, OSError, CouldntDecodeError, EmptyMixError) as e:
+            result[f"{name}_error"] = f"{type(e).__name__}: {e}"
+            continue
+
+        path = output_dir / f"{index:05d}-{name}.wav"
+        write_mix(audio, _cache.sample_rate, path)
+        stats = compute_stats(audio, _cache.sample_rate)
+        result[name] = dict(
+            file=str(path),
+            num_tracks=len(shares[name]),
+            rms_dbfs=to_dbfs(stats.rms),
+            peak_dbfs=to_dbfs(stats.peak),
+            spectral_centroid=stats.spectral_centroid,
+        )
+
+    if len(shares) == 2:
+        label_shares, response_shares = shares.values()
+        result["track_overlap"] = track_overlap(label_shares, response_shares)
+        result["tracks"] = {
+            name: dict(label_share=label_shares.get(name, 0.0), response_share=response_shares.get(name, 0.0))
+            for name in sorted(label_shares.keys() | response_shares.keys())
+        }
+    return result
+
+
+def render_batch(samples: list[dict[str, str]], tracks: dict[str, Path], output_dir: Path, cache_dir: Path, duration: float, sample_rate: int = 44100, channels: int = 2, workers: Optional[int] = None):
+    """
+    Render the mixes of many samples to fixed-length wav files in parallel, yielding the metrics of every sample.
+
+    Every track referenced by a valid mix is first decoded exactly once into cache_dir. The rendering workers
+    then load the PCM memory-mapped from there, so the operating system shares the pages between processes.
+    Results are yielded in completion order.
+    """
+    referenced = set()
+    for mixes in samples:
+        for content in mixes.values():
+            try:
+                referenced.update(path for _, path, _ in mix_layers(tracks, json.loads(content), verbose=False))
+            except (json.JSONDecodeError, KeyError, TypeError, AttributeError):
+                continue
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    initargs = (sample_rate, channels, cache_dir, tracks)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as executor:
+        list(executor.map(_cache_track, sorted(referenced)))
+        futures = [
+            executor.submit(_render_sample, index, mixes, duration, output_dir)
+            for index, mixes in enumerate(samples)
+        ]
+        for future in as_completed(futures):
+            yield future.result()
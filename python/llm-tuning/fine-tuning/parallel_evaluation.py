@@ -0,0 +1,144 @@
+from typing import Callable, Iterable, Iterator, Optional
+import os
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from pathlib import Path
+
+_model = None
+
+
+def load_model(model_dir_or_id: str, max_seq_length: int = 2048, use_gpu: bool = False, threads: Optional[int] = None, verbose: bool = False):
+    from llama_cpp import Llama
+
+    model_path = Path(model_dir_or_id)
+    if model_path.exists():
+        return Llama(
+            model_path=str(model_path),
+            n_gpu_layers=-1 if use_gpu else 0,
+            n_ctx=max_seq_length,
+            n_threads=threads,
+            chat_format="chatml",
+            verbose=verbose,
+        )
+    return Llama.from_pretrained(
+        repo_id=str(model_dir_or_id),
+        n_gpu_layers=-1 if use_gpu else 0,
+        n_ctx=max_seq_length,
+        n_threads=threads,
+        chat_format="chatml",
+        filename="*.gguf",
+        verbose=verbose,
+    )
+
+
+def evaluate_prompt(model, messages: list[dict], max_tokens: int = 2048) -> tuple[str, dict]:
+    model_response = model.create_chat_completion(messages, max_tokens=max_tokens)
+    return model_response["choices"][0]["message"]["content"], model_response["usage"]
+
+
+def failed_evaluation(sample: list[dict], error: Exception) -> dict:
+    return dict(sample=sample, response=None, stats=None, error=f"{type(error).__name__}: {error}")
+
+
+def evaluate_sample(model, sample: list[dict]) -> dict:
+    # A failing sample is recorded with its error instead of aborting the whole evaluation
+    try:
+        response, stats = evaluate_prompt(model, sample[:-1])
+    except Exception as e:
+        return failed_evaluation(sample, e)
+    return dict(sample=sample, response=response, stats=stats)
+
+
+def _init_worker(loader: Callable, model_args: dict):
+    global _model
+    _model = loader(**model_args)
+
+
+def _evaluate_sample(sample: list[dict]) -> dict:
+    return evaluate_sample(_model, sample)
+
+
+def iter_evaluations(samples: Iterable[list[dict]], model_args: dict, workers: int = 1, max_in_flight: Optional[int] = None, loader: Callable = load_model) -> Iterator[dict]:
+    """
+    Generate a response to every sample, yielding evaluations as they complete.
+
+    With more than one worker, every worker process loads its own model instance with threads split evenly
+    across the CPU cores, unless model_args sets threads. At most max_in_flight samples (default two per worker)
+    are queued at a time, so workers never idle while results are consumed and the samples are never all
+    held in the queue at once. Workers are spawned rather than forked, so they do not inherit CUDA or torch state
+    from the parent. A spawned worker re-imports the main module, which must therefore not import torch or other
+    heavy packages at the top level.
+
+    If a worker dies, the pool is rebuilt and the samples that were in flight are evaluated again, one at a
+    time, so that a sample that crashes its worker again is known to be the cause. A sample that fails, including
+    one that crashed its worker twice, is yielded with response and stats set to None and the error message in
+    error.
+    """
+    if workers <= 1:
+        model = loader(**model_args)
+        for sample in samples:
+            yield evaluate_sample(model, sample)
+        return
+
+    model_args = dict(model_args)
+    if model_args.get("threads") is None:
+        model_args["threads"] = max(1, (os.cpu_count() or 1) // workers)
+    max_in_flight = max_in_flight or 2 * workers
+
+    def start_pool() -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"), initializer=_init_worker, initargs=(loader, model_args))
+
+    def collect(done) -> tuple[list[dict], bool]:
+        evaluations, crashed = [], False
+        for future in done:
+            sample, retried = futures.pop(future)
+            try:
+                evaluations.append(future.result())
+            except BrokenProcessPool as e:
+                crashed = True
+                if retried:
+                    evaluations.append(failed_evaluation(sample, e))
+                else:
+                    suspects.append((sample, True))
+            except Exception as e:
+                evaluations.append(failed_evaluation(sample, e))
+        return evaluations, crashed
+
+    samples = iter(samples)
+    # Samples that were in flight when a worker died, flagged once they are retried
+    suspects = deque()
+    futures = {}
+    executor = start_pool()
+    try:
+        while True:
+            broken = False
+            while len(futures) < max_in_flight:
+                if suspects:
+                    # A suspect runs alone, so a second crash is pinned on it and not on its neighbours
+                    if futures:
+                        break
+                    sample, retried = suspects.popleft()
+                else:
+                    sample, retried = next(samples, None), False
+                    if sample is None:
+                        break
+                try:
+                    futures[executor.submit(_evaluate_sample, sample)] = (sample, retried)
+                except BrokenProcessPool:
+                    suspects.appendleft((sample, retried))
+                    broken = True
+                    break
+            if not futures and not suspects:
+                break
+
+            evaluations, crashed = collect(wait(futures, return_when=FIRST_COMPLETED).done if futures else set())
+            if broken or crashed:
+                # The samples still in flight are lost with the pool, so they are collected before it is rebuilt
+                evaluations += collect(wait(futures).done)[0]
+                executor.shutdown()
+                executor = start_pool()
+            yield from evaluations
+    finally:
+        executor.shutdown(cancel_futures=True)
@@ -1,46 +1,38 @@
 import typer
 from pathlib import Path
-from typing import Annotated
+from typing import Annotated, Optional
 import json
-import math
 import random
-import pydub
+import tempfile
+import numpy as np
 import pydub.playback as playback
 from pprint import pprint as print
+from rich.progress import track
 
-def play_track_mix(tracks: dict[str, Path], mix: dict):
-    audio = []
-    for track in mix:
-        track_name = track["name"]
-        track_volume = track["volume"]
+from mix_renderer import EmptyMixError, TrackCache, render_batch, render_mix, to_dbfs, to_segment, write_mix
 
-        if track_name == '-':
-            continue
-        if track_name not in tracks:
-            typer.echo(f"Track {track_name} not found", err=True)
-            continue
-        if track_volume < 0 or track_volume > 100:
-            typer.echo(f"Invalid volume for track {track_name}: {track_volume}", err=True)
-            continue
-        if track_volume == 0:
-            continue
+cli = typer.Typer()
+
+
+def load_tracks(audio_dir: Path, track_file: Path) -> dict[str, Path]:
+    with open(track_file, "r") as f:
+        return {track["name"]: audio_dir/(track["src"].split("/")[-1]) for track in json.load(f)}
 
-        track_file = tracks[track_name]
-        pb = pydub.AudioSegment.from_file(track_file)
-        # Set pb volume to track_volume
-        pb = pb + math.log10(track_volume/100)
-        audio.append(pb)
-    audio.sort(key=lambda x: x.duration_seconds, reverse=True)
-    res = audio[0]
-    for pb in audio[1:]:
-        res = res.overlay(pb, loop=True)
-    return res
-
-def play_random_mix(model_output: Annotated[Path, typer.Argument(exists=True, file_okay=True, dir_okay=False)], audio_dir: Annotated[Path, typer.Argument(exists=True, file_okay=False, dir_okay=True)], track_file: Annotated[Path, typer.Argument(exists=True, file_okay=True, dir_okay=False)], playback_duration: int = 10):
+
+@cli.command()
+def play_random_mix(
+    model_output: Annotated[Path, typer.Argument(exists=True, file_okay=True, dir_okay=False)],
+    audio_dir: Annotated[Path, typer.Argument(exists=True, file_okay=False, dir_okay=True)],
+    track_file: Annotated[Path, typer.Argument(exists=True, file_okay=True, dir_okay=False)],
+    playback_duration: int = 10,
+    sample_rate: int = 44100,
+    cache_dir: Optional[Path] = None,
+    output_dir: Annotated[Optional[Path], typer.Option(help="Write the mixes to this directory instead of playing them")] = None,
+):
     with open(model_output, "r") as f:
         parsed_model_output = json.load(f)
-    with open(track_file, "r") as f:
-        tracks = {track["name"]: audio_dir/(track["src"].split("/")[-1]) for track in json.load(f)}
+    tracks = load_tracks(audio_dir, track_file)
+    cache = TrackCache(sample_rate=sample_rate, cache_dir=cache_dir)
 
     # Select a random item
     sample = random.choice(parsed_model_output)
@@ -50,21 +42,64 @@ def play_random_mix(model_output: Annotated[Path, typer.Argument(exists=True, fi
     label_mix = json.loads(sample["sample"]['messages'][-1]['content'])
     response_mix = json.loads(sample["response"])
 
-    label_audio = play_track_mix(tracks, label_mix)
-    label_audio = label_audio[:playback_duration*1000]
-    # Play label audio
-    typer.echo(f"Playing label audio ({label_audio.max_dBFS} db, {label_audio.duration_seconds}) seconds")
-    print(label_mix)
-    playback.play(label_audio)
+    for name, mix in (("label", label_mix), ("response", response_mix)):
+        try:
+            audio = render_mix(cache, tracks, mix, duration=playback_duration)
+        except EmptyMixError as e:
+            typer.echo(f"Skipping the {name} mix: {e}", err=True)
+            continue
+        peak = float(np.abs(audio).max()) if audio.size else 0.0
+        typer.echo(f"Rendered {name} audio ({to_dbfs(peak)} db, {len(audio) / sample_rate}) seconds")
+        print(mix)
+        if output_dir is not None:
+            output_dir.mkdir(parents=True, exist_ok=True)
+            write_mix(audio, sample_rate, output_dir / f"{name}.wav")
+        else:
+            playback.play(to_segment(audio, sample_rate))
+
+
+@cli.command()
+def render(
+    model_output: Annotated[Path, typer.Argument(exists=True, file_okay=True, dir_okay=False)],
+    audio_dir: Annotated[Path, typer.Argument(exists=True, file_okay=False, dir_okay=True)],
+    track_file: Annotated[Path, typer.Argument(exists=True, file_okay=True, dir_okay=False)],
+    output_dir: Path,
+    duration: float = 30.0,
+    sample_rate: int = 44100,
+    cache_dir: Annotated[Optional[Path], typer.Option(help="Keep the decoded tracks here across runs")] = None,
+    workers: Optional[int] = None,
+):
+    """
+    Render the label and response mix of every sample to fixed-length wav files and compute mix metrics.
+    """
+    with open(model_output, "r") as f:
+        samples = [
+            dict(label=x["sample"]["messages"][-1]["content"], response=x["response"])
+            for x in json.load(f)
+        ]
+    tracks = load_tracks(audio_dir, track_file)
+
+    with tempfile.TemporaryDirectory(prefix="track-cache-") as tmp_dir:
+        batch = render_batch(samples, tracks, output_dir, cache_dir or Path(tmp_dir), duration, sample_rate, workers=workers)
+        results = sorted(track(batch, description="Rendering mixes", total=len(samples)), key=lambda x: x["index"])
 
-    response_audio = play_track_mix(tracks, response_mix)
-    response_audio = response_audio[:playback_duration*1000]
-    # Play response audio
-    typer.echo(f"Playing response audio ({response_audio.max_dBFS} db, {response_audio.duration_seconds}) seconds")
-    print(response_mix)
-    playback.play(response_audio)
+    with open(output_dir / "metrics.json", "w") as f:
+        json.dump(results, f, indent=2)
 
+    rendered = [x for x in results if "track_overlap" in x]
+    typer.echo(f"Rendered {len(rendered)} of {len(results)} samples to {output_dir}")
+    if rendered:
+        overlap = np.mean([x["track_overlap"] for x in rendered])
+        # Silent mixes have an RMS of -inf dB and are left out of the level comparison
+        rms_difference = np.mean([
+            abs(x["label"]["rms_dbfs"] - x["response"]["rms_dbfs"])
+            for x in rendered if np.isfinite(x["label"]["rms_dbfs"]) and np.isfinite(x["response"]["rms_dbfs"])
+        ])
+        centroid_difference = np.mean([abs(x["label"]["spectral_centroid"] - x["response"]["spectral_centroid"]) for x in rendered])
+        typer.echo(f"Mean track overlap: {overlap:.3f}")
+        typer.echo(f"Mean RMS difference: {rms_difference:.2f} dB")
+        typer.echo(f"Mean spectral centroid difference: {centroid_difference:.1f} Hz")
 
 
 if __name__ == "__main__":
-    typer.run(play_random_mix)
+    cli()
@@ -0,0 +1,51 @@
+import os
+from pathlib import Path
+
+from parallel_evaluation import iter_evaluations
+
+
+class FakeModel:
+    """
+    Answers every prompt with its content. A worker kills itself on the prompt "crash", and on "crash once"
+    only the first time, which is recorded in marker_path.
+    """
+
+    def __init__(self, marker_path: str):
+        self.marker_path = Path(marker_path)
+
+    def create_chat_completion(self, messages, max_tokens):
+        content = messages[-1]["content"]
+        if content == "crash" or (content == "crash once" and not self.marker_path.exists()):
+            self.marker_path.touch()
+            os._exit(1)
+        return dict(choices=[dict(message=dict(content=content))], usage=dict(total_tokens=1))
+
+
+def load_fake_model(marker_path: str, threads: int):
+    return FakeModel(marker_path)
+
+
+def sample(content: str) -> list[dict]:
+    return [dict(role="user", content=content), dict(role="assistant", content="label")]
+
+
+def evaluate(tmp_path, contents: list[str]) -> dict[str, dict]:
+    samples = [sample(content) for content in contents]
+    model_args = dict(marker_path=str(tmp_path / "crashed"))
+    evaluations = list(iter_evaluations(samples, model_args, workers=2, max_in_flight=4, loader=load_fake_model))
+    assert len(evaluations) == len(samples)
+    return {x["sample"][0]["content"]: x for x in evaluations}
+
+
+def test_retries_the_samples_of_a_killed_worker(tmp_path):
+    contents = [f"prompt {i}" for i in range(6)] + ["crash once"] + [f"prompt {i}" for i in range(6, 12)]
+    evaluations = evaluate(tmp_path, contents)
+    assert (tmp_path / "crashed").exists()
+    assert all("error" not in x and x["response"] == content for content, x in evaluations.items())
+
+
+def test_fails_only_the_sample_that_keeps_killing_its_worker(tmp_path):
+    contents = [f"prompt {i}" for i in range(6)] + ["crash"] + [f"prompt {i}" for i in range(6, 12)]
+    evaluations = evaluate(tmp_path, contents)
+    assert "BrokenProcessPool" in evaluations["crash"]["error"]
+    assert all("error" not in x and x["response"] == content for content, x in evaluations.items() if content != "crash")
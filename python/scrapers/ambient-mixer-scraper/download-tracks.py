@@ -1,11 +1,19 @@
 from typing import Annotated, AsyncGenerator, Iterable
 import typer
 import httpx
-from dataclasses import dataclass
+from dataclasses import dataclass, asdict
 import asyncio
+import hashlib
+import importlib.util
+import time
 from pathlib import Path
 from json import load, dump
-from rich.progress import track as track_progress
+from rich.progress import Progress, TextColumn
+
+from download_engine import DownloadEngine, RetryPolicy
+
+# Seconds between manifest saves during a sync, so an interrupted run keeps the tracks it already downloaded
+MANIFEST_SAVE_INTERVAL = 5.0
 
 @dataclass
 class Track:
@@ -19,26 +27,113 @@ class ScrapedTrack:
     name_audio: str
     url_audio: str
 
-async def download_file(client: httpx.AsyncClient, output_path: Path, src: str):
-    global semaphore
-    async with semaphore:
-        reponse = await client.get(src, timeout=10.0)
-    reponse.raise_for_status()
-    with open(output_path, "wb") as f:
-        f.write(reponse.content)
+@dataclass
+class ManifestEntry:
+    id: str
+    url: str
+    size: int
+    etag: str | None
+    last_modified: str | None
+    sha256: str
+
+# Bytes read from a response before they are written to disk
+CHUNK_SIZE = 64 * 1024
+
+
+def content_range_start(response: httpx.Response) -> int | None:
+    # Content-Range: bytes <start>-<end>/<size>
+    unit, _, byte_range = response.headers.get("content-range", "").partition(" ")
+    start = byte_range.split("-")[0]
+    return int(start) if unit == "bytes" and start.isdigit() else None
+
+
+def file_sha256(path: Path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest
+
+
+async def download_file(engine: DownloadEngine, output_path: Path, src: str, cached: ManifestEntry | None = None) -> dict | None:
+    """
+    Download src to output_path, returning its size, sha256, ETag and Last-Modified header.
+
+    With a cached manifest entry for the file, the request is conditional on the ETag and Last-Modified date
+    recorded in it, and None is returned if the server reports the file as not modified.
+    """
+    partial_path = output_path.with_name(output_path.name + ".part")
+    # A 416 to a range request starts over with a request for the whole file
+    while True:
+        offset = partial_path.stat().st_size if partial_path.exists() else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        if cached is not None and not offset:
+            if cached.etag:
+                headers["If-None-Match"] = cached.etag
+            if cached.last_modified:
+                headers["If-Modified-Since"] = cached.last_modified
+        # The host slot is held until the body is on disk, so it bounds the transfers and not just the requests
+        async with engine.stream("GET", src, headers=headers) as reponse:
+            if reponse.status_code == 304:
+                return None
+            if offset and reponse.status_code == 416:
+                # The partial file is complete or does not match the remote file anymore
+                partial_path.unlink()
+                continue
+            reponse.raise_for_status()
+            if reponse.status_code == 206 and content_range_start(reponse) != offset:
+                partial_path.unlink()
+                raise httpx.HTTPStatusError("Unexpected content range", request=reponse.request, response=reponse)
+            # Servers that ignore the range send the whole file
+            resumed = reponse.status_code == 206
+            digest = await asyncio.to_thread(file_sha256, partial_path) if resumed else hashlib.sha256()
+            size = offset if resumed else 0
+            f = await asyncio.to_thread(open, partial_path, "ab" if resumed else "wb")
+            try:
+                async for chunk in reponse.aiter_bytes(CHUNK_SIZE):
+                    digest.update(chunk)
+                    size += len(chunk)
+                    await asyncio.to_thread(f.write, chunk)
+            finally:
+                await asyncio.to_thread(f.close)
+        await asyncio.to_thread(partial_path.replace, output_path)
+        return dict(
+            size=size,
+            sha256=digest.hexdigest(),
+            etag=reponse.headers.get("etag"),
+            last_modified=reponse.headers.get("last-modified"),
+        )
+
+
+async def is_valid(output_path: Path, entry: ManifestEntry, verify: bool) -> bool:
+    if not output_path.exists() or output_path.stat().st_size != entry.size:
+        return False
+    return not verify or (await asyncio.to_thread(file_sha256, output_path)).hexdigest() == entry.sha256
 
 
-async def download_track(client: httpx.AsyncClient, output_dir: Path, web_root: str, scraped_track: ScrapedTrack) -> tuple[ScrapedTrack, Track | None]:
+async def download_track(engine: DownloadEngine, output_dir: Path, web_root: str, scraped_track: ScrapedTrack, cached: ManifestEntry | None = None, revalidate: bool = False, verify: bool = False) -> tuple[ScrapedTrack, Track | None, ManifestEntry | None]:
     output_path = output_dir / f"{scraped_track.id_audio}.mp3"
     web_path = web_root + scraped_track.id_audio + ".mp3"
-    try:
-        await download_file(client, output_path, scraped_track.url_audio)
-    except (httpx.HTTPStatusError, TypeError) as e:
-        return scraped_track, None
-    return scraped_track, Track(
+    resolved_track = Track(
         name=scraped_track.name_audio,
         src=web_path,
     )
+    # Files recorded in the manifest for the same URL are only requested again if they are damaged or revalidated
+    if cached is not None and (cached.url != scraped_track.url_audio or not await is_valid(output_path, cached, verify)):
+        cached = None
+    if cached is not None and not revalidate:
+        return scraped_track, resolved_track, cached
+
+    try:
+        # Retries resume from the .part file of the failed attempt
+        info = await engine.retry(lambda: download_file(engine, output_path, scraped_track.url_audio, cached))
+    except (httpx.HTTPStatusError, httpx.TransportError, TypeError, OSError) as e:
+        # Transfers that failed on every attempt keep their .part file and resume on the next run. A file that
+        # could not be revalidated is still intact and kept.
+        return scraped_track, resolved_track if cached is not None else None, cached
+    if info is None:
+        return scraped_track, resolved_track, cached
+    return scraped_track, resolved_track, ManifestEntry(id=scraped_track.id_audio, url=scraped_track.url_audio, **info)
 
 def parse_tracks_file(tracks_file: Path) -> list[ScrapedTrack]:
     tracks = []
@@ -53,24 +148,76 @@ def parse_tracks_file(tracks_file: Path) -> list[ScrapedTrack]:
         ))
     return tracks
 
-async def run_cli(concurrent_requests: int, tracks_file: Path, output_dir: Path, web_root: str):
+def load_manifest(manifest_path: Path) -> dict[str, ManifestEntry]:
+    if not manifest_path.exists():
+        return {}
+    with open(manifest_path, "r") as f:
+        return {entry["id"]: ManifestEntry(**entry) for entry in load(f)}
+
+
+def save_manifest(manifest_path: Path, manifest: dict[str, ManifestEntry]):
+    # Replace the manifest atomically so an interrupted run never leaves it truncated
+    partial_path = manifest_path.with_name(manifest_path.name + ".part")
+    with open(partial_path, "w") as f:
+        dump([asdict(entry) for entry in manifest.values()], f)
+    partial_path.replace(manifest_path)
+
+
+async def update_stats(progress: Progress, task, engine: DownloadEngine, interval: float = 1.0):
+    while True:
+        await asyncio.sleep(interval)
+        progress.update(task, stats=engine.metrics.stats_line())
+
+
+async def run_cli(concurrent_requests: int, tracks_file: Path, output_dir: Path, web_root: str, sync: bool = False, revalidate: bool = False, verify: bool = False, retries: int = 5, timeout: float = 10.0, http2: bool = False, report_file: Path | None = None, live_stats: bool = False):
     # Create the output directory if it does not exist
     output_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = output_dir / "manifest.json"
+    manifest = load_manifest(manifest_path) if sync else {}
 
     # Read the tracks
     scraped_tracks = parse_tracks_file(tracks_file)
     # Download the tracks. Show progress as rich progress
-    async with httpx.AsyncClient() as client:
-        global semaphore
-        semaphore = asyncio.Semaphore(concurrent_requests)
-        tracks = []
-        tasks = [download_track(client, output_dir, web_root, scraped_track) for scraped_track in scraped_tracks]
-        for track in track_progress(asyncio.as_completed(tasks), description="Downloading tracks...", total=len(scraped_tracks)):
-            scraped_track, resolved_track = await track
-            if resolved_track is not None:
-                tracks.append(resolved_track)
-            else:
-                typer.echo(f"Failed to download {scraped_track.name_audio} (ID: {scraped_track.id_audio})", err=True)
+    try:
+        async with DownloadEngine(concurrent_requests, retry=RetryPolicy(attempts=retries + 1), timeout=timeout, http2=http2) as engine:
+            tracks = []
+            tasks = [
+                download_track(engine, output_dir, web_root, scraped_track, manifest.get(scraped_track.id_audio), revalidate, verify)
+                for scraped_track in scraped_tracks
+            ]
+            last_save = time.monotonic()
+            with Progress(*Progress.get_default_columns(), TextColumn("{task.fields[stats]}")) as progress:
+                task = progress.add_task("Downloading tracks...", total=len(scraped_tracks), stats="")
+                stats_updater = asyncio.create_task(update_stats(progress, task, engine)) if live_stats else None
+                try:
+                    for track in asyncio.as_completed(tasks):
+                        scraped_track, resolved_track, entry = await track
+                        progress.advance(task)
+                        if resolved_track is not None:
+                            tracks.append(resolved_track)
+                            manifest[scraped_track.id_audio] = entry
+                        else:
+                            progress.console.print(f"Failed to download {scraped_track.name_audio} (ID: {scraped_track.id_audio})", style="red")
+                        if sync and time.monotonic() - last_save >= MANIFEST_SAVE_INTERVAL:
+                            save_manifest(manifest_path, manifest)
+                            last_save = time.monotonic()
+                finally:
+                    if stats_updater is not None:
+                        stats_updater.cancel()
+    finally:
+        # Also record the finished tracks of a run that fails or is interrupted
+        if sync:
+            save_manifest(manifest_path, manifest)
+
+    report = engine.metrics.report(engine.limiters)
+    summary = report["summary"]
+    typer.echo(
+        f"{summary['requests']} requests ({summary['retries']} retries), {summary['bytes'] / 1e6:.1f} MB "
+        f"in {report['elapsed']:.1f} s at {summary['bytes_per_second'] / 1e6:.2f} MB/s"
+    )
+    if report_file is not None:
+        with open(report_file, "w") as f:
+            dump(report, f, indent=2)
 
     # Serialize the tracks to a file
     with open(output_dir / "tracks.json", "w") as f:
@@ -79,8 +226,19 @@ async def run_cli(concurrent_requests: int, tracks_file: Path, output_dir: Path,
 def cli(tracks: Annotated[Path, typer.Argument(dir_okay=False, exists=True)], 
         output_dir: Annotated[Path, typer.Argument(dir_okay=True, file_okay=False)],
         web_root: str,
-        concurrent_requests: int = 10):
-        asyncio.run(run_cli(concurrent_requests, tracks, output_dir, web_root))
+        concurrent_requests: int = 10,
+        sync: Annotated[bool, typer.Option(help="Skip tracks recorded in the manifest of the output directory")] = False,
+        revalidate: Annotated[bool, typer.Option(help="Send conditional requests for tracks in the manifest")] = False,
+        verify: Annotated[bool, typer.Option(help="Check the sha256 of tracks in the manifest")] = False,
+        retries: int = 5,
+        timeout: float = 10.0,
+        http2: Annotated[bool, typer.Option(help="Multiplex requests over HTTP/2 where the host supports it")] = False,
+        report: Annotated[Path | None, typer.Option(help="Write per-request metrics and latency histograms as JSON")] = None,
+        live_stats: Annotated[bool, typer.Option(help="Show throughput, latency and in-flight requests while downloading")] = False):
+        if http2 and importlib.util.find_spec("h2") is None:
+            typer.echo("HTTP/2 requires the h2 package, falling back to HTTP/1.1", err=True)
+            http2 = False
+        asyncio.run(run_cli(concurrent_requests, tracks, output_dir, web_root, sync, revalidate, verify, retries, timeout, http2, report, live_stats))
 
 if __name__ == "__main__":
     typer.run(cli)
@@ -0,0 +1,180 @@
+from typing import Awaitable, Callable, TypeVar
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+import httpx
+
+from download_metrics import DownloadMetrics, RequestMetrics
+
+T = TypeVar("T")
+
+# Attempt of the retry loop the current task is in, recorded with the metrics of its requests
+_attempt: ContextVar[int] = ContextVar("attempt", default=0)
+
+# Statuses that signal overload or a transient server error rather than a bad request
+RETRY_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    attempts: int = 5
+    base_delay: float = 0.5
+    max_delay: float = 30.0
+
+    def delay(self, attempt: int, retry_after: float | None = None) -> float:
+        # Full jitter: a random delay up to the exponential backoff, so clients that failed together spread out
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        return max(backoff, min(retry_after, self.max_delay)) if retry_after is not None else backoff
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in RETRY_STATUS
+    return isinstance(error, (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError))
+
+
+def retry_after(error: Exception) -> float | None:
+    if not isinstance(error, httpx.HTTPStatusError) or "retry-after" not in error.response.headers:
+        return None
+    value = error.response.headers["retry-after"]
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class HostLimiter:
+    """
+    Concurrency limit of one host, adjusted with additive increase and multiplicative decrease (AIMD).
+
+    Every request that gets a response without queueing at the server grows the limit by 1 / limit, about one
+    slot per round of requests. A retryable error, a timeout or a response latency (smoothed) above
+    latency_factor times the lowest latency seen halves the limit, at most once per round trip so that the
+    failures of requests that were in flight together count as one congestion event.
+    """
+
+    def __init__(self, initial: int, maximum: int, minimum: int = 1, latency_factor: float = 3.0):
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_factor = latency_factor
+        self.in_flight = 0
+        self.min_latency = None
+        self.latency = None
+        self.last_decrease = 0.0
+        self.condition = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        return self
+
+    async def __aexit__(self, *args):
+        async with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def success(self, latency: float):
+        self.min_latency = latency if self.min_latency is None else min(self.min_latency, latency)
+        self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+        if self.latency > self.latency_factor * self.min_latency:
+            self.failure()
+        else:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def failure(self):
+        now = time.monotonic()
+        if now - self.last_decrease < (self.latency or 1.0):
+            return
+        self.last_decrease = now
+        self.limit = max(self.minimum, self.limit / 2)
+
+
+class DownloadEngine:
+    """
+    Shared HTTP client with adaptive per-host concurrency and retries.
+
+    At most concurrency requests are in flight overall, matching the connection pool of the client, and every
+    host gets its own HostLimiter that starts at initial_concurrency. With http2, hosts that negotiate HTTP/2
+    multiplex their requests over one connection, and other hosts fall back to HTTP/1.1. This requires the
+    h2 package. The metrics of every request are collected in metrics.
+    """
+
+    def __init__(self, concurrency: int = 10, initial_concurrency: int | None = None, retry: RetryPolicy | None = None, timeout: float = 10.0, http2: bool = False, **client_args):
+        self.concurrency = concurrency
+        self.initial_concurrency = initial_concurrency or max(1, concurrency // 2)
+        self.retry_policy = retry or RetryPolicy()
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.limiters: dict[str, HostLimiter] = {}
+        self.metrics = DownloadMetrics()
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        self.client = httpx.AsyncClient(limits=limits, timeout=timeout, http2=http2, **client_args)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.client.aclose()
+
+    def limiter(self, url: str) -> HostLimiter:
+        host = httpx.URL(url).host
+        if host not in self.limiters:
+            self.limiters[host] = HostLimiter(self.initial_concurrency, self.concurrency)
+        return self.limiters[host]
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, headers: dict | None = None):
+        """
+        Send a request and yield the streamed response, holding a slot of the host until the body is consumed.
+        """
+        limiter = self.limiter(url)
+        async with limiter, self.semaphore:
+            start = time.monotonic()
+            key = object()
+            response, ttfb, error = None, None, None
+            self.metrics.started(key, None)
+            try:
+                async with self.client.stream(method, url, headers=headers) as response:
+                    ttfb = time.monotonic() - start
+                    self.metrics.started(key, response)
+                    if response.status_code in RETRY_STATUS:
+                        limiter.failure()
+                    else:
+                        limiter.success(ttfb)
+                    yield response
+            except Exception as e:
+                if isinstance(e, (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError)):
+                    limiter.failure()
+                error = type(e).__name__
+                raise
+            finally:
+                self.metrics.finished(key, RequestMetrics(
+                    url=url,
+                    host=httpx.URL(url).host,
+                    status=response.status_code if response is not None else None,
+                    bytes=response.num_bytes_downloaded if response is not None else 0,
+                    ttfb=ttfb,
+                    duration=time.monotonic() - start,
+                    attempt=_attempt.get(),
+                    error=error,
+                ))
+
+    async def retry(self, func: Callable[[], Awaitable[T]]) -> T:
+        """
+        Await func() until it succeeds, backing off after retryable errors. The last error is raised.
+        """
+        for attempt in range(self.retry_policy.attempts):
+            _attempt.set(attempt)
+            try:
+                return await func()
+            except Exception as e:
+                if not is_retryable(e) or attempt == self.retry_policy.attempts - 1:
+                    raise
+                await asyncio.sleep(self.retry_policy.delay(attempt, retry_after(e)))
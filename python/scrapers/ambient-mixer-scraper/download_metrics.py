@@ -0,0 +1,125 @@
+from collections import Counter, deque
+from dataclasses import asdict, dataclass
+import math
+import time
+
+# Upper bounds of the latency histogram buckets in seconds, the last bucket is open
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Upper bounds of the throughput histogram buckets in bytes per second
+THROUGHPUT_BUCKETS = (64e3, 256e3, 1e6, 4e6, 16e6, 64e6)
+# Completed requests the live latency percentiles are taken over
+LIVE_WINDOW = 200
+
+
+@dataclass
+class RequestMetrics:
+    url: str
+    host: str
+    status: int | None
+    bytes: int
+    ttfb: float | None
+    duration: float
+    attempt: int
+    error: str | None = None
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.bytes / self.duration if self.duration > 0 else 0.0
+
+
+def percentile(values: list[float], q: float) -> float | None:
+    if not values:
+        return None
+    values = sorted(values)
+    position = q * (len(values) - 1)
+    lower, upper = math.floor(position), math.ceil(position)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def histogram(values: list[float], buckets: tuple[float, ...]) -> dict[str, int]:
+    counts = Counter(next((f"<={bound:g}" for bound in buckets if value <= bound), f">{buckets[-1]:g}") for value in values)
+    return {label: counts[label] for label in [f"<={bound:g}" for bound in buckets] + [f">{buckets[-1]:g}"]}
+
+
+def distribution(values: list[float], buckets: tuple[float, ...]) -> dict:
+    return dict(
+        p50=percentile(values, 0.5),
+        p95=percentile(values, 0.95),
+        p99=percentile(values, 0.99),
+        max=max(values, default=None),
+        histogram=histogram(values, buckets),
+    )
+
+
+class DownloadMetrics:
+    """
+    Collects the metrics of every request of a download run.
+
+    Bytes of requests that are still transferring count towards the live throughput, so the stats line does
+    not stall while large files download.
+    """
+
+    def __init__(self):
+        self.start = time.monotonic()
+        self.requests: list[RequestMetrics] = []
+        self.active = {}
+        self.recent_ttfb = deque(maxlen=LIVE_WINDOW)
+        self.completed_bytes = 0
+        self.last_sample = (self.start, 0)
+
+    @property
+    def in_flight(self) -> int:
+        return len(self.active)
+
+    def started(self, key, response):
+        self.active[key] = response
+
+    def finished(self, key, request_metrics: RequestMetrics):
+        self.active.pop(key, None)
+        self.requests.append(request_metrics)
+        self.completed_bytes += request_metrics.bytes
+        if request_metrics.ttfb is not None:
+            self.recent_ttfb.append(request_metrics.ttfb)
+
+    def transferred_bytes(self) -> int:
+        return self.completed_bytes + sum(response.num_bytes_downloaded for response in self.active.values() if response is not None)
+
+    def stats_line(self) -> str:
+        now, transferred = time.monotonic(), self.transferred_bytes()
+        last_time, last_transferred = self.last_sample
+        self.last_sample = (now, transferred)
+        rate = (transferred - last_transferred) / (now - last_time) if now > last_time else 0.0
+        ttfb = list(self.recent_ttfb)
+        p50, p95 = percentile(ttfb, 0.5), percentile(ttfb, 0.95)
+        latency = f"p50 {p50 * 1000:.0f} ms, p95 {p95 * 1000:.0f} ms" if ttfb else "p50 -, p95 -"
+        return f"{rate / 1e6:.2f} MB/s, {latency}, {self.in_flight} in flight"
+
+    def report(self, limiters: dict | None = None) -> dict:
+        elapsed = time.monotonic() - self.start
+        hosts = {}
+        for request in self.requests:
+            hosts.setdefault(request.host, []).append(request)
+
+        def summarize(requests: list[RequestMetrics], elapsed: float) -> dict:
+            succeeded = [x for x in requests if x.error is None and x.status is not None and x.status < 400]
+            total_bytes = sum(x.bytes for x in requests)
+            return dict(
+                requests=len(requests),
+                succeeded=len(succeeded),
+                retries=sum(1 for x in requests if x.attempt > 0),
+                errors=dict(Counter(x.error for x in requests if x.error is not None)),
+                status=dict(Counter(str(x.status) for x in requests if x.status is not None)),
+                bytes=total_bytes,
+                bytes_per_second=total_bytes / elapsed if elapsed > 0 else 0.0,
+                ttfb=distribution([x.ttfb for x in requests if x.ttfb is not None], LATENCY_BUCKETS),
+                duration=distribution([x.duration for x in succeeded], LATENCY_BUCKETS),
+                request_bytes_per_second=distribution([x.bytes_per_second for x in succeeded if x.bytes], THROUGHPUT_BUCKETS),
+            )
+
+        report = dict(elapsed=elapsed, summary=summarize(self.requests, elapsed))
+        report["hosts"] = {host: summarize(requests, elapsed) for host, requests in hosts.items()}
+        for host, limiter in (limiters or {}).items():
+            if host in report["hosts"]:
+                report["hosts"][host]["concurrency_limit"] = limiter.limit
+        report["requests"] = [asdict(x) for x in self.requests]
+        return report
@@ -0,0 +1,241 @@
+import asyncio
+import hashlib
+import importlib.util
+from pathlib import Path
+
+import httpx
+import pytest
+
+import download_engine
+from download_engine import DownloadEngine, HostLimiter, RetryPolicy
+
+URL = "https://cdn.example.com/audio/track.mp3"
+CONTENT = bytes(range(256)) * 1024
+
+# download-tracks.py is a script, so it is loaded from its path
+_spec = importlib.util.spec_from_file_location("download_tracks", Path(__file__).with_name("download-tracks.py"))
+download_tracks = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(download_tracks)
+
+
+@pytest.fixture
+def delays(monkeypatch):
+    recorded = []
+
+    async def sleep(delay):
+        recorded.append(delay)
+
+    monkeypatch.setattr(download_engine.asyncio, "sleep", sleep)
+    return recorded
+
+
+def run(handler, func, **engine_args):
+    async def main():
+        async with DownloadEngine(transport=httpx.MockTransport(handler), **engine_args) as engine:
+            return engine, await func(engine)
+
+    return asyncio.run(main())
+
+
+async def fetch(engine):
+    async def attempt():
+        async with engine.stream("GET", URL) as response:
+            response.raise_for_status()
+            return await response.aread()
+
+    return await engine.retry(attempt)
+
+
+def test_retries_transient_status_with_backoff(delays):
+    statuses = iter([503, 502, 200])
+
+    def handler(request):
+        return httpx.Response(next(statuses), content=CONTENT)
+
+    engine, body = run(handler, fetch, retry=RetryPolicy(attempts=5, base_delay=0.5, max_delay=30.0))
+    assert body == CONTENT
+    assert [x.attempt for x in engine.metrics.requests] == [0, 1, 2]
+    assert [x.status for x in engine.metrics.requests] == [503, 502, 200]
+    # Full jitter draws every delay up to the exponential backoff of its attempt
+    assert len(delays) == 2
+    assert all(0 <= delay <= 0.5 * 2 ** attempt for attempt, delay in enumerate(delays))
+
+
+def test_retry_after_is_a_lower_bound_of_the_delay(delays):
+    statuses = iter([429, 200])
+
+    def handler(request):
+        return httpx.Response(next(statuses), headers={"retry-after": "7"})
+
+    run(handler, fetch, retry=RetryPolicy(base_delay=0.01))
+    assert delays == [7.0]
+
+
+def test_gives_up_after_the_last_attempt(delays):
+    def handler(request):
+        return httpx.Response(503)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        run(handler, fetch, retry=RetryPolicy(attempts=3))
+    assert len(delays) == 2
+
+
+def test_does_not_retry_client_errors(delays):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(404)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        run(handler, fetch)
+    assert len(calls) == 1 and delays == []
+
+
+def test_retries_network_errors(delays):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            raise httpx.ConnectError("connection refused", request=request)
+        return httpx.Response(200, content=CONTENT)
+
+    engine, body = run(handler, fetch)
+    assert body == CONTENT
+    assert [x.error for x in engine.metrics.requests] == ["ConnectError", None]
+
+
+def test_limiter_grows_additively_and_halves_on_congestion(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(download_engine.time, "monotonic", lambda: now[0])
+    limiter = HostLimiter(initial=4, maximum=8)
+
+    limiter.success(0.1)
+    assert limiter.limit == pytest.approx(4.25)
+
+    limiter.failure()
+    assert limiter.limit == pytest.approx(2.125)
+    # Failures of requests that were in flight together count as one congestion event
+    limiter.failure()
+    assert limiter.limit == pytest.approx(2.125)
+    now[0] += 1.0
+    limiter.failure()
+    assert limiter.limit == pytest.approx(1.0625)
+    now[0] += 1.0
+    limiter.failure()
+    assert limiter.limit == 1
+
+    for _ in range(100):
+        limiter.success(0.1)
+    assert limiter.limit == 8
+
+
+def test_limiter_halves_on_queueing_latency(monkeypatch):
+    monkeypatch.setattr(download_engine.time, "monotonic", lambda: 100.0)
+    limiter = HostLimiter(initial=8, maximum=8, latency_factor=3.0)
+    limiter.success(0.1)
+    # The smoothed latency exceeds three times the lowest latency seen
+    limiter.success(2.0)
+    assert limiter.limit == 4
+
+
+def test_engine_backs_off_the_host_on_overload(delays):
+    statuses = iter([503, 200])
+
+    def handler(request):
+        return httpx.Response(next(statuses))
+
+    engine, _ = run(handler, fetch, concurrency=8, initial_concurrency=8)
+    assert engine.limiter(URL).limit < 8
+
+
+def test_resumes_partial_download_with_range(tmp_path):
+    output_path = tmp_path / "track.mp3"
+    partial_path = tmp_path / "track.mp3.part"
+    partial_path.write_bytes(CONTENT[:1000])
+    ranges = []
+
+    def handler(request):
+        ranges.append(request.headers.get("range"))
+        start = int(request.headers["range"].removeprefix("bytes=").rstrip("-"))
+        return httpx.Response(
+            206,
+            headers={"content-range": f"bytes {start}-{len(CONTENT) - 1}/{len(CONTENT)}", "etag": '"v1"'},
+            content=CONTENT[start:],
+        )
+
+    _, info = run(handler, lambda engine: download_tracks.download_file(engine, output_path, URL))
+    assert ranges == ["bytes=1000-"]
+    assert output_path.read_bytes() == CONTENT and not partial_path.exists()
+    assert info["size"] == len(CONTENT)
+    assert info["sha256"] == hashlib.sha256(CONTENT).hexdigest()
+    assert info["etag"] == '"v1"'
+
+
+def test_restarts_when_the_server_ignores_the_range(tmp_path):
+    output_path = tmp_path / "track.mp3"
+    (tmp_path / "track.mp3.part").write_bytes(b"stale partial data")
+
+    def handler(request):
+        return httpx.Response(200, content=CONTENT)
+
+    _, info = run(handler, lambda engine: download_tracks.download_file(engine, output_path, URL))
+    assert output_path.read_bytes() == CONTENT
+    assert info["sha256"] == hashlib.sha256(CONTENT).hexdigest()
+
+
+def test_retry_resumes_after_a_dropped_transfer(tmp_path, delays):
+    output_path = tmp_path / "track.mp3"
+    requests = []
+
+    # Only whole chunks reach the .part file, so the transfer drops after the first chunk and a half
+    dropped_at = download_tracks.CHUNK_SIZE * 3 // 2
+
+    class DroppedStream(httpx.AsyncByteStream):
+        async def __aiter__(self):
+            yield CONTENT[:dropped_at]
+            raise httpx.ReadError("connection reset")
+
+    def handler(request):
+        requests.append(request.headers.get("range"))
+        if len(requests) == 1:
+            return httpx.Response(200, stream=DroppedStream())
+        start = int(request.headers["range"].removeprefix("bytes=").rstrip("-"))
+        return httpx.Response(
+            206, headers={"content-range": f"bytes {start}-{len(CONTENT) - 1}/{len(CONTENT)}"}, content=CONTENT[start:]
+        )
+
+    _, info = run(handler, lambda engine: engine.retry(lambda: download_tracks.download_file(engine, output_path, URL)))
+    assert requests == [None, f"bytes={download_tracks.CHUNK_SIZE}-"]
+    assert output_path.read_bytes() == CONTENT
+    assert info["sha256"] == hashlib.sha256(CONTENT).hexdigest()
+
+
+def test_starts_over_when_the_range_is_not_satisfiable(tmp_path):
+    output_path = tmp_path / "track.mp3"
+    stale = CONTENT + b"trailing data of an older version"
+    (tmp_path / "track.mp3.part").write_bytes(stale)
+    ranges = []
+
+    def handler(request):
+        ranges.append(request.headers.get("range"))
+        if "range" in request.headers:
+            return httpx.Response(416, headers={"content-range": f"bytes */{len(CONTENT)}"})
+        return httpx.Response(200, content=CONTENT)
+
+    _, info = run(handler, lambda engine: download_tracks.download_file(engine, output_path, URL))
+    assert ranges == [f"bytes={len(stale)}-", None]
+    assert output_path.read_bytes() == CONTENT
+    assert info["sha256"] == hashlib.sha256(CONTENT).hexdigest()
+
+
+def test_write_errors_only_fail_their_track(tmp_path):
+    scraped_track = download_tracks.ScrapedTrack(id_audio="1", name_audio="Rain", url_audio=URL)
+
+    def handler(request):
+        return httpx.Response(200, content=CONTENT)
+
+    # The .part file cannot be created in a missing directory
+    _, (_, resolved_track, entry) = run(handler, lambda engine: download_tracks.download_track(engine, tmp_path / "missing", "/audio/", scraped_track))
+    assert resolved_track is None and entry is None
@@ -0,0 +1,179 @@
+from typing import Annotated
+import typer
+import httpx
+from dataclasses import dataclass, asdict
+import asyncio
+import random
+from pathlib import Path
+from json import dump
+from rich.progress import Progress
+
+CATEGORIES = ["meditation", "nature", "rain", "music", "ocean"]
+API_URL = "https://calmyleon.com/serve.php"
+CDN_URL = "https://cdn.calmyleon.com/Data/"
+# Every sound is served as two files, <stem>a.ogg and <stem>b.ogg
+VARIANTS = ("a", "b")
+# Bytes read from a response before they are written to disk
+CHUNK_SIZE = 64 * 1024
+# Statuses that signal overload or a transient server error, polls that get them are retried
+RETRY_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+@dataclass(frozen=True)
+class Sound:
+    code: str
+    stem: str
+    category: str
+
+
+@dataclass
+class CategoryState:
+    polls: int = 0
+    misses: int = 0
+    sounds: int = 0
+
+
+async def download_file(client: httpx.AsyncClient, output_path: Path, url: str):
+    partial_path = output_path.with_name(output_path.name + ".part")
+    async with client.stream("GET", url) as response:
+        response.raise_for_status()
+        f = await asyncio.to_thread(open, partial_path, "wb")
+        try:
+            async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                await asyncio.to_thread(f.write, chunk)
+        finally:
+            await asyncio.to_thread(f.close)
+    await asyncio.to_thread(partial_path.replace, output_path)
+
+
+def is_transient(error: Exception) -> bool:
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in RETRY_STATUS
+    return isinstance(error, httpx.TransportError)
+
+
+async def poll(client: httpx.AsyncClient, api_url: str, category: str, slots: asyncio.Semaphore, retries: int, backoff: float) -> Sound:
+    # Transient errors are retried after a random delay up to the exponential backoff, so they are not taken
+    # for a poll without a new sound. The slot is only held during the request, not during the backoff.
+    for attempt in range(retries + 1):
+        try:
+            async with slots:
+                response = await client.get(api_url, params={"c": category})
+            response.raise_for_status()
+            served = response.json()
+            return Sound(code=served["code"], stem=str(served["stem"]), category=category)
+        except httpx.HTTPError as e:
+            if not is_transient(e) or attempt == retries:
+                raise
+            await asyncio.sleep(random.uniform(0, backoff * 2 ** attempt))
+
+
+async def poll_category(client: httpx.AsyncClient, api_url: str, category: str, state: CategoryState, seen: set[tuple[str, str]], sounds: list[Sound], queue: asyncio.Queue, slots: asyncio.Semaphore, max_polls: int, patience: int, retries: int, backoff: float, progress: Progress, poll_task, download_task):
+    # Several pollers share the state of a category, which stops once patience polls in a row found no new sound
+    while state.polls < max_polls and state.misses < patience:
+        state.polls += 1
+        try:
+            sound = await poll(client, api_url, category, slots, retries, backoff)
+        except (httpx.HTTPError, ValueError, KeyError, TypeError) as e:
+            # A poll that still fails after its retries counts as a miss, so a category stops if the API is down
+            progress.console.print(f"Failed to poll {category}: {e}", style="red")
+            state.misses += 1
+            continue
+        finally:
+            progress.advance(poll_task)
+
+        if (sound.code, sound.stem) in seen:
+            state.misses += 1
+            continue
+        seen.add((sound.code, sound.stem))
+        sounds.append(sound)
+        state.misses = 0
+        state.sounds += 1
+        progress.update(download_task, total=len(sounds))
+        # Blocks while the download queue is full, so polling never runs far ahead of the downloads
+        await queue.put(sound)
+
+
+async def download_worker(client: httpx.AsyncClient, cdn_url: str, output_dir: Path, queue: asyncio.Queue, failed: list[str], progress: Progress, download_task):
+    while True:
+        sound = await queue.get()
+        try:
+            sound_dir = output_dir / sound.code
+            sound_dir.mkdir(parents=True, exist_ok=True)
+            for variant in VARIANTS:
+                file_name = f"{sound.stem}{variant}.ogg"
+                url = f"{cdn_url}{sound.code}/{file_name}"
+                output_path = sound_dir / f"{sound.code}_{file_name}"
+                if output_path.exists():
+                    continue
+                try:
+                    await download_file(client, output_path, url)
+                except (httpx.HTTPError, OSError) as e:
+                    progress.console.print(f"Failed to download {url}: {e}", style="red")
+                    failed.append(url)
+        except Exception as e:
+            # A worker that dies stops draining the queue, and the pollers would block on it forever
+            progress.console.print(f"Failed to download {sound.code} {sound.stem}: {e}", style="red")
+            failed.append(f"{cdn_url}{sound.code}/{sound.stem}")
+        finally:
+            progress.advance(download_task)
+            queue.task_done()
+
+
+async def run_cli(output_dir: Path, categories: list[str], api_url: str, cdn_url: str, max_polls: int, patience: int, poll_retries: int, poll_backoff: float, concurrent_polls: int, concurrent_downloads: int, queue_size: int, timeout: float, transport: httpx.AsyncBaseTransport | None = None):
+    output_dir.mkdir(parents=True, exist_ok=True)
+    cdn_url = cdn_url.rstrip("/") + "/"
+    seen = set()
+    sounds = []
+    failed = []
+    states = {category: CategoryState() for category in categories}
+    queue = asyncio.Queue(maxsize=queue_size)
+    # Every category gets a poller even if there are more categories than concurrent polls, so the polls in
+    # flight are bounded by a shared semaphore rather than by the number of pollers
+    slots = asyncio.Semaphore(concurrent_polls)
+
+    limits = httpx.Limits(max_connections=concurrent_polls + concurrent_downloads)
+    async with httpx.AsyncClient(limits=limits, timeout=timeout, transport=transport) as client:
+        with Progress() as progress:
+            poll_task = progress.add_task("Polling sounds...", total=max_polls * len(categories))
+            # The download total grows as sounds are discovered
+            download_task = progress.add_task("Downloading sounds...", total=0)
+            downloaders = [
+                asyncio.create_task(download_worker(client, cdn_url, output_dir, queue, failed, progress, download_task))
+                for _ in range(concurrent_downloads)
+            ]
+            pollers_per_category = max(1, concurrent_polls // len(categories))
+            await asyncio.gather(*(
+                poll_category(client, api_url, category, states[category], seen, sounds, queue, slots, max_polls, patience, poll_retries, poll_backoff, progress, poll_task, download_task)
+                for category in categories
+                for _ in range(pollers_per_category)
+            ))
+            progress.update(poll_task, total=sum(state.polls for state in states.values()))
+            await queue.join()
+            for downloader in downloaders:
+                downloader.cancel()
+
+    with open(output_dir / "sounds.json", "w") as f:
+        dump([asdict(sound) for sound in sounds], f)
+    for category, state in states.items():
+        typer.echo(f"{category}: {state.sounds} sounds in {state.polls} polls")
+    if failed:
+        typer.echo(f"Failed to download {len(failed)} files", err=True)
+
+
+def cli(output_dir: Annotated[Path, typer.Argument(dir_okay=True, file_okay=False)],
+        categories: Annotated[list[str], typer.Option("--category")] = CATEGORIES,
+        api_url: str = API_URL,
+        cdn_url: str = CDN_URL,
+        max_polls: Annotated[int, typer.Option(help="Maximum number of polls per category")] = 900,
+        patience: Annotated[int, typer.Option(help="Stop polling a category after this many polls in a row without a new sound")] = 100,
+        poll_retries: Annotated[int, typer.Option(help="Retries of a poll that failed with a transient error")] = 3,
+        poll_backoff: Annotated[float, typer.Option(help="Base delay in seconds of the exponential backoff between poll retries")] = 0.5,
+        concurrent_polls: int = 10,
+        concurrent_downloads: int = 10,
+        queue_size: int = 100,
+        timeout: float = 10.0):
+        asyncio.run(run_cli(output_dir, categories, api_url, cdn_url, max_polls, patience, poll_retries, poll_backoff, concurrent_polls, concurrent_downloads, queue_size, timeout))
+
+if __name__ == "__main__":
+    typer.run(cli)
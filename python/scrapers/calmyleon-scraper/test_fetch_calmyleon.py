@@ -0,0 +1,80 @@
+import asyncio
+import importlib.util
+import json
+from pathlib import Path
+
+import httpx
+
+API_URL = "https://calmyleon.test/serve.php"
+CDN_URL = "https://cdn.calmyleon.test/Data/"
+
+# fetch-calmyleon.py is a script, so it is loaded from its path
+_spec = importlib.util.spec_from_file_location("fetch_calmyleon", Path(__file__).with_name("fetch-calmyleon.py"))
+fetch_calmyleon = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(fetch_calmyleon)
+
+
+class MockServer:
+    """
+    Serves the sounds of every category in a cycle and the CDN files of every sound, counting polls in flight.
+    """
+
+    def __init__(self, sounds: dict[str, list[tuple[str, str]]]):
+        self.sounds = sounds
+        self.polls = {category: 0 for category in sounds}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.downloads = []
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        if str(request.url).startswith(API_URL):
+            category = request.url.params["c"]
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            await asyncio.sleep(0.001)
+            self.in_flight -= 1
+            code, stem = self.sounds[category][self.polls[category] % len(self.sounds[category])]
+            self.polls[category] += 1
+            return httpx.Response(200, json={"code": code, "stem": stem})
+        self.downloads.append(str(request.url))
+        return httpx.Response(200, content=request.url.path.encode())
+
+
+def fetch(tmp_path: Path, server: MockServer, max_polls: int = 50, patience: int = 5, concurrent_polls: int = 1):
+    asyncio.run(fetch_calmyleon.run_cli(
+        tmp_path, list(server.sounds), API_URL, CDN_URL, max_polls, patience, poll_retries=0, poll_backoff=0.0,
+        concurrent_polls=concurrent_polls, concurrent_downloads=2, queue_size=4, timeout=1.0,
+        transport=httpx.MockTransport(server.handler),
+    ))
+    with open(tmp_path / "sounds.json") as f:
+        return json.load(f)
+
+
+def test_sounds_are_deduplicated_on_code_and_stem(tmp_path):
+    server = MockServer({"rain": [("rain", "1"), ("rain", "2"), ("rain", "1"), ("birds", "1"), ("rain", "2")]})
+    sounds = fetch(tmp_path, server)
+    assert sorted((x["code"], x["stem"]) for x in sounds) == [("birds", "1"), ("rain", "1"), ("rain", "2")]
+
+
+def test_category_stops_after_patience_polls_without_a_new_sound(tmp_path):
+    server = MockServer({"rain": [("rain", "1"), ("rain", "2")], "ocean": [("ocean", "1")]})
+    fetch(tmp_path, server, patience=3)
+    assert server.polls == {"rain": 2 + 3, "ocean": 1 + 3}
+
+
+def test_both_files_of_every_sound_are_streamed_to_disk(tmp_path):
+    server = MockServer({"rain": [("rain", "1"), ("birds", "7")]})
+    fetch(tmp_path, server)
+    assert sorted(server.downloads) == sorted(
+        f"{CDN_URL}{code}/{stem}{variant}.ogg" for code, stem in [("rain", "1"), ("birds", "7")] for variant in "ab"
+    )
+    path = tmp_path / "birds" / "birds_7b.ogg"
+    assert path.read_bytes() == b"/Data/birds/7b.ogg"
+    assert not list(tmp_path.rglob("*.part"))
+
+
+def test_polls_in_flight_are_bounded_with_more_categories_than_polls(tmp_path):
+    server = MockServer({category: [(category, str(i)) for i in range(20)] for category in fetch_calmyleon.CATEGORIES})
+    fetch(tmp_path, server, max_polls=10, concurrent_polls=3)
+    assert server.max_in_flight <= 3
+    assert all(polls == 10 for polls in server.polls.values())
@@ -0,0 +1,211 @@
+import os
+import shutil
+import subprocess
+import tempfile
+from dataclasses import dataclass
+from math import gcd
+from typing import Optional
+import librosa
+import numpy as np
+import soundfile
+import soxr
+from scipy.signal import resample_poly
+
+DECODE_BACKENDS = ('auto', 'soundfile', 'ffmpeg', 'librosa')
+
+# soxr qualities are resampled block by block while decoding, polyphase resamples the decoded signal at once
+RESAMPLE_TYPES = {
+    'soxr_vhq': 'VHQ',
+    'soxr_hq': 'HQ',
+    'soxr_mq': 'MQ',
+    'soxr_lq': 'LQ',
+    'soxr_qq': 'QQ',
+    'polyphase': None,
+}
+
+# Extensions decoded through an ffmpeg pipe by the 'auto' backend if ffmpeg is installed
+FFMPEG_EXTENSIONS = ('.mp3',)
+# Bytes from the end of the ffmpeg error output included in the exception of a failed decode
+FFMPEG_ERROR_BYTES = 4096
+
+
+@dataclass(frozen=True)
+class DecodeOptions:
+    """
+    How audio files are decoded and resampled before feature extraction.
+
+    Attributes:
+        backend (str): One of DECODE_BACKENDS. 'auto' pipes mp3 files through ffmpeg if it is installed and reads
+            everything else with soundfile, falling back to librosa for files soundfile cannot open.
+        offset (float): Start of the decoded window in seconds. Default is 0.
+        duration (float): Maximum duration of the decoded window in seconds. Default is None, which decodes
+            until the end of the file.
+        resample_type (str): One of RESAMPLE_TYPES. Default is 'soxr_hq', the librosa default.
+        block_seconds (float): Duration of the blocks read from the decoder. Default is 30 seconds.
+
+    Raises:
+        ValueError: If the backend or resample type is unknown, or the window is invalid.
+
+    """
+    backend: str = 'auto'
+    offset: float = 0.0
+    duration: Optional[float] = None
+    resample_type: str = 'soxr_hq'
+    block_seconds: float = 30.0
+
+    def __post_init__(self):
+        if self.backend not in DECODE_BACKENDS:
+            raise ValueError(f"Invalid backend: {self.backend}. Choose from {list(DECODE_BACKENDS)}.")
+        if self.resample_type not in RESAMPLE_TYPES:
+            raise ValueError(f"Invalid resample type: {self.resample_type}. Choose from {list(RESAMPLE_TYPES)}.")
+        if self.offset < 0 or (self.duration is not None and self.duration <= 0) or self.block_seconds <= 0:
+            raise ValueError("Offset must not be negative, duration and block size must be positive.")
+
+    def key_params(self):
+        """
+        Options the decoded signal depends on, to be included in feature store keys. Backends decode some
+        formats differently, for example with encoder delay and padding, so the backend is part of the key.
+        """
+        return {'backend': self.backend, 'offset': self.offset, 'duration': self.duration, 'resample_type': self.resample_type}
+
+
+def resolve_backend(path, backend):
+    if backend != 'auto':
+        return backend
+    if path.lower().endswith(FFMPEG_EXTENSIONS) and shutil.which('ffmpeg') and shutil.which('ffprobe'):
+        return 'ffmpeg'
+    return 'soundfile'
+
+
+def soundfile_blocks(path, options):
+    """
+    Open an audio file with soundfile.
+
+    Returns:
+        tuple: The native sample rate and a generator of mono float32 blocks at that rate.
+    """
+    f = soundfile.SoundFile(path)
+    native_rate = f.samplerate
+    start = min(int(options.offset * native_rate), f.frames)
+    frames = f.frames - start if options.duration is None else min(int(options.duration * native_rate), f.frames - start)
+
+    def blocks():
+        with f:
+            f.seek(start)
+            blocksize = max(1, int(options.block_seconds * native_rate))
+            for block in f.blocks(blocksize=blocksize, frames=frames, dtype='float32', always_2d=True):
+                yield block.mean(axis=1)
+
+    return native_rate, blocks()
+
+
+def ffmpeg_blocks(path, options):
+    """
+    Decode an audio file through an ffmpeg pipe, which handles formats soundfile cannot read.
+
+    Returns:
+        tuple: The native sample rate and a generator of mono float32 blocks at that rate.
+    """
+    probe = subprocess.run(
+        ['ffprobe', '-v', 'error', '-select_streams', 'a:0', '-show_entries', 'stream=sample_rate', '-of', 'csv=p=0', path],
+        capture_output=True, text=True, check=True
+    )
+    native_rate = int(probe.stdout.strip().splitlines()[0])
+
+    command = ['ffmpeg', '-v', 'error', '-nostdin']
+    if options.offset:
+        command += ['-ss', str(options.offset)]
+    if options.duration is not None:
+        command += ['-t', str(options.duration)]
+    command += ['-i', path, '-vn', '-ac', '1', '-f', 'f32le', '-']
+
+    def blocks():
+        blocksize = 4 * max(1, int(options.block_seconds * native_rate))
+        # stderr goes to a file rather than a pipe. ffmpeg blocks once a pipe buffer is full, and a pipe that is
+        # only read after stdout ends would deadlock on a file that logs many decode errors.
+        with tempfile.TemporaryFile() as errors, subprocess.Popen(command, stdout=subprocess.PIPE, stderr=errors) as process:
+            remainder = b''
+            while chunk := process.stdout.read(blocksize):
+                chunk = remainder + chunk
+                usable = len(chunk) - len(chunk) % 4
+                remainder = chunk[usable:]
+                yield np.frombuffer(chunk[:usable], dtype=np.float32)
+            if process.wait() != 0:
+                # The end of the log holds the error that stopped ffmpeg
+                errors.seek(max(0, errors.seek(0, os.SEEK_END) - FFMPEG_ERROR_BYTES))
+                raise RuntimeError(f"ffmpeg failed to decode {path}: {errors.read().decode(errors='replace').strip()}")
+
+    return native_rate, blocks()
+
+
+def resample_blocks(blocks, native_rate, sample_rate, resample_type):
+    """
+    Resample a stream of mono blocks, yielding blocks at the target rate as soon as they are available.
+    """
+    if native_rate == sample_rate:
+        yield from blocks
+        return
+
+    quality = RESAMPLE_TYPES[resample_type]
+    if quality is None:
+        # Polyphase filtering is not streamable, the decoded signal is resampled at once
+        divisor = gcd(int(sample_rate), int(native_rate))
+        native = np.concatenate(list(blocks) or [np.zeros(0, dtype=np.float32)])
+        yield resample_poly(native, sample_rate // divisor, native_rate // divisor).astype(np.float32)
+        return
+
+    stream = soxr.ResampleStream(native_rate, sample_rate, 1, dtype='float32', quality=quality)
+    for block in blocks:
+        yield stream.resample_chunk(block)
+    yield stream.resample_chunk(np.zeros(0, dtype=np.float32), last=True)
+
+
+def decode_audio(path, sample_rate, options=None):
+    """
+    Decode an audio file to a mono float32 signal at the target sample rate.
+
+    Args:
+        path (str): Path to the audio file.
+        sample_rate (int): Target sample rate.
+        options (DecodeOptions): Backend, window and resampler to use. Default is None, which uses DecodeOptions().
+
+    Returns:
+        np.ndarray: The decoded signal.
+
+    Raises:
+        FileNotFoundError: If the file does not exist.
+        RuntimeError: If ffmpeg fails to decode the file.
+
+    Notes:
+        The file is read in blocks of block_seconds, and every block is downmixed and resampled as soon as it
+        is read. Only the window between offset and offset + duration is decoded, and the signal is never held
+        at its native rate in full, unlike librosa.load. The 'librosa' backend uses librosa.load with the same
+        window and resampler.
+
+        Features are not extracted at the native rate of each file. Every metric compares the frames of two files,
+        which requires both to share the sample rate and hop length, so all files are resampled to sample_rate.
+        The resampled blocks are concatenated into one signal, because the CQT chroma, spectral contrast and
+        onset detection need the whole signal and cannot be fed block by block.
+
+    """
+    options = options or DecodeOptions()
+    if not os.path.isfile(path):
+        raise FileNotFoundError(path)
+
+    backend = resolve_backend(path, options.backend)
+    if backend == 'soundfile':
+        try:
+            native_rate, blocks = soundfile_blocks(path, options)
+        except RuntimeError:
+            if options.backend != 'auto':
+                raise
+            backend = 'librosa'
+    elif backend == 'ffmpeg':
+        native_rate, blocks = ffmpeg_blocks(path, options)
+
+    if backend == 'librosa':
+        audio, _ = librosa.load(path, sr=sample_rate, offset=options.offset, duration=options.duration, res_type=options.resample_type)
+        return audio
+
+    audio = [block for block in resample_blocks(blocks, native_rate, sample_rate, options.resample_type) if len(block)]
+    return np.concatenate(audio) if audio else np.zeros(0, dtype=np.float32)
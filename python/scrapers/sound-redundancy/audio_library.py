@@ -0,0 +1,158 @@
+import os
+import numpy as np
+from audio_similarity import discover_audio_files, iter_features, load_features
+from feature_store import FeatureStore
+from similarity_matrix import (
+    METRIC_NAMES, TILE_MEMORY_BUDGET, WEIGHTS, common_frame_distances, contrast_scale, perceptual_similarity_matrix, rhythm_similarity_matrix
+)
+
+
+class AudioLibrary:
+    """
+    Features of a collection of audio files, loaded once and queried with new files.
+
+    Args:
+        *audio_dirs (str): Directories whose audio files make up the library.
+        sample_rate (int): Target sample rate for audio resampling.
+        weights (dict): Weight of each metric in the SWASS. Default is None, which weights the four frame
+            metrics equally and skips the perceptual similarity.
+        feature_store (str or FeatureStore): Directory or store used to persist extracted features across runs.
+            Default is None, which disables persistence.
+        workers (int): Number of processes used to decode audio files. Default is None, which uses one per CPU.
+        decode_options (DecodeOptions): Decode backend, window and resampler. Default is None, which uses
+            DecodeOptions().
+        chunk_size (int): Number of library files scored per vectorized pass of a query. Default is None, which
+            derives it from TILE_MEMORY_BUDGET and the length of each query.
+
+    Raises:
+        None
+
+    Notes:
+        With a feature store, the library holds the feature arrays memory-mapped, so opening a large library
+        is cheap and its pages are shared with other processes. A query only featurizes the new file, and
+        scores it against the library in chunks with one-to-many kernels. Every pair is compared over its own
+        common length, so query scores equal the pairwise metrics of AudioSimilarity.
+
+    """
+    def __init__(self, *audio_dirs, sample_rate, weights=None, feature_store=None, workers=None, decode_options=None, chunk_size=None):
+        self.sample_rate = sample_rate
+        self.weights = dict(WEIGHTS if weights is None else weights)
+        self.metrics = [name for name in METRIC_NAMES if self.weights.get(name, 0) > 0]
+        if feature_store is None or isinstance(feature_store, FeatureStore):
+            self.feature_store = feature_store
+        else:
+            self.feature_store = FeatureStore(feature_store)
+        self.decode_options = decode_options
+        self.chunk_size = chunk_size
+
+        paths = discover_audio_files(*audio_dirs)
+        features = [None] * len(paths)
+        for index, feature in iter_features(paths, sample_rate, self.feature_store, workers, decode_options=decode_options):
+            features[index] = feature
+        self.features = [feature for feature in features if feature is not None]
+
+    def __len__(self):
+        return len(self.features)
+
+    @property
+    def paths(self):
+        return [x.path for x in self.features]
+
+    def add(self, path):
+        """
+        Add an audio file to the library.
+
+        Args:
+            path (str): Path to the audio file.
+
+        Returns:
+            AudioFeatures: The features of the file.
+
+        Raises:
+            FileNotFoundError: If the file does not exist.
+
+        """
+        features = load_features(os.path.abspath(path), self.sample_rate, self.feature_store, self.decode_options)
+        self.features.append(features)
+        return features
+
+    def chunk_files(self, query):
+        """
+        Number of library files scored per vectorized pass of a query.
+
+        Notes:
+            The frame features of the files in a chunk are cut or padded to the frames of the query and copied to
+            float64, so the chunk holds as many files as fit into TILE_MEMORY_BUDGET at the length of the query.
+        """
+        if self.chunk_size:
+            return self.chunk_size
+        frame_values = (query.chroma.shape[0] + query.spectral_contrast.shape[0]) * query.chroma.shape[1] + query.stoi_envelopes.size
+        return max(1, TILE_MEMORY_BUDGET // (2 * 8 * max(frame_values, 1)))
+
+    def score(self, query, features):
+        """
+        Calculate the metrics and SWASS of one feature record against many.
+
+        Args:
+            query (AudioFeatures): Features of the query file.
+            features (list): AudioFeatures records to score against.
+
+        Returns:
+            dict: Arrays with shape (len(features),) keyed by metric name, including 'swass'.
+
+        Raises:
+            None
+
+        """
+        scores = {}
+        if 'zcr_similarity' in self.metrics:
+            scores['zcr_similarity'] = 1 - np.abs(query.zcr - np.array([x.zcr for x in features]))
+        if 'rhythm_similarity' in self.metrics:
+            scores['rhythm_similarity'] = rhythm_similarity_matrix([query], features)[0]
+        if 'chroma_similarity' in self.metrics:
+            scores['chroma_similarity'] = 1 - common_frame_distances(query.chroma, [x.chroma for x in features])
+        if 'spectral_contrast_similarity' in self.metrics:
+            scale = np.maximum(contrast_scale(query), [contrast_scale(x) for x in features])
+            scores['spectral_contrast_similarity'] = 1 - common_frame_distances(query.spectral_contrast, [x.spectral_contrast for x in features]) / scale
+        if 'perceptual_similarity' in self.metrics:
+            scores['perceptual_similarity'] = perceptual_similarity_matrix([query], features)[0]
+        scores['swass'] = sum((self.weights[name] * scores[name] for name in self.metrics), np.zeros(len(features)))
+        return scores
+
+    def query(self, path, top_k=10):
+        """
+        Find the library files most similar to an audio file.
+
+        Args:
+            path (str): Path to the audio file. It is not added to the library.
+            top_k (int): Number of matches to return. Default is 10.
+
+        Returns:
+            list: Dicts with the 'path' of a library file, its 'swass' and the individual metrics, best match first.
+                Library entries with the same path as the query are skipped.
+
+        Raises:
+            FileNotFoundError: If the file does not exist.
+
+        Notes:
+            NaN scores, such as the rhythm similarity of files without onsets, rank last.
+
+        """
+        query = load_features(os.path.abspath(path), self.sample_rate, self.feature_store, self.decode_options)
+        scores = {name: np.empty(len(self.features)) for name in [*self.metrics, 'swass']}
+        chunk_size = self.chunk_files(query)
+        for start in range(0, len(self.features), chunk_size):
+            chunk = self.features[start:start + chunk_size]
+            for name, values in self.score(query, chunk).items():
+                scores[name][start:start + len(chunk)] = values
+
+        ranking = np.nan_to_num(scores['swass'], nan=-np.inf)
+        candidates = np.array([i for i, x in enumerate(self.features) if x.path != query.path], dtype=np.int64)
+        top_k = min(top_k, len(candidates))
+        if top_k > 0:
+            candidates = candidates[np.argpartition(-ranking[candidates], top_k - 1)[:top_k]]
+        best = candidates[:top_k][np.argsort(-ranking[candidates[:top_k]], kind='stable')]
+        return [
+            dict(path=self.features[i].path, **{name: float(values[i]) for name, values in scores.items()})
+            for i in best
+        ]
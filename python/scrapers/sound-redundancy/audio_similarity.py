@@ -1,20 +1,328 @@
 import numpy as np
 import librosa
-import pystoi
 import os
 import matplotlib.pyplot as plt
 import warnings
 import sys
-from functools import lru_cache
 from tqdm import tqdm
 import logging
 import random
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, fields
 from sklearn.metrics import mean_absolute_error
+from audio_decoding import DecodeOptions, decode_audio
+from duplicate_groups import perceptual_hash
+from feature_store import FeatureStore
+from similarity_pool import SimilarityPool
+from similarity_matrix import HOP_LENGTH, METRIC_NAMES, PERCEPTUAL_SAMPLE_RATE, WEIGHTS, condensed_similarities, contrast_scale, similarity_tensor, stoi_envelopes, stoi_similarity, to_square
+from windowed_similarity import compare_windows
 
 warnings.filterwarnings("ignore", category=UserWarning, module='librosa')
 
 logger = logging.getLogger()
 
+AUDIO_EXTENSIONS = ('.mp3', '.ogg', '.flac', '.wav')
+
+# Smaller similarity matrices are scored in-process, as starting the worker pool costs more than it saves
+SIMILARITY_POOL_MIN_PAIRS = 128 * 128
+
+# Parameters the extracted features depend on. Bump the version whenever extract_features changes so that
+# stale entries in a FeatureStore are not reused.
+FEATURE_PARAMS = {
+    'version': 6,
+    'hop_length': HOP_LENGTH,
+    'perceptual_sample_rate': PERCEPTUAL_SAMPLE_RATE,
+}
+
+
+@dataclass
+class AudioFeatures:
+    """
+    Features of a single audio file, extracted once and shared by all pairwise comparisons.
+
+    Attributes:
+        path (str): Path of the audio file the features were extracted from.
+        num_samples (int): Length of the decoded signal in samples at the analysis sample rate.
+        zcr (float): Zero-crossing rate of the signal.
+        zcr_frames (np.ndarray): Zero-crossing rate per frame with shape (frames,).
+        onsets (np.ndarray): Sorted, unique onset positions in samples.
+        onset_envelope (np.ndarray): Onset strength per frame with shape (frames,).
+        chroma (np.ndarray): Chroma CQT features with shape (12, frames).
+        spectral_contrast (np.ndarray): Spectral contrast features with shape (7, frames).
+        mfcc (np.ndarray): Mel-frequency cepstral coefficients with shape (20, frames), used for fingerprinting.
+        stoi_envelopes (np.ndarray): Third-octave band envelopes of the signal at 10 kHz with shape (15, frames),
+            the per-file part of the perceptual similarity metric.
+        pcm_hash (str): Perceptual hash of the decoded signal, equal for exact and near-exact duplicates.
+
+    """
+    path: str
+    num_samples: int
+    zcr: float
+    zcr_frames: np.ndarray
+    onsets: np.ndarray
+    onset_envelope: np.ndarray
+    chroma: np.ndarray
+    spectral_contrast: np.ndarray
+    mfcc: np.ndarray
+    stoi_envelopes: np.ndarray
+    pcm_hash: str
+
+    def to_dict(self):
+        return {field.name: getattr(self, field.name) for field in fields(self) if field.name != 'path'}
+
+    @classmethod
+    def from_dict(cls, path, values):
+        return cls(path=path, **{field.name: values[field.name] for field in fields(cls) if field.name != 'path'})
+
+
+def extract_features(audio, sample_rate, path=None):
+    """
+    Extract all features required by the similarity metrics from a decoded signal.
+
+    Args:
+        audio (np.ndarray): The decoded mono signal.
+        sample_rate (int): Sample rate of the signal.
+        path (str): Path of the audio file, stored on the record for reference. Default is None.
+
+    Returns:
+        AudioFeatures: The feature record of the signal.
+
+    Raises:
+        None
+
+    Notes:
+        This is the only place where spectra are computed. Every metric scores pairs of feature records, so the
+        chroma CQT, spectral contrast and onset detection run once per file rather than once per pair. All frame
+        features share the hop length HOP_LENGTH, so frame i covers the same audio in every feature.
+
+    """
+    onset_envelope = librosa.onset.onset_strength(y=audio, sr=sample_rate, hop_length=HOP_LENGTH)
+    onsets = librosa.onset.onset_detect(onset_envelope=onset_envelope, sr=sample_rate, hop_length=HOP_LENGTH, units='time')
+    onsets = np.unique((np.asarray(onsets) * sample_rate).astype(np.int64))
+    log_mel = librosa.power_to_db(librosa.feature.melspectrogram(y=audio, sr=sample_rate, hop_length=HOP_LENGTH))
+
+    return AudioFeatures(
+        path=path,
+        num_samples=len(audio),
+        zcr=float(np.mean(np.abs(np.diff(np.sign(audio))) > 0)),
+        zcr_frames=librosa.feature.zero_crossing_rate(y=audio, hop_length=HOP_LENGTH)[0],
+        onsets=onsets[onsets < len(audio)],
+        onset_envelope=onset_envelope,
+        chroma=librosa.feature.chroma_cqt(y=audio, sr=sample_rate, hop_length=HOP_LENGTH),
+        spectral_contrast=librosa.feature.spectral_contrast(y=audio, sr=sample_rate, hop_length=HOP_LENGTH),
+        mfcc=librosa.feature.mfcc(S=log_mel, n_mfcc=20),
+        stoi_envelopes=stoi_envelopes(librosa.resample(y=audio, orig_sr=sample_rate, target_sr=PERCEPTUAL_SAMPLE_RATE)),
+        pcm_hash=perceptual_hash(audio, log_mel, sample_rate, HOP_LENGTH),
+    )
+
+
+def discover_audio_files(*audio_dirs, extensions=AUDIO_EXTENSIONS):
+    """
+    Recursively find all audio files below the given directories.
+
+    Args:
+        *audio_dirs (str): Directories to search.
+        extensions (tuple): File extensions to include. Default is AUDIO_EXTENSIONS.
+
+    Returns:
+        list: Sorted absolute paths of the audio files.
+
+    Raises:
+        None
+
+    """
+    return sorted({
+        os.path.abspath(os.path.join(root, name))
+        for audio_dir in audio_dirs
+        for root, _, names in os.walk(audio_dir)
+        for name in names
+        if name.lower().endswith(extensions)
+    })
+
+
+def feature_key(path, sample_rate, decode_options=None):
+    """
+    Feature store key of an audio file, covering its content and everything the extracted features depend on.
+    """
+    decode_options = decode_options or DecodeOptions()
+    return FeatureStore.content_key(path, sample_rate=sample_rate, **FEATURE_PARAMS, **decode_options.key_params())
+
+
+def featurize_file(path, sample_rate, feature_store=None, key=None, decode_options=None):
+    """
+    Decode an audio file and extract its features, storing them under the given key if a store is given.
+
+    Args:
+        path (str): Path to the audio file.
+        sample_rate (int): Target sample rate for audio resampling.
+        feature_store (FeatureStore): Store to write the features to. Default is None.
+        key (str): Store key of the file. Required if a feature store is given.
+        decode_options (DecodeOptions): Decode backend, window and resampler. Default is None, which uses
+            DecodeOptions().
+
+    Returns:
+        AudioFeatures: The feature record of the file.
+
+    Raises:
+        FileNotFoundError: If the file does not exist.
+
+    Notes:
+        The decoded signal only lives for the duration of this call, so running it in a worker process keeps the
+        waveform out of the caller's memory entirely.
+
+    """
+    audio = decode_audio(path, sample_rate, decode_options)
+    features = extract_features(audio, sample_rate, path=path)
+    if feature_store is not None:
+        feature_store.save(key, features.to_dict())
+    return features
+
+
+def load_features(path, sample_rate, feature_store=None, decode_options=None):
+    """
+    Load the features of a single audio file, using a feature store if one is given.
+
+    Args:
+        path (str): Path to the audio file.
+        sample_rate (int): Target sample rate for audio resampling.
+        feature_store (FeatureStore): Store to read features from and write new features to. Default is None.
+        decode_options (DecodeOptions): Decode backend, window and resampler. Default is None, which uses
+            DecodeOptions().
+
+    Returns:
+        AudioFeatures: The feature record of the file.
+
+    Raises:
+        FileNotFoundError: If the file does not exist.
+
+    """
+    if feature_store is None:
+        return featurize_file(path, sample_rate, decode_options=decode_options)
+
+    key = feature_key(path, sample_rate, decode_options)
+    values = feature_store.load(key)
+    if values is None:
+        return featurize_file(path, sample_rate, feature_store, key, decode_options)
+    return AudioFeatures.from_dict(path, values)
+
+
+def iter_features(paths, sample_rate, feature_store=None, workers=None, max_in_flight=None, decode_options=None):
+    """
+    Load the features of many audio files, decoding them in a process pool and yielding them as they finish.
+
+    Args:
+        paths (list): Paths to the audio files.
+        sample_rate (int): Target sample rate for audio resampling.
+        feature_store (FeatureStore): Store to read features from and write new features to. Default is None.
+        workers (int): Number of decoding processes. Default is None, which uses one per CPU. With 1, files are
+            decoded in the calling process.
+        max_in_flight (int): Maximum number of files being decoded at the same time. Default is None, which
+            allows two per worker.
+        decode_options (DecodeOptions): Decode backend, window and resampler. Default is None, which uses
+            DecodeOptions().
+
+    Yields:
+        tuple: The index of the file in paths and its AudioFeatures record, in order of completion.
+
+    Raises:
+        None
+
+    Notes:
+        Files found in the feature store are yielded without decoding. The remaining files are submitted to the
+        pool at most max_in_flight at a time, which bounds peak memory to that many decoded waveforms regardless
+        of the number of files. Only feature records are sent back from the workers. Files that fail to load are
+        logged and skipped.
+
+    """
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or 2 * workers
+
+    def pending_files():
+        for index, path in enumerate(paths):
+            try:
+                if feature_store is None:
+                    yield index, path, None
+                    continue
+                key = feature_key(path, sample_rate, decode_options)
+                values = feature_store.load(key)
+            except OSError as e:
+                logging.error(f"Error loading file {path}: {e}")
+                continue
+            if values is None:
+                yield index, path, key
+            else:
+                yield index, AudioFeatures.from_dict(path, values), None
+
+    if workers == 1:
+        for index, path, key in pending_files():
+            if isinstance(path, AudioFeatures):
+                yield index, path
+                continue
+            try:
+                yield index, featurize_file(path, sample_rate, feature_store, key, decode_options)
+            except Exception as e:
+                logging.error(f"Unexpected error loading file {path}: {type(e).__name__}, {e}")
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = pending_files()
+        futures = {}
+        exhausted = False
+        while True:
+            while not exhausted and len(futures) < max_in_flight:
+                task = next(pending, None)
+                if task is None:
+                    exhausted = True
+                    break
+                index, path, key = task
+                if isinstance(path, AudioFeatures):
+                    yield index, path
+                    continue
+                futures[executor.submit(featurize_file, path, sample_rate, feature_store, key, decode_options)] = (index, path)
+
+            if not futures:
+                break
+
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, path = futures.pop(future)
+                try:
+                    yield index, future.result()
+                except Exception as e:
+                    logging.error(f"Unexpected error loading file {path}: {type(e).__name__}, {e}")
+
+
+def onset_correlation(onsets_a, onsets_b, length):
+    """
+    Pearson correlation of two binary onset vectors of the given length, computed from their onset positions.
+
+    Args:
+        onsets_a (np.ndarray): Sorted, unique onset positions of the first signal.
+        onsets_b (np.ndarray): Sorted, unique onset positions of the second signal.
+        length (int): Length of the (virtual) onset vectors.
+
+    Returns:
+        float: The correlation coefficient, or NaN if either vector is constant.
+
+    Raises:
+        None
+
+    Notes:
+        For binary vectors with a and b ones among n entries and c shared ones, the correlation is
+        (n * c - a * b) / sqrt(a * (n - a) * b * (n - b)). This avoids materializing vectors with one
+        entry per sample.
+
+    """
+    onsets_a = onsets_a[onsets_a < length]
+    onsets_b = onsets_b[onsets_b < length]
+    a, b = len(onsets_a), len(onsets_b)
+    c = len(np.intersect1d(onsets_a, onsets_b, assume_unique=True))
+    denominator = float(a) * (length - a) * b * (length - b)
+    if denominator <= 0:
+        return np.nan
+    return (length * c - a * b) / np.sqrt(denominator)
+
+
 class AudioSimilarity:
     """
     Calculate the similarity between audio files using multiple audio similarity metrics.
@@ -26,33 +334,41 @@ class AudioSimilarity:
         weights (dict or list): Weights for the audio similarity metrics. Default is None.
         verbose (bool): Flag to enable/disable verbose logging. Default is True.
         sample_size (int): Number of audio files to sample from directories. Default is 1.
+        feature_store (str or FeatureStore): Directory or store used to persist extracted features across runs.
+            Default is None, which disables persistence.
+        workers (int): Number of processes used to decode audio files and to score pairs. Default is None, which
+            uses one per CPU.
+        max_in_flight (int): Maximum number of audio files decoded at the same time. Default is None, which allows
+            two per worker.
+        decode_options (DecodeOptions): Decode backend, window and resampler. Default is None, which uses
+            DecodeOptions().
 
     Raises:
         None
 
     Notes:
         The AudioSimilarity class calculates the similarity between audio files using multiple audio similarity metrics.
-        It supports various metrics including zero-crossing rate (ZCR) similarity, rhythm similarity, spectral flux similarity,
-        energy envelope similarity, spectral contrast similarity, and perceptual similarity. The class can handle both
+        It supports various metrics including zero-crossing rate (ZCR) similarity, rhythm similarity, chroma similarity,
+        spectral contrast similarity, and perceptual similarity. The class can handle both
         individual audio files and directories of audio files. The loaded audio files are resampled to the specified sample
-        rate for consistent processing. The weights parameter allows customization of the importance of each similarity metric.
-        By default, equal weights are assigned to all metrics. Alternatively, weights can be provided as a dictionary or list.
+        rate for consistent processing, and their features are extracted once per file into AudioFeatures records which
+        all metrics score pairs from. The weights parameter allows customization of the importance of each similarity metric.
+        By default, the weights of WEIGHTS are used. Alternatively, weights can be provided as a dictionary keyed by metric name
+        or as a list in the order of METRIC_NAMES.
         If a sample size is specified, a random subset of audio files is sampled from the directories.
+        If a feature store is given, features are looked up by file content before decoding and newly extracted
+        features are written back, so repeated runs only decode and featurize files that are new to the store.
+        Large similarity matrices are scored in tiles by a SimilarityPool owned by the instance, which is started
+        on first use and stopped by close() or when the instance is used as a context manager.
 
     """
-    def __init__(self, original_path, compare_path, sample_rate, weights=None, verbose=True, sample_size=1):
+    def __init__(self, original_path, compare_path, sample_rate, weights=None, verbose=True, sample_size=1, feature_store=None, workers=None, max_in_flight=None, decode_options=None):
         
         log_format = "%(message)s"
         logging.basicConfig(level=logging.INFO if verbose else logging.CRITICAL, format=log_format)
 
         if weights is None:
-            self.weights = {
-                'zcr_similarity': 0.2,
-                'rhythm_similarity': 0.2,
-                'spectral_flux_similarity': 0.2,
-                'spectral_contrast_similarity': 0.2,
-                'perceptual_similarity': 0.2
-            }
+            self.weights = dict(WEIGHTS)
         else:
             self.weights = self.parse_weights(weights)
 
@@ -60,44 +376,77 @@ class AudioSimilarity:
         self.sample_rate = sample_rate
         self.original_path = original_path
         self.compare_path = compare_path
+        self.workers = workers
+        self.max_in_flight = max_in_flight
+        self.decode_options = decode_options
+        self.pool = None
+        if feature_store is None or isinstance(feature_store, FeatureStore):
+            self.feature_store = feature_store
+        else:
+            self.feature_store = FeatureStore(feature_store)
 
 
         # Check if the paths are directories or files
         self.is_directory = [os.path.isdir(path) for path in [original_path, compare_path]]
     
 
-        # Load audio files once
-        self.original_audios, self.compare_audios = self.load_audio_files()
+        # Load audio files and extract their features once
+        self.original_features, self.compare_features = self.load_audio_files()
     
         
         # Check if valid audio files were loaded
-        if not self.original_audios or not self.compare_audios:
+        if not self.original_features or not self.compare_features:
             sys.exit("No valid audio files found in the provided paths.")
 
+    def close(self):
+        """
+        Stop the worker pool used to score similarity matrices, if it was started.
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def symmetric(self):
+        """
+        Whether the original and compare audio files are the same files in the same order.
+        """
+        return [x.path for x in self.original_features] == [x.path for x in self.compare_features]
+
     def parse_weights(self, weights):
         if isinstance(weights, dict):
-            return weights
+            unknown = [name for name in weights if name not in METRIC_NAMES]
+            if unknown:
+                raise ValueError(f"Invalid weights: {unknown}. Choose from {METRIC_NAMES}.")
+            return dict(weights)
         elif isinstance(weights, list):
-            if len(weights) != 6:
-                raise ValueError("Invalid number of weights. Expected 6 weights.")
-            metric_names = [
-                'zcr_similarity',
-                'rhythm_similarity',
-                'spectral_flux_similarity',
-                'spectral_contrast_similarity',
-                'perceptual_similarity'
-            ]
-            return dict(zip(metric_names, weights))
+            if len(weights) != len(METRIC_NAMES):
+                raise ValueError(f"Invalid number of weights. Expected {len(METRIC_NAMES)} weights.")
+            return dict(zip(METRIC_NAMES, weights))
         else:
             raise ValueError("Invalid type for weights. Expected dict or list.")
 
 
+    def sample_files(self, files):
+        """
+        Randomly sample at most sample_size files. All files are kept if no sample size is set.
+        """
+        if not self.sample_size or self.sample_size >= len(files):
+            return files
+        return random.sample(files, self.sample_size)
+
     def load_audio_files(self):
         """
-        Load and preprocess the original and compare audio files.
+        Load the original and compare audio files and extract their features.
 
         Returns:
-            tuple: A tuple containing two lists of loaded audio files - original_audios and compare_audios.
+            tuple: A tuple containing two lists of AudioFeatures records - original_features and compare_features.
 
         Raises:
             None
@@ -106,18 +455,19 @@ class AudioSimilarity:
             This method loads the audio files from the specified paths and performs preprocessing steps.
             If the paths represent directories, it loads all audio files with valid extensions from the directories.
             If the paths represent individual audio files, it loads those files.
-            The loaded audio files are stored in separate lists - original_audios and compare_audios.
-            The audio files are randomly sampled if a sample size is specified.
-            The loaded audio files are preprocessed using librosa, including resampling to the specified sample rate.
+            The features of the loaded audio files are stored in separate lists - original_features and compare_features.
+            The audio files are randomly sampled if a sample size is specified, before any file is decoded.
+            The audio files are decoded with decode_audio, including resampling to the specified sample rate.
+            Files are decoded in parallel by iter_features, and files listed as both original and compare file are
+            only decoded once. The decoded signals are discarded once their features have been extracted.
+            If the original and compare path are the same and every file is kept, the files are compared with each
+            other and the similarity matrix is symmetric. Otherwise the original and compare samples are drawn
+            independently, so a sample is not only compared with itself.
 
         """
-        original_audios = []
-        compare_audios = []
-        valid_extensions = ('.mp3', '.flac', '.wav')
-
         if self.is_directory[0]:
             try:
-                original_files = [os.path.join(self.original_path, f) for f in os.listdir(self.original_path) if f.endswith(valid_extensions)]
+                original_files = [os.path.join(self.original_path, f) for f in os.listdir(self.original_path) if f.endswith(AUDIO_EXTENSIONS)]
                 
             except FileNotFoundError as e:
                 logging.error(f"Error loading original audio files: {e}")
@@ -131,7 +481,7 @@ class AudioSimilarity:
 
         if self.is_directory[1]:
             try:
-                compare_files = [os.path.join(self.compare_path, f) for f in os.listdir(self.compare_path) if f.endswith(valid_extensions)]
+                compare_files = [os.path.join(self.compare_path, f) for f in os.listdir(self.compare_path) if f.endswith(AUDIO_EXTENSIONS)]
             except FileNotFoundError as e:
                 logging.error(f"Error loading compare audio files: {e}")
                 return [], []
@@ -146,58 +496,83 @@ class AudioSimilarity:
         if not compare_files:
             logging.error("No compare audio files found.")
 
-        # Randomly sample files from the original files list
-        if self.sample_size >= len(original_files):
-            o_sample_size = len(original_files)
+        # Randomly sample files before decoding anything
+        same_path = os.path.abspath(self.original_path) == os.path.abspath(self.compare_path)
+        if same_path and (not self.sample_size or self.sample_size >= len(original_files)):
+            compare_files = original_files
         else:
-            o_sample_size = self.sample_size
-            
-        original_files = random.sample(original_files, o_sample_size) if self.sample_size else original_files
+            original_files = self.sample_files(original_files)
+            compare_files = self.sample_files(compare_files)
 
-        # Randomly sample files from the compare files list
-        if self.sample_size >= len(compare_files):
-            c_sample_size = len(compare_files)
-        else:
-            c_sample_size = self.sample_size
-            
-        compare_files = random.sample(compare_files, c_sample_size ) if self.sample_size else compare_files
+        unique_files = list(dict.fromkeys([*original_files, *compare_files]))
+        features_by_file = {}
+        for index, features in tqdm(
+            iter_features(unique_files, self.sample_rate, self.feature_store, self.workers, self.max_in_flight, self.decode_options),
+            desc="Loading audio files:",
+            total=len(unique_files)
+        ):
+            features_by_file[unique_files[index]] = features
 
-        for original_file in tqdm(original_files, desc="Loading original files:"):
-            try:
-                original_audio, _ = librosa.load(original_file, sr=self.sample_rate)
-                original_audios.append(original_audio)
-            except FileNotFoundError as e:
-                logging.error(f"Error loading file {original_file}: {e}")
-                continue
-            except Exception as e:
-                logging.error(f"Unexpected error loading file {original_file}: {type(e).__name__}, {e}")
-                continue
-
-        for compare_file in tqdm(compare_files, desc="Loading comparison files:"):
-            try:
-                compare_audio, _ = librosa.load(compare_file, sr=self.sample_rate)
-                compare_audios.append(compare_audio)
-            except FileNotFoundError as e:
-                logging.error(f"Error loading file {compare_file}: {e}")
-                continue
-            except Exception as e:
-                logging.error(f"Unexpected error loading file {compare_file}: {type(e).__name__}, {e}")
-                continue
+        original_features = [features_by_file[f] for f in original_files if f in features_by_file]
+        compare_features = [features_by_file[f] for f in compare_files if f in features_by_file]
 
-        return original_audios, compare_audios
+        return original_features, compare_features
 
 
-    @lru_cache(maxsize=None)
-    def zcr_similarity(self):
+    def metric_weights(self):
         """
-        Calculate the zero-crossing rate (ZCR) similarity between audio files.
+        Map the configured weights onto the metric names.
 
         Returns:
-            float: The average ZCR similarity score between the audio files, normalized between 0 and 1.
+            dict: The weight of each metric in METRIC_NAMES.
 
         Raises:
             None
 
+        Notes:
+            Weights are matched to metrics by name. Metrics without a weight get a weight of zero.
+
+        """
+        return {name: self.weights.get(name, 0) for name in METRIC_NAMES}
+
+    def resolve_metrics(self, metrics):
+        """
+        Resolve a metrics argument to the list of metric names that have to be calculated.
+
+        Args:
+            metrics (str or list): 'swass', 'all' or a list of metric names.
+
+        Returns:
+            list: The metric names. For 'swass', metrics with a weight of zero are left out.
+
+        Raises:
+            ValueError: If an unknown metric is requested.
+
+        """
+        if metrics == 'swass':
+            return [name for name, weight in self.metric_weights().items() if weight]
+        if metrics == 'all':
+            return list(METRIC_NAMES)
+
+        unknown = [name for name in metrics if name not in METRIC_NAMES]
+        if unknown:
+            raise ValueError(f"Invalid metrics: {unknown}. Choose from {METRIC_NAMES}.")
+        return list(metrics)
+
+    def zcr_similarity(self, i, j):
+        """
+        Calculate the zero-crossing rate (ZCR) similarity between an original and a compare audio file.
+
+        Args:
+            i (int): Index of the original audio file.
+            j (int): Index of the compare audio file.
+
+        Returns:
+            float: The ZCR similarity score between the audio files, normalized between 0 and 1.
+
+        Raises:
+            IndexError: If an index is out of range.
+
         Notes:
             The ZCR similarity is calculated by comparing the zero-crossing rates of the audio signals.
             Zero-crossing rate represents the rate at which the audio signal changes its sign. The similarity
@@ -206,85 +581,48 @@ class AudioSimilarity:
             score indicates greater similarity.
 
         """
-        logging.info("Calculating zero crossing rate similarity...")
-
-        total_zcr_similarity = 0
-        count = 0
-
-        for original_audio in self.original_audios:
-            original_zcr = np.mean(np.abs(np.diff(np.sign(original_audio))) > 0)
-
-            for compare_audio in self.compare_audios:
-                compare_zcr = np.mean(np.abs(np.diff(np.sign(compare_audio))) > 0)
-                zcr_similarity = 1 - np.abs(original_zcr - compare_zcr)
-                total_zcr_similarity += zcr_similarity
-                count += 1
+        original, compare = self.original_features[i], self.compare_features[j]
+        return float(1 - np.abs(original.zcr - compare.zcr))
 
-        if count > 0:
-            return total_zcr_similarity / count
-        else:
-            logging.info("No original audio files loaded.")
-            return None
-
-    @lru_cache(maxsize=None)
-    def rhythm_similarity(self):
+    def rhythm_similarity(self, i, j):
         """
-        Calculate the rhythm similarity between audio files.
+        Calculate the rhythm similarity between an original and a compare audio file.
+
+        Args:
+            i (int): Index of the original audio file.
+            j (int): Index of the compare audio file.
 
         Returns:
-            float: The average rhythm similarity score between the audio files, normalized between 0 and 1.
+            float: The rhythm similarity score between the audio files, normalized between 0 and 1.
 
         Raises:
-            None
+            IndexError: If an index is out of range.
 
         Notes:
             The rhythm similarity is calculated by comparing the rhythm patterns of the audio signals.
             Rhythm patterns are derived from the onsets in the audio. The similarity score is obtained
             by calculating the Pearson correlation coefficient between the rhythm patterns of the original
-            and compare audio files and normalizing it between 0 and 1. The similarity score ranges between
-            0 and 1, where a higher score indicates greater similarity.
+            and compare audio files over the length of the shorter file and normalizing it between 0 and 1.
+            The similarity score ranges between 0 and 1, where a higher score indicates greater similarity.
 
-    """
-        logging.info("Calculating rhythm similarity...")
-        total_rhythm_similarity = 0
-        count = 0
-
-        for original_audio in self.original_audios:
-            min_length = len(original_audio)
-            original_onset_vector = np.zeros(min_length)
-            original_onsets = librosa.onset.onset_detect(y=original_audio, sr=self.sample_rate, units='time')
-            original_onsets = np.array(original_onsets) * self.sample_rate
-            original_onsets = original_onsets[original_onsets < min_length]
-            original_onset_vector[original_onsets.astype(int)] = 1
-
-            for compare_audio in self.compare_audios:
-                min_length = min(min_length, len(compare_audio))
-                compare_onset_vector = np.zeros(min_length)
-                compare_onsets = librosa.onset.onset_detect(y=compare_audio[:min_length], sr=self.sample_rate, units='time')
-                compare_onsets = np.array(compare_onsets) * self.sample_rate
-                compare_onsets = compare_onsets[compare_onsets < min_length]
-                compare_onset_vector[compare_onsets.astype(int)] = 1
-
-                rhythm_similarity = (np.corrcoef(original_onset_vector[:min_length], compare_onset_vector[:min_length])[0, 1] + 1) / 2
-                total_rhythm_similarity += rhythm_similarity
-                count += 1
-
-        if count > 0:
-            return total_rhythm_similarity / count
-        else:
-            logging.info("No original audio files loaded.")
-            return None
+        """
+        original, compare = self.original_features[i], self.compare_features[j]
+        min_length = min(original.num_samples, compare.num_samples)
+        return float((onset_correlation(original.onsets, compare.onsets, min_length) + 1) / 2)
 
-    @lru_cache(maxsize=None)
-    def chroma_similarity(self):
+    def chroma_similarity(self, i, j):
         """
-        Calculate the chroma similarity between audio files.
+        Calculate the chroma similarity between an original and a compare audio file.
+
+        Args:
+            i (int): Index of the original audio file.
+            j (int): Index of the compare audio file.
 
         Returns:
-            float: The average chroma similarity score between the audio files, normalized between 0 and 1.
+            float: The chroma similarity score between the audio files, normalized between 0 and 1.
 
         Raises:
-            None
+            IndexError: If an index is out of range.
 
         Notes:
             The chroma similarity is calculated by comparing the chroma features of the audio signals.
@@ -294,130 +632,258 @@ class AudioSimilarity:
             where a higher score indicates greater similarity.
 
         """
-        logging.info("Calculating chroma similarity similarity...")
-        total_chroma_similarity = 0
-        count = 0
+        original, compare = self.original_features[i], self.compare_features[j]
+        min_length = min(original.chroma.shape[1], compare.chroma.shape[1])
+        return float(1 - np.mean(np.abs(original.chroma[:, :min_length] - compare.chroma[:, :min_length])))
 
-        for original_audio in self.original_audios:
-            for compare_audio in self.compare_audios:
-                original_chroma = librosa.feature.chroma_cqt(y=original_audio, sr=self.sample_rate)
-                compare_chroma = librosa.feature.chroma_cqt(y=compare_audio, sr=self.sample_rate)
+    def spectral_contrast_similarity(self, i, j):
+        """
+        Calculate the spectral contrast similarity between an original and a compare audio file.
 
-                min_length = min(original_chroma.shape[1], compare_chroma.shape[1])
-                original_chroma = original_chroma[:, :min_length]
-                compare_chroma = compare_chroma[:, :min_length]
+        Args:
+            i (int): Index of the original audio file.
+            j (int): Index of the compare audio file.
 
-                chroma_similarity = 1 - np.mean(np.abs(original_chroma - compare_chroma))
-                total_chroma_similarity += chroma_similarity
-                count += 1
+        Returns:
+            float: The spectral contrast similarity score between the audio files, normalized between 0 and 1.
 
-        if count > 0:
-            return total_chroma_similarity / count
-        else:
-            logging.info("No original audio files loaded.")
-            return None
+        Raises:
+            IndexError: If an index is out of range.
 
+        Notes:
+            The spectral contrast similarity is calculated by comparing the spectral contrast of the audio signals.
+            Spectral contrast measures the difference in magnitudes between peaks and valleys in the spectrum,
+            representing the perceived amount of spectral emphasis. The spectral contrast similarity score is
+            obtained by comparing the spectral contrast of the original and compare audio files and calculating
+            the average normalized similarity. The mean absolute difference is normalized by the largest absolute
+            contrast of either file, which makes the score symmetric. The similarity score ranges between 0 and 1,
+            where a higher score indicates greater similarity.
 
-   
+        """
+        original, compare = self.original_features[i], self.compare_features[j]
+        min_columns = min(original.spectral_contrast.shape[1], compare.spectral_contrast.shape[1])
+        original_contrast = original.spectral_contrast[:, :min_columns]
+        compare_contrast = compare.spectral_contrast[:, :min_columns]
+        contrast_similarity = np.mean(np.abs(original_contrast - compare_contrast))
+        return float(1 - contrast_similarity / max(contrast_scale(original), contrast_scale(compare)))
+
+    def perceptual_similarity(self, i, j):
+        """
+        Calculate the perceptual similarity between an original and a compare audio file using the Short-Time Objective
+        Intelligibility (STOI) metric.
+
+        Args:
+            i (int): Index of the original audio file.
+            j (int): Index of the compare audio file.
+
+        Returns:
+            float: The perceptual similarity score between the audio files, normalized between 0 and 1.
+
+        Raises:
+            IndexError: If an index is out of range.
+
+        Notes:
+            The perceptual similarity is calculated using the Short-Time Objective Intelligibility (STOI) metric.
+            STOI measures the similarity of two audio signals in terms of their intelligibility. The STOI score
+            ranges between -1 and 1, where a higher score indicates greater similarity. The perceptual similarity
+            score is obtained by normalizing the STOI score between 0 and 1, where 0 indicates no similarity and 1
+            indicates perfect similarity. The third-octave band envelopes STOI correlates are computed once per file
+            during feature extraction, so scoring a pair only correlates aligned segments, see stoi_similarity.
 
-    @lru_cache(maxsize=None)
-    def spectral_contrast_similarity(self):
         """
-        Calculate the spectral contrast similarity between audio files.
+        return stoi_similarity(self.original_features[i].stoi_envelopes, self.compare_features[j].stoi_envelopes)
+
+    def similarity(self, i, j, metrics='swass'):
+        """
+        Calculate audio similarity metrics between an original and a compare audio file.
+
+        Args:
+            i (int): Index of the original audio file.
+            j (int): Index of the compare audio file.
+            metrics (str or list): 'swass' for the Stent Weighted Audio Similarity Score, 'all' for all metrics and
+                the SWASS, or a list of metric names. Default is 'swass'.
 
         Returns:
-            float: The average spectral contrast similarity score between the audio files, normalized between 0 and 1.
+            If metrics is 'swass':
+                float: The Stent Weighted Audio Similarity Score (SWASS) of the pair.
+            Otherwise:
+                dict: The requested metrics of the pair, keyed by metric name.
 
         Raises:
-            None
+            IndexError: If an index is out of range.
+            ValueError: If an unknown metric is requested.
 
         Notes:
-            The spectral contrast similarity is calculated by comparing the spectral contrast of the audio signals.
-            Spectral contrast measures the difference in magnitudes between peaks and valleys in the spectrum,
-            representing the perceived amount of spectral emphasis. The spectral contrast similarity score is
-            obtained by comparing the spectral contrast of the original and compare audio files and calculating
-            the average normalized similarity. The similarity score ranges between 0 and 1, where a higher score
-            indicates greater similarity.
+            Only the requested metrics are calculated. For the SWASS, metrics with a weight of zero are skipped.
 
         """
-        logging.info("Calculating spectral contrast similarity...")
-        if not self.original_audios or not self.compare_audios:
-            logging.info("No audio files loaded.")
-            return None
+        weights = self.metric_weights()
+        names = self.resolve_metrics(metrics)
 
-        total_spectral_contrast_similarity = 0
-        count = 0
+        values = {name: getattr(self, name)(i, j) for name in names}
+        if metrics == 'swass':
+            return float(sum(weights[name] * values[name] for name in names))
+        if metrics == 'all':
+            values['swass'] = float(sum(weights[name] * values[name] for name in names))
+        return values
 
-        for original_audio in self.original_audios:
-            original_contrast = librosa.feature.spectral_contrast(y=original_audio, sr=self.sample_rate)
-            min_columns = original_contrast.shape[1]
+    def windowed_similarity(self, i, j, metrics='all', window_seconds=30.0, hop_seconds=10.0, aggregate='max'):
+        """
+        Calculate audio similarity metrics between an original and a compare audio file segment by segment.
 
-            for compare_audio in self.compare_audios:
-                compare_contrast = librosa.feature.spectral_contrast(y=compare_audio, sr=self.sample_rate)
-                min_columns = min(min_columns, compare_contrast.shape[1])
+        Args:
+            i (int): Index of the original audio file.
+            j (int): Index of the compare audio file.
+            metrics (str or list): 'swass' for the Stent Weighted Audio Similarity Score, 'all' for all metrics and
+                the SWASS, or a list of metric names. Default is 'all'.
+            window_seconds (float): Duration of the compared segments. Default is 30 seconds.
+            hop_seconds (float): Offset between consecutive segments. Default is 10 seconds.
+            aggregate (str): How window scores are combined, 'max' or 'mean'. Default is 'max'.
 
-            original_contrast = original_contrast[:, :min_columns]
+        Returns:
+            If metrics is 'swass':
+                float: The windowed Stent Weighted Audio Similarity Score (SWASS) of the pair.
+            Otherwise:
+                dict: The requested windowed metrics of the pair, keyed by metric name.
 
-            for compare_audio in self.compare_audios:
-                compare_contrast = librosa.feature.spectral_contrast(y=compare_audio, sr=self.sample_rate)
-                compare_contrast = compare_contrast[:, :min_columns]
-                contrast_similarity = np.mean(np.abs(original_contrast - compare_contrast))
-                normalized_similarity = 1 - contrast_similarity / np.max([np.abs(original_contrast), np.abs(compare_contrast)])
-                total_spectral_contrast_similarity += normalized_similarity
-                count += 1
+        Raises:
+            IndexError: If an index is out of range.
+            ValueError: If an unknown metric or aggregate is requested.
 
-        if count > 0:
-            return total_spectral_contrast_similarity / count
-        else:
-            logging.info("No original audio files loaded.")
-            return None
+        Notes:
+            Every segment of the shorter file is matched with its most similar segment of the longer file, so
+            long ambient loops that are trimmed or offset copies of each other score as similar. Rhythm uses the
+            onset strength envelope at frame rate instead of per-sample onset vectors. See compare_windows.
 
-    @lru_cache(maxsize=None)
-    def perceptual_similarity(self, sr=16000):
         """
-        Calculate the perceptual similarity between audio files using the Short-Time Objective Intelligibility (STOI) metric.
+        names = self.resolve_metrics(metrics)
+        values = compare_windows(
+            self.original_features[i],
+            self.compare_features[j],
+            self.sample_rate,
+            self.metric_weights(),
+            names,
+            window_seconds=window_seconds,
+            hop_seconds=hop_seconds,
+            aggregate=aggregate
+        )
+        if metrics == 'swass':
+            return values['swass']
+        if metrics != 'all':
+            del values['swass']
+        return values
+
+    def similarity_matrix(self, metrics='all'):
+        """
+        Calculate audio similarity metrics for all pairs of original and compare audio files.
 
         Args:
-            sr (int): Target sample rate for resampling the audio files. Default is 16000.
+            metrics (str or list): 'swass' for the Stent Weighted Audio Similarity Score, 'all' for all metrics and
+                the SWASS, or a list of metric names. Default is 'all'.
 
         Returns:
-            float: The average perceptual similarity score between the audio files, normalized between 0 and 1.
+            dict: Matrices with shape (num_original, num_compare) keyed by metric name, including 'swass' if
+                metrics is 'swass' or 'all'.
 
         Raises:
-            None
+            ValueError: If an unknown metric is requested.
 
         Notes:
-            The perceptual similarity is calculated using the Short-Time Objective Intelligibility (STOI) metric.
-            STOI measures the similarity of two audio signals in terms of their intelligibility. The STOI score
-            ranges between -1 and 1, where a higher score indicates greater similarity. The perceptual similarity
-            score is obtained by normalizing the STOI score between 0 and 1, where 0 indicates no similarity and 1
-            indicates perfect similarity.
+            Each pair is scored exactly once, in batched passes over the stacked features by similarity_tensor.
+            Every pair is compared over its own common length, so the values match the pairwise methods. If the
+            original and compare files are the same, only the upper triangle is scored by
+            condensed_similarity_matrix and the matrices are mirrored from it, with a similarity of 1 for every
+            file compared with itself.
 
         """
-        logging.info("Calculating perceptual similarity...")
-        if not self.original_audios or not self.compare_audios:
-            logging.info("No audio files loaded.")
-            return None
+        weights = self.metric_weights()
+        names = self.resolve_metrics(metrics)
+
+        if self.symmetric:
+            condensed = self.condensed_similarity_matrix(names)
+            matrices = {name: to_square(condensed[name]) for name in names}
+        elif self.use_pool(len(self.original_features) * len(self.compare_features)):
+            rows, columns = self.pool_indices()
+            matrices = dict(zip(names, self.similarity_pool().tensor(rows, columns, names)))
+        else:
+            matrices = dict(zip(names, similarity_tensor(self.original_features, self.compare_features, names)))
+        if metrics in ('swass', 'all'):
+            matrices['swass'] = sum(
+                (weights[name] * matrices[name] for name in names),
+                np.zeros((len(self.original_features), len(self.compare_features)))
+            )
+        return matrices
+
+    def condensed_similarity_matrix(self, metrics='all'):
+        """
+        Calculate audio similarity metrics for all pairs of distinct files when original and compare files are the same.
+
+        Args:
+            metrics (str or list): 'swass' for the Stent Weighted Audio Similarity Score, 'all' for all metrics and
+                the SWASS, or a list of metric names. Default is 'all'.
+
+        Returns:
+            dict: Condensed vectors with n * (n - 1) / 2 values keyed by metric name, including 'swass' if metrics
+                is 'swass' or 'all'. The values of the pairs i < j are stored in row-major order, so the vectors
+                can be expanded with to_square or scipy.spatial.distance.squareform.
 
-        total_perceptual_similarity = 0
-        count = 0
-
-        for i, original_audio in enumerate(self.original_audios):
-            for j, compare_audio in enumerate(self.compare_audios):
-                min_length = min(len(original_audio), len(compare_audio))
-                array1_16k = librosa.resample(y=original_audio[:min_length], orig_sr=self.sample_rate, target_sr=sr)
-                array2_16k = librosa.resample(y=compare_audio[:min_length], orig_sr=self.sample_rate, target_sr=sr)
-                score = pystoi.stoi(array1_16k, array2_16k, sr)
-                score_normalized = (score + 1) / 2
-                total_perceptual_similarity += score_normalized
-                count += 1
-
-        if count > 0:
-            return total_perceptual_similarity / count
+        Raises:
+            ValueError: If an unknown metric is requested, or the original and compare files differ.
+
+        Notes:
+            All metrics are symmetric in the two files, so scoring (j, i) after (i, j) and every file against
+            itself is wasted work. Only the upper triangle is scored, which halves compute and memory compared
+            to similarity_matrix on two different sets of files.
+
+        """
+        if not self.symmetric:
+            raise ValueError("Condensed similarities require the same original and compare audio files.")
+        weights = self.metric_weights()
+        names = self.resolve_metrics(metrics)
+
+        num_files = len(self.original_features)
+        if self.use_pool(num_files * (num_files - 1) // 2):
+            vectors = dict(zip(names, self.similarity_pool().condensed(names)))
         else:
-            logging.info("No original audio files loaded.")
-            return None
+            vectors = dict(zip(names, condensed_similarities(self.original_features, names)))
+        if metrics in ('swass', 'all'):
+            num_pairs = len(self.original_features) * (len(self.original_features) - 1) // 2
+            vectors['swass'] = sum((weights[name] * vectors[name] for name in names), np.zeros(num_pairs))
+        return vectors
+
+    def pool_features(self):
+        """
+        The unique feature records of the original and compare files, in the order they are shared with the pool.
+        """
+        return list({x.path: x for x in [*self.original_features, *self.compare_features]}.values())
+
+    def pool_indices(self):
+        """
+        Indices of the original and compare files in pool_features.
+        """
+        index = {x.path: i for i, x in enumerate(self.pool_features())}
+        return [index[x.path] for x in self.original_features], [index[x.path] for x in self.compare_features]
 
+    def use_pool(self, num_pairs):
+        """
+        Whether pairs are scored in the worker pool. Pairs that fit into a single tile are scored in-process.
+        """
+        return self.workers != 1 and num_pairs > SIMILARITY_POOL_MIN_PAIRS
+
+    def similarity_pool(self):
+        """
+        The worker pool scoring tiles of the similarity matrices, started on first use.
+
+        Returns:
+            SimilarityPool: The pool, sharing the features of all original and compare files.
+
+        Raises:
+            OSError: If the features cannot be shared with the workers.
+
+        """
+        if self.pool is None:
+            self.pool = SimilarityPool(self.pool_features(), workers=self.workers)
+        return self.pool
 
     def stent_weighted_audio_similarity(self, metrics='swass'):
         """
@@ -446,62 +912,29 @@ class AudioSimilarity:
             The Stent Weighted Audio Similarity Score (SWASS) measures the overall similarity between two sets of audio files
             based on multiple audio similarity metrics. It takes into account the weights assigned to each metric to calculate
             a weighted average similarity score. The SWASS value ranges between 0 and 1, where 0 indicates no similarity and 1
-            indicates perfect similarity.
+            indicates perfect similarity. The metrics are averaged over the pairs scored by similarity_matrix. If the
+            original and compare files are the same, every file compared with itself is left out of the averages.
 
         """
-        if not self.original_audios or not self.compare_audios:
+        if not self.original_features or not self.compare_features:
             logging.error("No audio files loaded.")
             return None
 
-        num_original_audios = len(self.original_audios)
-        num_compare_audios = len(self.compare_audios)
-
-        zcr_similarities = np.zeros((num_original_audios, num_compare_audios))
-        rhythm_similarities = np.zeros((num_original_audios, num_compare_audios))
-        chroma_similarity = np.zeros((num_original_audios, num_compare_audios))
-        spectral_contrast_similarities = np.zeros((num_original_audios, num_compare_audios))
-        perceptual_similarities = np.zeros((num_original_audios, num_compare_audios))
-
-        for i, original_audio in enumerate(self.original_audios):
-            self.original_audio = original_audio
-            for j, compare_audio in enumerate(self.compare_audios):
-                self.compare_audio = compare_audio
-                zcr_similarities[i, j] = self.zcr_similarity()
-                rhythm_similarities[i, j] = self.rhythm_similarity()
-                chroma_similarity[i, j] = self.chroma_similarity()
-                spectral_contrast_similarities[i, j] = self.spectral_contrast_similarity()
-                perceptual_similarities[i, j] = self.perceptual_similarity()
-
-        weights = np.array(list(self.weights.values()))
-        similarities = (
-            weights[0] * zcr_similarities +
-            weights[1] * rhythm_similarities +
-            weights[2] * chroma_similarity +
-            weights[3] * spectral_contrast_similarities +
-            weights[4] * perceptual_similarities
-        )
-
-        total_similarity = np.sum(similarities)
-        count = num_original_audios * num_compare_audios
+        if metrics not in ('swass', 'all'):
+            logging.error("Invalid value for 'metrics'. Choose 'swass' or 'all'.")
+            return None
 
-        if metrics == 'all':
-            return {
-                'zcr_similarity': float(np.mean(zcr_similarities)),
-                'rhythm_similarity': float(np.mean(rhythm_similarities)),
-                'chroma_similarity': float(np.mean(chroma_similarity)),
-                'spectral_contrast_similarity': float(np.mean(spectral_contrast_similarities)),
-                'perceptual_similarity': float(np.mean(perceptual_similarities)),
-                'swass': float(total_similarity / count)
-            }
-        elif metrics == 'swass':
-            if count > 0:
-                return float(total_similarity / count)
-            else:
-                logging.error("No audio files loaded.")
+        if self.symmetric:
+            if len(self.original_features) < 2:
+                logging.error("At least two distinct audio files are required to compare the files with each other.")
                 return None
+            # The condensed vectors leave out the diagonal, which is 1 for every file compared with itself
+            matrices = self.condensed_similarity_matrix(metrics)
         else:
-            logging.error("Invalid value for 'metrics'. Choose 'swass' or 'all'.")
-            return None
+            matrices = self.similarity_matrix(metrics)
+        if metrics == 'swass':
+            return float(np.mean(matrices['swass']))
+        return {name: float(np.mean(matrix)) for name, matrix in matrices.items()}
 
 
     def plot(self, metrics=None, option='radar', figsize=(8, 6), alpha=0.5, title=None, dpi=300, savefig=False, fontsize=12, label_fontsize=10, title_fontsize=14, color1='blue', color2='green'):
@@ -534,24 +967,18 @@ class AudioSimilarity:
         if metrics is None:
             metrics = ['zcr_similarity', 'rhythm_similarity', 'chroma_similarity', 'perceptual_similarity', 'spectral_contrast_similarity', 'stent_weighted_audio_similarity']
 
+        # Average every metric over all pairs once and look the plotted values up from there
+        averages = self.stent_weighted_audio_similarity(metrics='all')
+        averages['stent_weighted_audio_similarity'] = averages['swass']
+
         if option == 'radar':
             num_metrics = len(metrics)
             angles = np.linspace(0, 2 * np.pi, num_metrics, endpoint=False)
             values = np.zeros(num_metrics)
 
             for i, metric in enumerate(metrics):
-                if metric == 'zcr_similarity':
-                    values[i] = self.zcr_similarity()
-                elif metric == 'rhythm_similarity':
-                    values[i] = self.rhythm_similarity()
-                elif metric == 'chroma_similarity':
-                    values[i] = self.chroma_similarity()
-                elif metric == 'perceptual_similarity':
-                    values[i] = self.perceptual_similarity()
-                elif metric == 'spectral_contrast_similarity':
-                    values[i] = self.spectral_contrast_similarity()
-                elif metric == 'stent_weighted_audio_similarity':
-                    values[i] = self.stent_weighted_audio_similarity(metrics='swass')
+                if metric in averages:
+                    values[i] = averages[metric]
 
             fig, ax = plt.subplots(figsize=figsize, dpi=dpi, subplot_kw={'projection': 'polar'})  # Set projection to 'polar' for radar chart
             ax.plot(angles, values, color=color2, alpha=alpha)
@@ -572,20 +999,7 @@ class AudioSimilarity:
             with warnings.catch_warnings():
                 warnings.simplefilter("ignore")
                 sys.stderr = null_stream
-                metric_values = []
-                for metric in metrics:
-                    if metric == 'zcr_similarity':
-                        metric_values.append(self.zcr_similarity())
-                    elif metric == 'rhythm_similarity':
-                        metric_values.append(self.rhythm_similarity())
-                    elif metric == 'chroma_similarity':
-                        metric_values.append(self.chroma_similarity())
-                    elif metric == 'perceptul_similarity':
-                        metric_values.append(self.perceptul_similarity())
-                    elif metric == 'spectral_contrast_similarity':
-                        metric_values.append(self.spectral_contrast_similarity())
-                    elif metric == 'stent_weighted_audio_similarity':
-                        metric_values.append(self.stent_weighted_audio_similarity())
+                metric_values = [averages[metric] for metric in metrics if metric in averages]
 
                 if len(metrics) != len(metric_values):
                     logging.info("Error: The number of metrics and metric values must be the same.")
@@ -614,37 +1028,14 @@ class AudioSimilarity:
             values = np.zeros(num_metrics)
 
             for i, metric in enumerate(metrics):
-                if metric == 'zcr_similarity':
-                    values[i] = self.zcr_similarity()
-                elif metric == 'rhythm_similarity':
-                    values[i] = self.rhythm_similarity()
-                elif metric == 'chroma_similarity':
-                    values[i] = self.chroma_similarity()
-                elif metric == 'perceptual_similarity':
-                    values[i] = self.perceptual_similarity()
-                elif metric == 'spectral_contrast_similarity':
-                    values[i] = self.spectral_contrast_similarity()
-                elif metric == 'stent_weighted_audio_similarity':
-                    values[i] = self.stent_weighted_audio_similarity()
+                if metric in averages:
+                    values[i] = averages[metric]
 
             fig = plt.figure(figsize=figsize, dpi=dpi)
 
             # Bar plot
             ax1 = fig.add_subplot(1, 2, 1)
-            metric_values = []
-            for metric in metrics:
-                if metric == 'zcr_similarity':
-                    metric_values.append(self.zcr_similarity())
-                elif metric == 'rhythm_similarity':
-                    metric_values.append(self.rhythm_similarity())
-                elif metric == 'chroma_similarity':
-                    metric_values.append(self.chroma_similarity())
-                elif metric == 'perceptual_similarity':
-                    metric_values.append(self.perceptual_similarity())
-                elif metric == 'spectral_contrast_similarity':
-                    metric_values.append(self.spectral_contrast_similarity())
-                elif metric == 'stent_weighted_audio_similarity':
-                    metric_values.append(self.stent_weighted_audio_similarity())
+            metric_values = [averages[metric] for metric in metrics if metric in averages]
 
             # Sort the metrics and values in descending order of values
             metric_values, metrics = zip(*sorted(zip(metric_values, metrics), reverse=True))
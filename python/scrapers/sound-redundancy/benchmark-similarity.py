@@ -0,0 +1,215 @@
+from typing import Optional
+import json
+import os
+import platform
+import tempfile
+import threading
+import time
+from pathlib import Path
+import numpy as np
+import typer
+from scipy.io import wavfile
+from scipy.signal import lfilter
+
+from audio_similarity import AudioSimilarity
+from candidate_index import CandidateIndex, candidate_recall, fingerprint
+from similarity_matrix import METRIC_NAMES, WEIGHTS
+
+KINDS = ['noise', 'rain', 'drone']
+
+
+def noise_bed(rng: np.random.Generator, num_samples: int) -> np.ndarray:
+    # Brownish noise: white noise through a leaky integrator
+    return lfilter([1.0], [1.0, -rng.uniform(0.95, 0.995)], rng.standard_normal(num_samples))
+
+
+def rain(rng: np.random.Generator, num_samples: int, sample_rate: int) -> np.ndarray:
+    # Poisson impulse train of short, exponentially decaying noise bursts
+    impulses = np.zeros(num_samples)
+    num_drops = rng.poisson(rng.uniform(20, 200) * num_samples / sample_rate)
+    impulses[rng.integers(0, num_samples, num_drops)] = rng.uniform(0.2, 1.0, num_drops)
+    burst_length = int(0.01 * sample_rate)
+    burst = rng.standard_normal(burst_length) * np.exp(-np.linspace(0, 8, burst_length))
+    return np.convolve(impulses, burst)[:num_samples] + 0.05 * rng.standard_normal(num_samples)
+
+
+def drone(rng: np.random.Generator, num_samples: int, sample_rate: int) -> np.ndarray:
+    # A few detuned partials with slow amplitude modulation
+    t = np.arange(num_samples) / sample_rate
+    fundamental = rng.uniform(55, 220)
+    signal = np.zeros(num_samples)
+    for partial in range(1, rng.integers(3, 7)):
+        frequency = fundamental * partial * rng.uniform(0.995, 1.005)
+        modulation = 1 + 0.3 * np.sin(2 * np.pi * rng.uniform(0.02, 0.2) * t + rng.uniform(0, 2 * np.pi))
+        signal += modulation * np.sin(2 * np.pi * frequency * t) / partial
+    return signal
+
+
+def synthesize_corpus(num_tracks: int, duration: float, sample_rate: int, duplicate_ratio: float, seed: int):
+    """
+    Generate a deterministic corpus of ambient loops and known near-duplicate pairs of them.
+    """
+    rng = np.random.default_rng(seed)
+    num_samples = int(duration * sample_rate)
+    num_duplicates = int(num_tracks * duplicate_ratio)
+    num_originals = num_tracks - num_duplicates
+
+    tracks = {}
+    for index in range(num_originals):
+        kind = KINDS[index % len(KINDS)]
+        if kind == 'noise':
+            audio = noise_bed(rng, num_samples)
+        elif kind == 'rain':
+            audio = rain(rng, num_samples, sample_rate)
+        else:
+            audio = drone(rng, num_samples, sample_rate)
+        tracks[f"{index:05d}-{kind}"] = 0.5 * audio / np.max(np.abs(audio))
+
+    # Near duplicates are time-shifted (the loop restarts at another point) or gain-changed copies
+    duplicates = []
+    originals = list(tracks)
+    for index in range(num_duplicates):
+        original = originals[rng.integers(len(originals))]
+        if index % 2 == 0:
+            name = f"{original}-shifted-{index}"
+            tracks[name] = np.roll(tracks[original], rng.integers(num_samples))
+        else:
+            name = f"{original}-gain-{index}"
+            tracks[name] = tracks[original] * rng.uniform(0.3, 0.9)
+        duplicates.append((original, name))
+    return tracks, duplicates
+
+
+def tree_rss_mb() -> float:
+    # Resident memory of this process and all its descendants, read from /proc in kilobytes. Decoding and
+    # scoring run in worker processes, so they are included.
+    total, pids = 0, [os.getpid()]
+    while pids:
+        pid = pids.pop()
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                total += next((int(line.split()[1]) for line in f if line.startswith("VmRSS:")), 0)
+            for task in os.listdir(f"/proc/{pid}/task"):
+                with open(f"/proc/{pid}/task/{task}/children") as f:
+                    pids.extend(int(x) for x in f.read().split())
+        except (FileNotFoundError, ProcessLookupError):
+            continue
+    return total / 1024
+
+
+class RssSampler:
+    """
+    Peak resident memory of the process tree while a stage runs, sampled in a background thread.
+
+    ru_maxrss only ever grows over the lifetime of a process, so it reports the peak of the most expensive
+    stage so far for every later stage instead of the peak of the stage itself.
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak = 0.0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while True:
+            self.peak = max(self.peak, tree_rss_mb())
+            if self.stopped.wait(self.interval):
+                break
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stopped.set()
+        self.thread.join()
+        self.peak = max(self.peak, tree_rss_mb())
+
+
+def timed(report: dict, name: str, func, *args, **kwargs):
+    with RssSampler() as sampler:
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        report['timings'][name] = time.perf_counter() - start
+    report['peak_rss_mb'][name] = sampler.peak
+    return result
+
+
+def oracle_recall(pairs: set[tuple[int, int]], duplicates: list[tuple[int, int]]) -> float:
+    return candidate_recall(pairs, {(min(i, j), max(i, j)) for i, j in duplicates})
+
+
+def benchmark_similarity(
+    output: Path = Path("benchmark.json"),
+    num_tracks: int = 60,
+    duration: float = 20.0,
+    sample_rate: int = 22050,
+    duplicate_ratio: float = 0.2,
+    seed: int = 0,
+    workers: Optional[int] = None,
+    top_k: int = 5,
+    audio_dir: Optional[Path] = None,
+):
+    report = dict(
+        config=dict(
+            num_tracks=num_tracks,
+            duration=duration,
+            sample_rate=sample_rate,
+            duplicate_ratio=duplicate_ratio,
+            seed=seed,
+            workers=workers,
+            top_k=top_k,
+        ),
+        platform=dict(python=platform.python_version(), numpy=np.__version__, machine=platform.machine()),
+        timings={},
+        peak_rss_mb={},
+    )
+
+    tracks, duplicates = timed(report, 'synthesize', synthesize_corpus, num_tracks, duration, sample_rate, duplicate_ratio, seed)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        corpus_dir = audio_dir or Path(tmp_dir)
+        corpus_dir.mkdir(parents=True, exist_ok=True)
+        for name, audio in tracks.items():
+            wavfile.write(corpus_dir / f"{name}.wav", sample_rate, audio.astype(np.float32))
+        del tracks
+
+        similarity = timed(
+            report, 'load',
+            AudioSimilarity, str(corpus_dir), str(corpus_dir), sample_rate,
+            weights=WEIGHTS, verbose=False, sample_size=None, workers=workers
+        )
+
+    # The worker pool that scores the matrices is shut down once they are computed
+    with similarity:
+        for name in METRIC_NAMES:
+            timed(report, name, similarity.similarity_matrix, [name])
+        swass = timed(report, 'swass', similarity.similarity_matrix, 'swass')['swass']
+
+    # The known near-duplicate pairs are the correctness oracle: every copy should be the closest match of its
+    # original, both for the exhaustive SWASS and for the approximate candidate pairs.
+    index_by_name = {Path(x.path).stem: i for i, x in enumerate(similarity.original_features)}
+    duplicate_pairs = [(index_by_name[a], index_by_name[b]) for a, b in duplicates]
+    np.fill_diagonal(swass, -np.inf)
+    nearest = np.argmax(swass, axis=1)
+    exhaustive_pairs = {(min(i, int(j)), max(i, int(j))) for i, j in enumerate(nearest)}
+
+    fingerprints = np.stack([fingerprint(x) for x in similarity.original_features])
+    candidate_pairs = timed(report, 'candidates', lambda: CandidateIndex(fingerprints).candidate_pairs(top_k))
+
+    report['oracle'] = dict(
+        duplicate_pairs=len(duplicate_pairs),
+        exhaustive_nearest_recall=oracle_recall(exhaustive_pairs, duplicate_pairs),
+        candidate_recall=oracle_recall(set(candidate_pairs), duplicate_pairs),
+        candidate_pairs=len(candidate_pairs),
+    )
+
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    for name, seconds in report['timings'].items():
+        typer.echo(f"{name:>30}: {seconds:8.3f}s  peak RSS {report['peak_rss_mb'][name]:8.1f} MB")
+    typer.echo(f"Oracle recall: {json.dumps(report['oracle'])}")
+
+
+if __name__ == "__main__":
+    typer.run(benchmark_similarity)
@@ -0,0 +1,186 @@
+import numpy as np
+
+# Target number of tracks per hash bucket when the number of hyperplanes is derived from the corpus size
+BUCKET_SIZE = 8
+
+
+def fingerprint(features):
+    """
+    Summarize an AudioFeatures record as a compact, fixed-size vector.
+
+    Args:
+        features (AudioFeatures): The feature record of an audio file.
+
+    Returns:
+        np.ndarray: Mean and standard deviation of the chroma, spectral contrast and MFCC frames, followed by the
+            zero-crossing rate and the number of onsets per second of audio frames.
+
+    Raises:
+        None
+
+    """
+    frames = [features.chroma, features.spectral_contrast, features.mfcc]
+    num_frames = max(features.chroma.shape[1], 1)
+    return np.concatenate([
+        *(np.mean(x, axis=1) for x in frames),
+        *(np.std(x, axis=1) for x in frames),
+        [features.zcr, len(features.onsets) / num_frames],
+    ]).astype(np.float32)
+
+
+def normalize_fingerprints(fingerprints):
+    """
+    Standardize every fingerprint dimension over the corpus and scale each fingerprint to unit length.
+
+    Args:
+        fingerprints (np.ndarray): Fingerprints with shape (files, dimensions).
+
+    Returns:
+        np.ndarray: The normalized fingerprints. The dot product of two rows is their cosine similarity.
+
+    Raises:
+        None
+
+    """
+    fingerprints = np.asarray(fingerprints, dtype=np.float32)
+    std = fingerprints.std(axis=0)
+    standardized = (fingerprints - fingerprints.mean(axis=0)) / np.where(std > 0, std, 1)
+    norms = np.linalg.norm(standardized, axis=1, keepdims=True)
+    return standardized / np.where(norms > 0, norms, 1)
+
+
+class CandidateIndex:
+    """
+    Approximate nearest neighbour index over track fingerprints based on random hyperplane hashing.
+
+    Args:
+        fingerprints (np.ndarray): Fingerprints with shape (files, dimensions), see fingerprint.
+        num_tables (int): Number of independent hash tables. More tables raise recall at the cost of more
+            candidates to re-rank. Default is 16.
+        num_bits (int): Number of hyperplanes per table. More bits make buckets smaller. Default is None, which
+            picks the number of bits that puts about BUCKET_SIZE tracks into each bucket.
+        seed (int): Seed of the random hyperplanes. Default is 0.
+
+    Raises:
+        None
+
+    Notes:
+        Each table hashes a fingerprint to the signs of its projections onto random hyperplanes, so fingerprints
+        with a small angle between them are likely to share a bucket in at least one table. The tracks sharing a
+        bucket with a query are re-ranked by their exact cosine similarity, which keeps the cost per query
+        proportional to the bucket sizes instead of the corpus size.
+
+    """
+    def __init__(self, fingerprints, num_tables=16, num_bits=None, seed=0):
+        self.fingerprints = normalize_fingerprints(fingerprints)
+        if num_bits is None:
+            num_bits = max(1, int(np.log2(max(len(self.fingerprints), 1) / BUCKET_SIZE)))
+        rng = np.random.default_rng(seed)
+        self.hyperplanes = rng.standard_normal((num_tables, self.fingerprints.shape[1], num_bits)).astype(np.float32)
+        self.bit_weights = 1 << np.arange(num_bits, dtype=np.int64)
+
+        self.codes = np.stack([self.hash(table, self.fingerprints) for table in range(num_tables)])
+        self.buckets = []
+        for codes in self.codes:
+            table = {}
+            for index, code in enumerate(codes):
+                table.setdefault(int(code), []).append(index)
+            self.buckets.append({code: np.array(indices) for code, indices in table.items()})
+
+    def hash(self, table, fingerprints):
+        return ((fingerprints @ self.hyperplanes[table]) > 0) @ self.bit_weights
+
+    def neighbours(self, index, top_k):
+        """
+        Find the approximate nearest neighbours of an indexed track.
+
+        Args:
+            index (int): Index of the track.
+            top_k (int): Number of neighbours to return.
+
+        Returns:
+            tuple: Indices of the neighbours and their cosine similarities, most similar first.
+
+        Raises:
+            None
+
+        """
+        candidates = np.unique(np.concatenate([
+            buckets[int(codes[index])] for buckets, codes in zip(self.buckets, self.codes)
+        ]))
+        candidates = candidates[candidates != index]
+        scores = self.fingerprints[candidates] @ self.fingerprints[index]
+        order = np.argsort(-scores)[:top_k]
+        return candidates[order], scores[order]
+
+    def candidate_pairs(self, top_k):
+        """
+        Collect the candidate pairs formed by every track and its approximate top-k neighbours.
+
+        Args:
+            top_k (int): Number of neighbours per track.
+
+        Returns:
+            list: Sorted, unique pairs of indices (i, j) with i < j.
+
+        Raises:
+            None
+
+        """
+        pairs = set()
+        for index in range(len(self.fingerprints)):
+            for neighbour in self.neighbours(index, top_k)[0]:
+                pairs.add((min(index, int(neighbour)), max(index, int(neighbour))))
+        return sorted(pairs)
+
+
+def exhaustive_pairs(similarity, top_k=None, threshold=None):
+    """
+    Select the reference pairs of an exhaustive similarity matrix that candidate generation should find.
+
+    Args:
+        similarity (np.ndarray): Square, symmetric similarity matrix, such as the SWASS of all pairs.
+        top_k (int): Select every track's top-k most similar tracks. Default is None.
+        threshold (float): Select all pairs with at least this similarity. Default is None.
+
+    Returns:
+        set: Pairs of indices (i, j) with i < j.
+
+    Raises:
+        ValueError: If neither or both of top_k and threshold are given.
+
+    """
+    if (top_k is None) == (threshold is None):
+        raise ValueError("Expected exactly one of top_k and threshold.")
+
+    similarity = np.array(similarity, dtype=np.float64)
+    np.fill_diagonal(similarity, -np.inf)
+    if threshold is not None:
+        rows, columns = np.nonzero(np.triu(similarity >= threshold, k=1))
+        return set(zip(rows.tolist(), columns.tolist()))
+
+    pairs = set()
+    for index, row in enumerate(similarity):
+        for neighbour in np.argsort(-row)[:top_k]:
+            pairs.add((min(index, int(neighbour)), max(index, int(neighbour))))
+    return pairs
+
+
+def candidate_recall(candidates, reference):
+    """
+    Calculate the fraction of reference pairs that were found by candidate generation.
+
+    Args:
+        candidates (iterable): Candidate pairs (i, j) with i < j.
+        reference (set): Reference pairs (i, j) with i < j, see exhaustive_pairs.
+
+    Returns:
+        float: The recall between 0 and 1, or 1 if there are no reference pairs.
+
+    Raises:
+        None
+
+    """
+    if not reference:
+        return 1.0
+    return len(reference & set(candidates)) / len(reference)
@@ -0,0 +1,20 @@
+import numpy as np
+import pytest
+
+from audio_similarity import extract_features
+
+SAMPLE_RATE = 22050
+
+
+@pytest.fixture(scope='module')
+def features():
+    rng = np.random.default_rng(0)
+    t = np.arange(2 * SAMPLE_RATE) / SAMPLE_RATE
+    signals = [
+        0.3 * np.sin(2 * np.pi * 220 * t),
+        0.3 * np.sin(2 * np.pi * 330 * t[:int(1.5 * SAMPLE_RATE)]),
+        0.1 * rng.standard_normal(len(t)),
+        0.1 * rng.standard_normal(int(2.5 * SAMPLE_RATE)),
+        0.2 * np.sign(np.sin(2 * np.pi * 2 * t)) * rng.standard_normal(len(t)),
+    ]
+    return [extract_features(x.astype(np.float32), SAMPLE_RATE, path=f"{i}.wav") for i, x in enumerate(signals)]
@@ -0,0 +1,98 @@
+import hashlib
+import librosa
+import numpy as np
+
+
+def perceptual_hash(audio, log_mel, sample_rate, hop_length, num_bands=16, block_seconds=1.0, max_frequency=6000.0):
+    """
+    Calculate a hash of decoded audio that survives re-encoding and gain changes.
+
+    Args:
+        audio (np.ndarray): The decoded mono signal the spectrogram was calculated from.
+        log_mel (np.ndarray): Log-mel spectrogram in dB with shape (mels, frames).
+        sample_rate (int): Sample rate the spectrogram was calculated at.
+        hop_length (int): Hop length of the spectrogram frames in samples.
+        num_bands (int): Number of coarse frequency bands the mel bands are pooled into. Default is 16.
+        block_seconds (float): Duration of the coarse time blocks the frames are pooled into. Default is 1 second.
+        max_frequency (float): Mel bands centered above this frequency are ignored. Default is 6 kHz.
+
+    Returns:
+        str: The hex digest of the quantized signature.
+
+    Raises:
+        None
+
+    Notes:
+        The spectrogram is downsampled to coarse bands and blocks, and every bit records whether the energy
+        difference between two neighbouring bands rises or falls from one block to the next. Only the sign of
+        differences is kept, so a constant gain, small codec noise and resampling do not change the signature.
+        The number of frames is part of the digest, so signals of different lengths never share a hash. High
+        bands are ignored because lossy encoders low-pass them at bitrate dependent cutoffs.
+
+        Signals shorter than two blocks have no change between blocks to record, and silent or constant signals
+        set no bits, so their signatures would match unrelated audio. They are hashed by their exact samples
+        instead, which only matches identical decoded audio.
+
+    """
+    num_frames = log_mel.shape[1]
+    frames_per_block = max(1, int(round(block_seconds * sample_rate / hop_length)))
+    num_blocks = num_frames // frames_per_block
+    if num_blocks < 2 or np.ptp(audio) == 0:
+        digest = hashlib.sha256(np.ascontiguousarray(audio).tobytes())
+        digest.update(f"content:{num_frames}".encode())
+        return digest.hexdigest()
+
+    centers = librosa.mel_frequencies(log_mel.shape[0] + 2, fmax=sample_rate / 2)[1:-1]
+    log_mel = np.asarray(log_mel, dtype=np.float64)[centers <= max_frequency]
+    bands = np.array_split(log_mel[:, :num_blocks * frames_per_block], num_bands, axis=0)
+    energy = np.stack([band.mean(axis=0) for band in bands])
+    energy = energy.reshape(num_bands, num_blocks, -1).mean(axis=2)
+
+    bits = np.diff(np.diff(energy, axis=0), axis=1) > 0
+    digest = hashlib.sha256(np.packbits(bits).tobytes())
+    digest.update(f"perceptual:{num_frames}".encode())
+    return digest.hexdigest()
+
+
+def group_duplicates(keys):
+    """
+    Group items that share any of their keys, such as a content hash or a perceptual hash.
+
+    Args:
+        keys (list): One tuple of keys per item. Keys are only compared with keys at the same position, and
+            None never matches.
+
+    Returns:
+        list: Groups of item indices in ascending order, the first item being the representative of the group.
+            Items without duplicates form a group of their own.
+
+    Raises:
+        None
+
+    Notes:
+        Groups are merged transitively with a union-find, so a file that is byte-identical to one file and
+        decodes to the same audio as another ends up in one group with both.
+
+    """
+    parents = list(range(len(keys)))
+
+    def root(item):
+        while parents[item] != item:
+            parents[item] = parents[parents[item]]
+            item = parents[item]
+        return item
+
+    first_with_key = {}
+    for item, item_keys in enumerate(keys):
+        for position, key in enumerate(item_keys):
+            if key is None:
+                continue
+            other = first_with_key.setdefault((position, key), item)
+            a, b = root(item), root(other)
+            if a != b:
+                parents[max(a, b)] = min(a, b)
+
+    groups = {}
+    for item in range(len(keys)):
+        groups.setdefault(root(item), []).append(item)
+    return list(groups.values())
@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from functools import lru_cache
+import numpy as np
+
+
+@lru_cache(maxsize=None)
+def _file_hash(path, mtime_ns, size, chunk_size):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """
+    Calculate the SHA-256 of a file's bytes.
+
+    Args:
+        path (str): Path to the file.
+        chunk_size (int): Number of bytes hashed at a time. Default is 1 MiB.
+
+    Returns:
+        str: The hex digest of the file content.
+
+    Raises:
+        OSError: If the file cannot be read.
+
+    Notes:
+        Digests are memoized per path, modification time and size, so hashing the same unchanged file for the
+        feature store and for the similarity store only reads it once per process.
+
+    """
+    stat = os.stat(path)
+    return _file_hash(os.path.abspath(path), stat.st_mtime_ns, stat.st_size, chunk_size)
+
+
+class FeatureStore:
+    """
+    Content-addressed on-disk store for per-file audio features.
+
+    Args:
+        root (str): Directory the features are stored in. Created if it does not exist.
+
+    Raises:
+        None
+
+    Notes:
+        Entries are keyed by the SHA-256 of the audio file bytes together with the parameters the features were
+        extracted with, so renamed or moved files hit the cache while re-encoded files or changed extraction
+        parameters miss it. Each entry is a directory holding one .npy file per array and a meta.json with the
+        scalar values. Arrays are loaded memory-mapped, so opening a large store is cheap. Entries are written to
+        a temporary directory first and renamed into place, so an interrupted run never leaves a partial entry.
+
+    """
+    def __init__(self, root):
+        self.root = str(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    @staticmethod
+    def content_key(path, chunk_size=1 << 20, **params):
+        """
+        Calculate the store key of an audio file.
+
+        Args:
+            path (str): Path to the audio file.
+            chunk_size (int): Number of bytes hashed at a time. Default is 1 MiB.
+            **params: Parameters the features depend on, such as the sample rate.
+
+        Returns:
+            str: The hex digest identifying the file content and parameters.
+
+        Raises:
+            OSError: If the file cannot be read.
+
+        """
+        digest = hashlib.sha256(file_hash(path, chunk_size).encode())
+        digest.update(json.dumps(params, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def __contains__(self, key):
+        return os.path.isfile(os.path.join(self.entry_path(key), 'meta.json'))
+
+    def load(self, key, mmap_mode='r'):
+        """
+        Load the entry stored under a key.
+
+        Args:
+            key (str): The store key.
+            mmap_mode (str): Memory-map mode passed to np.load. Default is 'r'.
+
+        Returns:
+            dict or None: The stored values, or None if the key is not in the store.
+
+        Raises:
+            None
+
+        """
+        entry_path = self.entry_path(key)
+        try:
+            with open(os.path.join(entry_path, 'meta.json'), 'r') as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return None
+
+        values = dict(meta['scalars'])
+        for name in meta['arrays']:
+            values[name] = np.load(os.path.join(entry_path, f"{name}.npy"), mmap_mode=mmap_mode)
+        return values
+
+    def save(self, key, values):
+        """
+        Store values under a key. Existing entries are left untouched.
+
+        Args:
+            key (str): The store key.
+            values (dict): Mapping of names to numpy arrays or JSON-serializable scalars.
+
+        Returns:
+            None
+
+        Raises:
+            None
+
+        """
+        entry_path = self.entry_path(key)
+        if key in self:
+            return
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+
+        tmp_path = tempfile.mkdtemp(dir=os.path.dirname(entry_path), prefix=f".{key}.")
+        try:
+            arrays = [name for name, value in values.items() if isinstance(value, np.ndarray)]
+            for name in arrays:
+                np.save(os.path.join(tmp_path, f"{name}.npy"), values[name])
+            scalars = {name: value for name, value in values.items() if name not in arrays}
+            with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+                json.dump({'arrays': arrays, 'scalars': scalars}, f)
+            os.rename(tmp_path, entry_path)
+        except OSError:
+            # Another process stored the same entry first
+            if key not in self:
+                raise
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
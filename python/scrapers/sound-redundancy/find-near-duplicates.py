@@ -0,0 +1,103 @@
+from typing import Annotated, Optional
+import json
+import random
+from pathlib import Path
+import numpy as np
+import typer
+from rich.progress import track as track_progress
+
+from audio_decoding import DecodeOptions
+from audio_similarity import discover_audio_files, iter_features
+from candidate_index import CandidateIndex, candidate_recall, exhaustive_pairs, fingerprint
+from duplicate_groups import group_duplicates
+from feature_store import FeatureStore, file_hash
+from similarity_matrix import WEIGHTS, condensed_similarities, pair_similarities, to_square
+
+
+def load_all_features(audio_files: list[Path], sample_rate: int, feature_store: FeatureStore, workers: Optional[int], decode_options: DecodeOptions):
+    features = [None] * len(audio_files)
+    for index, feature in track_progress(
+        iter_features([str(f) for f in audio_files], sample_rate, feature_store, workers, decode_options=decode_options),
+        description="Extracting features...",
+        total=len(audio_files),
+    ):
+        features[index] = feature
+    return [(f, feature) for f, feature in zip(audio_files, features) if feature is not None]
+
+
+def swass(metrics: dict[str, np.ndarray]) -> np.ndarray:
+    return sum(WEIGHTS[name] * values for name, values in metrics.items())
+
+
+def report_recall(features: list, fingerprints: np.ndarray, sample_size: int, top_k: int, reference_top_k: int, num_tables: int, num_bits: Optional[int]):
+    # Compare the candidates of a random sample against the exhaustive SWASS ranking of the same sample
+    sample = sorted(random.sample(range(len(features)), min(sample_size, len(features))))
+    sample_features = [features[i] for i in sample]
+    metrics = [name for name, weight in WEIGHTS.items() if weight > 0]
+    exhaustive = to_square(swass(dict(zip(metrics, condensed_similarities(sample_features, metrics)))))
+
+    index = CandidateIndex(fingerprints[sample], num_tables=num_tables, num_bits=num_bits)
+    recall = candidate_recall(index.candidate_pairs(top_k), exhaustive_pairs(exhaustive, top_k=reference_top_k))
+    typer.echo(f"Recall of the exhaustive top-{reference_top_k} on {len(sample)} tracks with k={top_k}: {recall:.3f}")
+
+
+def find_near_duplicates(
+    audio_dirs: Annotated[list[Path], typer.Argument(exists=True, file_okay=False, dir_okay=True)],
+    output: Path = Path("candidates.json"),
+    sample_rate: int = 44100,
+    feature_store: Path = Path("features"),
+    top_k: int = 10,
+    num_tables: int = 16,
+    num_bits: Optional[int] = None,
+    workers: Optional[int] = None,
+    recall_sample: int = 0,
+    recall_top_k: int = 5,
+    decode_backend: str = 'auto',
+    offset: float = 0.0,
+    max_duration: Optional[float] = None,
+    resample_type: str = 'soxr_hq',
+):
+    audio_files = [Path(f) for f in discover_audio_files(*audio_dirs)]
+    typer.echo(f"Total of {len(audio_files)} audio files")
+
+    decode_options = DecodeOptions(backend=decode_backend, offset=offset, duration=max_duration, resample_type=resample_type)
+    audio_files, features = zip(*load_all_features(audio_files, sample_rate, FeatureStore(feature_store), workers, decode_options))
+
+    # Byte-identical files and files that decode to the same audio are collapsed into one representative
+    groups = group_duplicates([(file_hash(f), x.pcm_hash) for f, x in zip(audio_files, features)])
+    duplicates = [(audio_files[group[0]], audio_files[duplicate]) for group in groups for duplicate in group[1:]]
+    typer.echo(f"{len(duplicates)} exact or near-exact duplicates, {len(groups)} files left to compare")
+    audio_files = [audio_files[group[0]] for group in groups]
+    features = [features[group[0]] for group in groups]
+    fingerprints = np.stack([fingerprint(x) for x in features])
+
+    if recall_sample:
+        report_recall(features, fingerprints, recall_sample, top_k, recall_top_k, num_tables, num_bits)
+
+    # Only the approximate top-k neighbours of each track are scored with the full metrics
+    index = CandidateIndex(fingerprints, num_tables=num_tables, num_bits=num_bits)
+    pairs = index.candidate_pairs(top_k)
+    typer.echo(f"Scoring {len(pairs)} candidate pairs instead of {len(features) * (len(features) - 1) // 2}")
+
+    metrics = [name for name, weight in WEIGHTS.items() if weight > 0]
+    scores = dict(zip(metrics, pair_similarities(features, pairs, metrics)))
+    scores['swass'] = swass(scores)
+
+    results = [
+        dict(
+            audio_file_a=str(audio_files[i]),
+            audio_file_b=str(audio_files[j]),
+            **{name: float(values[position]) for name, values in scores.items()},
+        )
+        for position, (i, j) in enumerate(pairs)
+    ]
+    identical = {name: 1.0 for name in metrics}
+    identical['swass'] = float(swass(identical))
+    results += [dict(audio_file_a=str(a), audio_file_b=str(b), **identical) for a, b in duplicates]
+    results.sort(key=lambda x: x['swass'], reverse=True)
+    with open(output, "w") as f:
+        json.dump(results, f)
+
+
+if __name__ == "__main__":
+    typer.run(find_near_duplicates)
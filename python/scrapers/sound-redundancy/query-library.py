@@ -0,0 +1,45 @@
+from typing import Annotated, Optional
+import json
+from pathlib import Path
+import typer
+
+from audio_decoding import DecodeOptions
+from audio_library import AudioLibrary
+
+
+def query_library(
+    audio_dirs: Annotated[list[Path], typer.Argument(exists=True, file_okay=False, dir_okay=True)],
+    query: Annotated[list[Path], typer.Option(exists=True, file_okay=True, dir_okay=False)],
+    output: Optional[Path] = None,
+    sample_rate: int = 44100,
+    feature_store: Path = Path("features"),
+    top_k: int = 5,
+    min_swass: float = 0.9,
+    workers: Optional[int] = None,
+    add: bool = False,
+    decode_backend: str = 'auto',
+    offset: float = 0.0,
+    max_duration: Optional[float] = None,
+    resample_type: str = 'soxr_hq',
+):
+    decode_options = DecodeOptions(backend=decode_backend, offset=offset, duration=max_duration, resample_type=resample_type)
+    library = AudioLibrary(*audio_dirs, sample_rate=sample_rate, feature_store=feature_store, workers=workers, decode_options=decode_options)
+    typer.echo(f"Library of {len(library)} audio files")
+
+    results = []
+    for path in query:
+        matches = library.query(str(path), top_k=top_k)
+        redundant = bool(matches) and matches[0]['swass'] >= min_swass
+        results.append(dict(path=str(path.absolute()), redundant=redundant, matches=matches))
+        typer.echo(f"{path}: {'redundant with ' + matches[0]['path'] if redundant else 'new'}")
+        # Accepted files are compared against later queries of the same run
+        if add and not redundant:
+            library.add(str(path))
+
+    if output is not None:
+        with open(output, "w") as f:
+            json.dump(results, f)
+
+
+if __name__ == "__main__":
+    typer.run(query_library)
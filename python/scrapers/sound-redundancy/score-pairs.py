@@ -0,0 +1,135 @@
+from typing import Annotated, Optional
+import json
+from pathlib import Path
+import typer
+from rich.progress import track as track_progress
+
+from audio_decoding import DecodeOptions
+from audio_similarity import discover_audio_files, iter_features
+from duplicate_groups import group_duplicates
+from feature_store import FeatureStore, file_hash
+from similarity_graph import cluster_graph, recommendations, similarity_graph
+from similarity_matrix import WEIGHTS, similarity_tensor
+from similarity_store import SimilarityStore
+
+cli = typer.Typer()
+
+
+@cli.command()
+def run(
+    audio_dirs: Annotated[list[Path], typer.Argument(exists=True, file_okay=False, dir_okay=True)],
+    database: Path = Path("similarities.sqlite"),
+    sample_rate: int = 44100,
+    feature_store: Path = Path("features"),
+    workers: Optional[int] = None,
+    decode_backend: str = 'auto',
+    offset: float = 0.0,
+    max_duration: Optional[float] = None,
+    resample_type: str = 'soxr_hq',
+):
+    decode_options = DecodeOptions(backend=decode_backend, offset=offset, duration=max_duration, resample_type=resample_type)
+    audio_files = discover_audio_files(*audio_dirs)
+    typer.echo(f"Total of {len(audio_files)} audio files")
+
+    with SimilarityStore(database) as store:
+        hashes = {path: file_hash(path) for path in track_progress(audio_files, description="Hashing files...")}
+        store.add_files(hashes)
+
+        # Files with identical content are scored once, through a single representative
+        representatives = {}
+        for path, content_hash in hashes.items():
+            representatives.setdefault(content_hash, path)
+        unique_hashes = sorted(representatives)
+
+        features = {}
+        for index, feature in track_progress(
+            iter_features([representatives[h] for h in unique_hashes], sample_rate, FeatureStore(feature_store), workers, decode_options=decode_options),
+            description="Extracting features...",
+            total=len(unique_hashes),
+        ):
+            features[unique_hashes[index]] = feature
+        unique_hashes = [h for h in unique_hashes if h in features]
+
+        # Files that decode to the same audio are recorded as identical to one representative and not scored further
+        metrics = [name for name, weight in WEIGHTS.items() if weight > 0]
+        identical = {name: 1.0 for name in metrics}
+        identical['swass'] = sum(WEIGHTS[name] for name in metrics)
+        groups = group_duplicates([(features[h].pcm_hash,) for h in unique_hashes])
+        store.add_similarities(
+            (unique_hashes[group[0]], unique_hashes[duplicate], identical) for group in groups for duplicate in group[1:]
+        )
+        typer.echo(f"{len(unique_hashes) - len(groups)} files decode to the same audio as another file")
+        unique_hashes = [unique_hashes[group[0]] for group in groups]
+
+        # Score the upper triangle one row at a time. Each row is committed on its own, so a killed run resumes
+        # after the last committed row and already scored pairs are skipped through the primary key index.
+        # Every pair is compared over its own common length, so a resumed row scoring only the remaining
+        # partners stores the same values as an uninterrupted run.
+        scored_pairs = 0
+        for i, hash_a in enumerate(track_progress(unique_hashes, description="Scoring pairs...")):
+            scored = store.scored_partners(hash_a)
+            partners = [hash_b for hash_b in unique_hashes[i + 1:] if hash_b not in scored]
+            if not partners:
+                continue
+
+            tensor = similarity_tensor([features[hash_a]], [features[hash_b] for hash_b in partners], metrics)
+            rows = []
+            for j, hash_b in enumerate(partners):
+                scores = {name: float(tensor[k, 0, j]) for k, name in enumerate(metrics)}
+                scores['swass'] = sum(WEIGHTS[name] * scores[name] for name in metrics)
+                rows.append((hash_a, hash_b, scores))
+            store.add_similarities(rows)
+            scored_pairs += len(rows)
+
+    typer.echo(f"Scored {scored_pairs} new pairs")
+
+
+@cli.command()
+def export(
+    database: Annotated[Path, typer.Argument(exists=True, file_okay=True, dir_okay=False)],
+    output: Path = Path("similarities.json"),
+    min_swass: Optional[float] = None,
+):
+    with SimilarityStore(database) as store:
+        similarities = list(store.iter_similarities(min_swass=min_swass))
+    with open(output, "w") as f:
+        json.dump(similarities, f)
+    typer.echo(f"Exported {len(similarities)} similarities")
+
+
+@cli.command()
+def cluster(
+    database: Annotated[Path, typer.Argument(exists=True, file_okay=True, dir_okay=False)],
+    output: Path = Path("clusters.json"),
+    min_swass: float = 0.9,
+):
+    with SimilarityStore(database) as store:
+        paths_by_hash = {}
+        for path, content_hash in store.iter_files():
+            paths_by_hash.setdefault(content_hash, []).append(path)
+        hashes = sorted(paths_by_hash)
+        node_index = {content_hash: i for i, content_hash in enumerate(hashes)}
+        # Only pairs above the threshold are read, so memory grows with the number of edges rather than N²
+        graph = similarity_graph(
+            ((node_index[hash_a], node_index[hash_b], swass) for hash_a, hash_b, swass in store.iter_edges(min_swass)),
+            len(hashes),
+        )
+    typer.echo(f"Similarity graph with {len(hashes)} unique files and {graph.nnz // 2} edges")
+
+    # Nodes are unique contents, so a single node still forms a cluster if several paths share its content
+    clusters = []
+    for recommendation in recommendations(graph, cluster_graph(graph), min_size=1):
+        keep, *drop = paths_by_hash[hashes[recommendation['keep']]]
+        for node in recommendation['drop']:
+            drop.extend(paths_by_hash[hashes[node]])
+        if drop:
+            clusters.append(dict(keep=keep, drop=drop))
+    clusters.sort(key=lambda x: len(x['drop']), reverse=True)
+
+    with open(output, "w") as f:
+        json.dump(clusters, f)
+    typer.echo(f"Found {len(clusters)} clusters, {sum(len(x['drop']) for x in clusters)} files can be dropped")
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,128 @@
+import numpy as np
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+
+
+def _symmetric_csr(rows, columns, scores, num_nodes):
+    """
+    Build a symmetric CSR matrix from undirected edges. Self loops are dropped and duplicate edges are kept once.
+    """
+    first, second = np.minimum(rows, columns), np.maximum(rows, columns)
+    keep = first != second
+    first, second, scores = first[keep], second[keep], scores[keep]
+    _, unique = np.unique(first * num_nodes + second, return_index=True)
+    first, second, scores = first[unique], second[unique], scores[unique]
+    return sparse.csr_matrix(
+        (np.concatenate([scores, scores]), (np.concatenate([first, second]), np.concatenate([second, first]))),
+        shape=(num_nodes, num_nodes)
+    )
+
+
+def similarity_graph(edges, num_nodes, threshold=None):
+    """
+    Build a sparse similarity graph from an edge list.
+
+    Args:
+        edges (iterable): Tuples of (i, j, score) with the node indices of both files and their similarity.
+        num_nodes (int): Number of files in the graph.
+        threshold (float): Only keep edges with at least this score. Default is None, which keeps all edges.
+
+    Returns:
+        scipy.sparse.csr_matrix: Symmetric matrix with shape (num_nodes, num_nodes) holding the scores of the
+            kept edges as float32.
+
+    Raises:
+        None
+
+    Notes:
+        Memory grows with the number of kept edges rather than with the square of the number of files, so the
+        threshold decides how large the graph gets. Edges with a NaN score are dropped.
+
+    """
+    edges = np.array(list(edges), dtype=np.float64).reshape(-1, 3)
+    keep = ~np.isnan(edges[:, 2])
+    if threshold is not None:
+        keep &= edges[:, 2] >= threshold
+    edges = edges[keep]
+    return _symmetric_csr(edges[:, 0].astype(np.int64), edges[:, 1].astype(np.int64), edges[:, 2].astype(np.float32), num_nodes)
+
+
+def condensed_graph(condensed, threshold):
+    """
+    Build a sparse similarity graph from condensed upper-triangle scores, see condensed_similarities.
+
+    Args:
+        condensed (np.ndarray): Scores of the pairs i < j in row-major order.
+        threshold (float): Only keep edges with at least this score.
+
+    Returns:
+        scipy.sparse.csr_matrix: Symmetric matrix holding the scores of the kept edges as float32.
+
+    Raises:
+        ValueError: If the length of condensed is not a triangular number.
+
+    """
+    condensed = np.asarray(condensed)
+    num_nodes = int(np.ceil(np.sqrt(2 * len(condensed))))
+    if num_nodes * (num_nodes - 1) // 2 != len(condensed):
+        raise ValueError(f"Invalid condensed length: {len(condensed)}.")
+
+    positions = np.flatnonzero(condensed >= threshold)
+    # Invert the row-major upper-triangle position k = n * i - i * (i + 1) / 2 + j - i - 1
+    rows = (num_nodes - 2 - np.floor(np.sqrt(-8 * positions + 4 * num_nodes * (num_nodes - 1) - 7) / 2 - 0.5)).astype(np.int64)
+    columns = positions + rows + 1 - num_nodes * (num_nodes - 1) // 2 + (num_nodes - rows) * (num_nodes - rows - 1) // 2
+    return _symmetric_csr(rows, columns, condensed[positions].astype(np.float32), num_nodes)
+
+
+def cluster_graph(graph):
+    """
+    Cluster files into the connected components of a similarity graph.
+
+    Args:
+        graph (scipy.sparse.spmatrix): Symmetric similarity graph, see similarity_graph.
+
+    Returns:
+        np.ndarray: The cluster label of every node.
+
+    Raises:
+        None
+
+    Notes:
+        Two files end up in the same cluster if they are connected through a chain of edges above the
+        threshold, like single-linkage clustering cut at the threshold. Runs in linear time in the number of
+        nodes and edges.
+
+    """
+    _, labels = connected_components(graph, directed=False)
+    return labels
+
+
+def recommendations(graph, labels, min_size=2):
+    """
+    Recommend which file of every cluster to keep and which to drop.
+
+    Args:
+        graph (scipy.sparse.spmatrix): Symmetric similarity graph, see similarity_graph.
+        labels (np.ndarray): Cluster label of every node, see cluster_graph.
+        min_size (int): Only report clusters with at least this many nodes. Default is 2.
+
+    Returns:
+        list: Dicts with the node index to 'keep' and the node indices to 'drop', largest clusters first.
+
+    Raises:
+        None
+
+    Notes:
+        The kept file is the one with the highest summed similarity to the rest of its cluster, which is the
+        most representative member. Ties are broken by the lowest node index.
+
+    """
+    strength = np.asarray(graph.sum(axis=1)).ravel()
+    order = np.lexsort((np.arange(len(labels)), -strength, labels))
+    sizes = np.bincount(labels)
+    clusters = []
+    for members in np.split(order, np.cumsum(sizes)[:-1]):
+        if len(members) >= min_size:
+            clusters.append(dict(keep=int(members[0]), drop=members[1:].tolist()))
+    clusters.sort(key=lambda x: len(x['drop']), reverse=True)
+    return clusters
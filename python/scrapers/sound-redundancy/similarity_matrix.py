@@ -0,0 +1,515 @@
+import numpy as np
+from pystoi import utils as stoi_utils
+from pystoi.stoi import FS, N, N_FRAME, NFFT, OBM
+from scipy import sparse
+from scipy.spatial.distance import cdist, squareform
+
+# STOI compares signals at 10 kHz, in segments of N = 30 STFT frames of third-octave band envelopes
+PERCEPTUAL_SAMPLE_RATE = FS
+PERCEPTUAL_HOP_LENGTH = N_FRAME // 2
+PERCEPTUAL_SEGMENT_FRAMES = N
+
+# Hop length in samples shared by all frame features
+HOP_LENGTH = 512
+
+METRIC_NAMES = [
+    'zcr_similarity',
+    'rhythm_similarity',
+    'chroma_similarity',
+    'spectral_contrast_similarity',
+    'perceptual_similarity'
+]
+
+# Default weights of the metrics in the Stent Weighted Audio Similarity Score (SWASS)
+WEIGHTS = {
+    'zcr_similarity': 0.25,
+    'rhythm_similarity': 0.25,
+    'chroma_similarity': 0.25,
+    'spectral_contrast_similarity': 0.25,
+    'perceptual_similarity': 0.0
+}
+
+# Upper bound for the temporary float64 copies made while computing one tile of an L1 distance matrix
+TILE_MEMORY_BUDGET = 256 * 1024 * 1024
+
+
+def stack_frames(matrices, num_frames):
+    """
+    Stack per-file frame features into a single (files, features * frames) array.
+
+    Args:
+        matrices (list): Per-file feature matrices with shape (features, frames).
+        num_frames (int): Number of leading frames kept from each file. Shorter files are zero padded.
+
+    Returns:
+        np.ndarray: The flattened, stacked feature matrices.
+
+    Raises:
+        None
+
+    """
+    stacked = np.zeros((len(matrices), matrices[0].shape[0] if matrices else 0, num_frames), dtype=np.float32)
+    for k, matrix in enumerate(matrices):
+        frames = min(matrix.shape[1], num_frames)
+        stacked[k, :, :frames] = matrix[:, :frames]
+    return stacked.reshape(len(matrices), -1)
+
+
+def cumulative_frame_norms(matrices, num_frames):
+    """
+    Cumulative L1 norm of the leading frames of every file, with shape (files, num_frames + 1).
+
+    Column L holds the summed absolute values of the first L frames. Files shorter than num_frames repeat their
+    total, so the array can be indexed with any frame count up to num_frames.
+    """
+    norms = np.zeros((len(matrices), num_frames + 1))
+    for k, matrix in enumerate(matrices):
+        frames = min(matrix.shape[1], num_frames)
+        norms[k, 1:frames + 1] = np.cumsum(np.abs(matrix[:, :frames]).sum(axis=0, dtype=np.float64))
+        norms[k, frames + 1:] = norms[k, frames]
+    return norms
+
+
+def blocked_cityblock(a, b, block_size=None):
+    """
+    Calculate all pairwise L1 distances between the rows of two matrices, one tile at a time.
+
+    Args:
+        a (np.ndarray): Matrix with shape (n, d).
+        b (np.ndarray): Matrix with shape (m, d).
+        block_size (int): Number of rows per tile. Default is None, which derives it from TILE_MEMORY_BUDGET.
+
+    Returns:
+        np.ndarray: The distance matrix with shape (n, m).
+
+    Raises:
+        None
+
+    Notes:
+        cdist converts its inputs to float64. Tiling bounds that copy to the rows of the current tile instead of
+        both full inputs, which matters for long files with hundreds of thousands of feature values each.
+
+    """
+    if block_size is None:
+        block_size = max(1, TILE_MEMORY_BUDGET // (2 * 8 * max(a.shape[1], 1)))
+
+    distances = np.empty((len(a), len(b)))
+    for i in range(0, len(a), block_size):
+        for j in range(0, len(b), block_size):
+            distances[i:i + block_size, j:j + block_size] = cdist(a[i:i + block_size], b[j:j + block_size], 'cityblock')
+    return distances
+
+
+def common_frame_distance_matrix(original_matrices, compare_matrices, block_size=None):
+    """
+    Calculate the mean absolute differences of all pairs of frame feature matrices, each over its common frames.
+
+    Args:
+        original_matrices (list): Feature matrices with shape (features, frames_i).
+        compare_matrices (list): Feature matrices with shape (features, frames_j).
+        block_size (int): Number of rows per tile. Default is None, which derives it from TILE_MEMORY_BUDGET.
+
+    Returns:
+        np.ndarray: The distance matrix with shape (num_original, num_compare).
+
+    Raises:
+        None
+
+    Notes:
+        Every pair is compared over min(frames_i, frames_j) frames, exactly like the pairwise metrics, so the
+        distance of a pair does not depend on the other files it is scored with. The files of a tile are zero
+        padded to the longest of them and compared with one cdist call. Beyond the common length one of the
+        two files is zero, so the padded distance overshoots by the L1 norm of the longer file past that length,
+        which is looked up in its cumulative frame norms and subtracted.
+
+    """
+    distances = np.empty((len(original_matrices), len(compare_matrices)))
+    if not original_matrices or not compare_matrices:
+        return distances
+    num_features = original_matrices[0].shape[0]
+    original_lengths = np.array([x.shape[1] for x in original_matrices])
+    compare_lengths = np.array([x.shape[1] for x in compare_matrices])
+    if block_size is None:
+        num_frames = max(original_lengths.max(), compare_lengths.max())
+        block_size = max(1, TILE_MEMORY_BUDGET // (2 * 8 * num_features * max(num_frames, 1)))
+
+    for i in range(0, len(original_matrices), block_size):
+        rows = slice(i, i + block_size)
+        for j in range(0, len(compare_matrices), block_size):
+            columns = slice(j, j + block_size)
+            num_frames = max(original_lengths[rows].max(), compare_lengths[columns].max())
+            padded = cdist(
+                stack_frames(original_matrices[rows], num_frames), stack_frames(compare_matrices[columns], num_frames), 'cityblock'
+            )
+            lengths = np.minimum.outer(original_lengths[rows], compare_lengths[columns])
+            original_norms = cumulative_frame_norms(original_matrices[rows], num_frames)
+            compare_norms = cumulative_frame_norms(compare_matrices[columns], num_frames)
+            overshoot = (
+                original_norms[:, -1:] - np.take_along_axis(original_norms, lengths, axis=1)
+                + compare_norms[:, -1:].T - np.take_along_axis(compare_norms, lengths.T, axis=1).T
+            )
+            lengths = np.maximum(lengths, 1)
+            distances[rows, columns] = np.maximum(padded - overshoot, 0) / (num_features * lengths)
+    return distances
+
+
+def onset_matrix(onsets, num_samples):
+    """
+    Build a sparse binary onset matrix with one row per file and one column per sample.
+
+    Args:
+        onsets (list): Per-file sorted, unique onset positions in samples.
+        num_samples (int): Number of columns, at least the length of the longest signal.
+
+    Returns:
+        sparse.csr_matrix: The onset matrix.
+
+    Raises:
+        None
+
+    """
+    indptr = np.concatenate([[0], np.cumsum([len(x) for x in onsets])])
+    indices = np.concatenate([np.asarray(x, dtype=np.int64) for x in onsets]) if onsets else np.empty(0, dtype=np.int64)
+    data = np.ones(len(indices), dtype=np.float64)
+    return sparse.csr_matrix((data, indices, indptr), shape=(len(onsets), num_samples))
+
+
+def zcr_similarity_matrix(original_features, compare_features):
+    original_zcr = np.array([x.zcr for x in original_features])
+    compare_zcr = np.array([x.zcr for x in compare_features])
+    return 1 - np.abs(original_zcr[:, None] - compare_zcr[None, :])
+
+
+def rhythm_similarity_matrix(original_features, compare_features):
+    """
+    Calculate the rhythm similarity of all pairs as one normalized product of sparse onset matrices.
+
+    Args:
+        original_features (list): AudioFeatures records of the original files.
+        compare_features (list): AudioFeatures records of the compare files.
+
+    Returns:
+        np.ndarray: The rhythm similarities with shape (num_original, num_compare).
+
+    Raises:
+        None
+
+    Notes:
+        Each pair is compared over the length of its shorter signal, exactly like the pairwise metric. The number
+        of shared onsets comes from a single sparse matrix product; the number of onsets of each file below the
+        pair length is looked up with a binary search.
+
+    """
+    original_lengths = np.array([x.num_samples for x in original_features], dtype=np.float64)
+    compare_lengths = np.array([x.num_samples for x in compare_features], dtype=np.float64)
+    lengths = np.minimum.outer(original_lengths, compare_lengths)
+
+    original_onsets = [np.asarray(x.onsets) for x in original_features]
+    compare_onsets = [np.asarray(x.onsets) for x in compare_features]
+    num_samples = int(max(original_lengths.max(), compare_lengths.max()))
+    shared = (onset_matrix(original_onsets, num_samples) @ onset_matrix(compare_onsets, num_samples).T).toarray()
+
+    original_counts = np.stack([np.searchsorted(onsets, lengths[i, :]) for i, onsets in enumerate(original_onsets)])
+    compare_counts = np.stack([np.searchsorted(onsets, lengths[:, j]) for j, onsets in enumerate(compare_onsets)], axis=1)
+
+    numerator = lengths * shared - original_counts * compare_counts
+    denominator = original_counts * (lengths - original_counts) * compare_counts * (lengths - compare_counts)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        correlation = np.where(denominator > 0, numerator / np.sqrt(denominator), np.nan)
+    return (correlation + 1) / 2
+
+
+def chroma_similarity_matrix(original_features, compare_features, block_size=None):
+    distances = common_frame_distance_matrix([x.chroma for x in original_features], [x.chroma for x in compare_features], block_size)
+    return 1 - distances
+
+
+def common_frame_distances(query, matrices):
+    """
+    Calculate the mean absolute difference between one frame feature matrix and many, each over their common frames.
+
+    Args:
+        query (np.ndarray): Feature matrix with shape (features, frames).
+        matrices (list): Feature matrices with shape (features, frames_i).
+
+    Returns:
+        np.ndarray: The mean absolute differences with shape (len(matrices),).
+
+    Raises:
+        None
+
+    Notes:
+        Every pair is compared over min(frames, frames_i) frames, exactly like the pairwise metrics, see
+        common_frame_distance_matrix. The matrices are cut to the frames of the query first, so a long file
+        never pads the others beyond the query.
+
+    """
+    return common_frame_distance_matrix([query], [matrix[:, :query.shape[1]] for matrix in matrices])[0]
+
+
+def contrast_scale(features):
+    """
+    Largest absolute spectral contrast of a file, used to normalize contrast distances.
+
+    Notes:
+        The scale of a pair is the larger of the two file scales. It only depends on each file on its own, not on
+        how far the pair is truncated, so the normalization is symmetric and identical in the pairwise, matrix
+        and upper-triangle modes.
+    """
+    return float(np.max(np.abs(features.spectral_contrast)))
+
+
+def spectral_contrast_similarity_matrix(original_features, compare_features, block_size=None):
+    distances = common_frame_distance_matrix(
+        [x.spectral_contrast for x in original_features], [x.spectral_contrast for x in compare_features], block_size
+    )
+    scale = np.maximum.outer([contrast_scale(x) for x in original_features], [contrast_scale(x) for x in compare_features])
+    return 1 - distances / scale
+
+
+def stoi_envelopes(audio):
+    """
+    Calculate the third-octave band envelopes STOI compares, with shape (bands, frames).
+
+    Args:
+        audio (np.ndarray): The signal at PERCEPTUAL_SAMPLE_RATE.
+
+    Returns:
+        np.ndarray: The float32 band envelopes, one frame per PERCEPTUAL_HOP_LENGTH samples.
+
+    Raises:
+        None
+
+    Notes:
+        This is the part of pystoi.stoi that only depends on one signal, so it is computed once per file.
+        Silent frames are not removed: pystoi drops the frames that are silent in the reference signal from
+        both signals, which depends on the pair and breaks the frame alignment between files.
+
+    """
+    spectrum = stoi_utils.stft(np.asarray(audio, dtype=np.float64), N_FRAME, NFFT, overlap=2).transpose()
+    return np.sqrt(OBM @ np.square(np.abs(spectrum))).astype(np.float32)
+
+
+def segment_sums(values, length=PERCEPTUAL_SEGMENT_FRAMES):
+    """
+    Sum of every run of length consecutive frames along the last axis, via a cumulative sum.
+    """
+    cumulative = np.cumsum(values, axis=-1, dtype=np.float64)
+    cumulative = np.concatenate([np.zeros((*cumulative.shape[:-1], 1)), cumulative], axis=-1)
+    return cumulative[..., length:] - cumulative[..., :-length]
+
+
+def segment_correlations(query, references):
+    """
+    Calculate the STOI intermediate intelligibility of every segment and band of aligned band envelopes.
+
+    Args:
+        query (np.ndarray): Band envelopes with shape (..., bands, frames).
+        references (np.ndarray): Band envelopes broadcastable against query, such as (files, bands, frames).
+
+    Returns:
+        np.ndarray: Correlations with shape (..., bands, frames - PERCEPTUAL_SEGMENT_FRAMES + 1).
+
+    Raises:
+        None
+
+    Notes:
+        Segment m of a band holds frames m to m + 29. Its Pearson correlation between both signals is built from
+        running sums of x, y, x², y² and xy, so every frame is touched a constant number of times instead of
+        once per segment it belongs to. Unlike pystoi, the normalized reference is not clipped to the signal to
+        distortion bound, which keeps the score symmetric.
+
+    """
+    query = np.asarray(query, dtype=np.float64)
+    references = np.asarray(references, dtype=np.float64)
+    query_sums, reference_sums = segment_sums(query), segment_sums(references)
+    query_norms = np.sqrt(np.maximum(segment_sums(np.square(query)) - np.square(query_sums) / N, 0))
+    reference_norms = np.sqrt(np.maximum(segment_sums(np.square(references)) - np.square(reference_sums) / N, 0))
+    covariances = segment_sums(query * references) - query_sums * reference_sums / N
+    return covariances / ((query_norms + stoi_utils.EPS) * (reference_norms + stoi_utils.EPS))
+
+
+def stoi_similarity(query, reference):
+    """
+    Perceptual similarity of two band envelopes over their common length, normalized between 0 and 1.
+    """
+    num_frames = min(query.shape[1], reference.shape[1])
+    if num_frames < PERCEPTUAL_SEGMENT_FRAMES:
+        # pystoi returns 1e-5 if there are not enough frames for a single segment
+        return (1e-5 + 1) / 2
+    return float((np.mean(segment_correlations(query[:, :num_frames], reference[:, :num_frames])) + 1) / 2)
+
+
+def perceptual_similarity_matrix(original_features, compare_features, block_size=None):
+    """
+    Calculate the perceptual similarity of all pairs of files from their precomputed STOI band envelopes.
+
+    Notes:
+        Each pair is compared over its own common length, exactly like stoi_similarity. The compare envelopes are
+        zero padded into one stack per block, every original file is correlated with the whole block at once,
+        and the segments beyond the common length of a pair are masked out of its mean.
+
+    """
+    original_frames = np.array([x.stoi_envelopes.shape[1] for x in original_features])
+    compare_frames = np.array([x.stoi_envelopes.shape[1] for x in compare_features])
+    num_bands = OBM.shape[0]
+    if block_size is None:
+        # Several float64 temporaries of shape (block, bands, frames) are alive at once
+        block_size = max(1, TILE_MEMORY_BUDGET // (8 * 8 * num_bands * max(1, compare_frames.max(initial=1))))
+
+    similarities = np.full((len(original_features), len(compare_features)), (1e-5 + 1) / 2)
+    for start in range(0, len(compare_features), block_size):
+        stop = min(start + block_size, len(compare_features))
+        references = np.zeros((stop - start, num_bands, compare_frames[start:stop].max()), dtype=np.float32)
+        for offset, compare in enumerate(compare_features[start:stop]):
+            references[offset, :, :compare_frames[start + offset]] = compare.stoi_envelopes
+
+        for i, original in enumerate(original_features):
+            num_frames = min(original_frames[i], references.shape[2])
+            num_segments = np.minimum(compare_frames[start:stop], original_frames[i]) - PERCEPTUAL_SEGMENT_FRAMES + 1
+            valid = num_segments > 0
+            if num_frames < PERCEPTUAL_SEGMENT_FRAMES or not valid.any():
+                continue
+            with np.errstate(divide='ignore', invalid='ignore'):
+                correlations = segment_correlations(original.stoi_envelopes[:, :num_frames], references[:, :, :num_frames]).sum(axis=1)
+            cumulative = np.concatenate([np.zeros((len(correlations), 1)), np.cumsum(correlations, axis=1)], axis=1)
+            totals = cumulative[np.arange(len(correlations)), np.maximum(num_segments, 0)]
+            scores = totals[valid] / (num_bands * num_segments[valid])
+            similarities[i, start + np.flatnonzero(valid)] = (scores + 1) / 2
+    return similarities
+
+
+def similarity_tensor(original_features, compare_features, metrics=None, block_size=None):
+    """
+    Calculate the audio similarity metrics of all pairs of original and compare files in batched passes.
+
+    Args:
+        original_features (list): AudioFeatures records of the original files.
+        compare_features (list): AudioFeatures records of the compare files.
+        metrics (list): Names of the metrics to calculate, see METRIC_NAMES. Default is None, which calculates all.
+        block_size (int): Number of compare files per block of the L1 distance kernels. Default is None, which
+            derives it from the feature size.
+
+    Returns:
+        np.ndarray: The metric tensor with shape (len(metrics), num_original, num_compare).
+
+    Raises:
+        ValueError: If an unknown metric is requested.
+
+    Notes:
+        ZCR similarities are a broadcasted absolute difference, chroma and spectral contrast similarities use
+        blocked L1 distance kernels over the zero padded frame features, and rhythm similarities are a normalized
+        sparse matrix product. Perceptual similarities correlate the precomputed STOI band envelopes of each
+        original file with a block of compare files at once. Every pair is compared over its own common length,
+        so the scores match the pairwise metrics and do not depend on the other files in the batch.
+
+    """
+    if metrics is None:
+        metrics = METRIC_NAMES
+
+    kernels = {
+        'zcr_similarity': lambda: zcr_similarity_matrix(original_features, compare_features),
+        'rhythm_similarity': lambda: rhythm_similarity_matrix(original_features, compare_features),
+        'chroma_similarity': lambda: chroma_similarity_matrix(original_features, compare_features, block_size),
+        'spectral_contrast_similarity': lambda: spectral_contrast_similarity_matrix(original_features, compare_features, block_size),
+        'perceptual_similarity': lambda: perceptual_similarity_matrix(original_features, compare_features),
+    }
+    unknown = [metric for metric in metrics if metric not in kernels]
+    if unknown:
+        raise ValueError(f"Invalid metrics: {unknown}. Choose from {METRIC_NAMES}.")
+
+    return np.stack([kernels[metric]() for metric in metrics])
+
+
+def condensed_similarities(features, metrics=None, block_size=64):
+    """
+    Calculate audio similarity metrics for every unordered pair of distinct files.
+
+    Args:
+        features (list): AudioFeatures records of the files.
+        metrics (list): Names of the metrics to calculate, see METRIC_NAMES. Default is None, which calculates all.
+        block_size (int): Number of rows scored per batched pass. Default is 64.
+
+    Returns:
+        np.ndarray: The metrics with shape (len(metrics), n * (n - 1) / 2), holding the pairs i < j in row-major
+            order like scipy.spatial.distance.pdist. Use to_square to materialize full matrices.
+
+    Raises:
+        ValueError: If an unknown metric is requested.
+
+    Notes:
+        All metrics are symmetric, so only the upper triangle is scored. This halves compute and storage compared
+        to the full matrix, and skips the diagonal of every file compared with itself. Rows are scored in blocks
+        against the files from the block onwards; only the small lower triangle inside each block is wasted.
+
+    """
+    if metrics is None:
+        metrics = METRIC_NAMES
+
+    n = len(features)
+    similarities = np.empty((len(metrics), n * (n - 1) // 2))
+    position = 0
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        tensor = similarity_tensor(features[start:stop], features[start:], metrics)
+        for offset in range(stop - start):
+            row = tensor[:, offset, offset + 1:]
+            similarities[:, position:position + row.shape[1]] = row
+            position += row.shape[1]
+    return similarities
+
+
+def to_square(condensed, diagonal=1.0):
+    """
+    Materialize a full symmetric matrix from condensed upper-triangle values.
+
+    Args:
+        condensed (np.ndarray): Values of the pairs i < j, see condensed_similarities.
+        diagonal (float): Value of every file compared with itself. Default is 1.0.
+
+    Returns:
+        np.ndarray: The square matrix.
+
+    Raises:
+        None
+
+    """
+    square = squareform(np.asarray(condensed, dtype=np.float64), checks=False)
+    np.fill_diagonal(square, diagonal)
+    return square
+
+
+def pair_similarities(features, pairs, metrics=None):
+    """
+    Calculate audio similarity metrics for selected pairs of files.
+
+    Args:
+        features (list): AudioFeatures records of all files.
+        pairs (list): Pairs of indices into features.
+        metrics (list): Names of the metrics to calculate, see METRIC_NAMES. Default is None, which calculates all.
+
+    Returns:
+        np.ndarray: The metrics with shape (len(metrics), len(pairs)).
+
+    Raises:
+        ValueError: If an unknown metric is requested.
+
+    Notes:
+        Pairs that share their first file are scored together in one batched pass of similarity_tensor, so
+        scoring the top-k candidates of every file costs one pass per file. Every pair is compared over its own
+        common length, so the scores equal those of condensed_similarities for the same pairs.
+
+    """
+    if metrics is None:
+        metrics = METRIC_NAMES
+
+    rows = {}
+    for position, (i, j) in enumerate(pairs):
+        rows.setdefault(i, []).append((position, j))
+
+    similarities = np.empty((len(metrics), len(pairs)))
+    for i, row in rows.items():
+        positions, columns = zip(*row)
+        tensor = similarity_tensor([features[i]], [features[j] for j in columns], metrics)
+        similarities[:, list(positions)] = tensor[:, 0, :]
+    return similarities
@@ -0,0 +1,210 @@
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import fields, replace
+from functools import lru_cache
+import numpy as np
+from similarity_matrix import METRIC_NAMES, similarity_tensor
+
+# Files whose arrays a worker keeps mapped at once. Every array is one mapping and the kernel limits the number
+# of mappings per process (vm.max_map_count, 65530 by default).
+ATTACHED_FILES = 4096
+
+_handles = None
+
+
+def is_mapped_npy(value):
+    """
+    Whether an array is a whole .npy file loaded memory-mapped, rather than a copy or a view into part of it.
+    """
+    if not isinstance(value, np.memmap) or not value.filename or not value.filename.endswith('.npy'):
+        return False
+    mapped = np.load(value.filename, mmap_mode='r')
+    return mapped.shape == value.shape and mapped.dtype == value.dtype and mapped.strides == value.strides
+
+
+def share_features(features, directory, name):
+    """
+    Make the arrays of a feature record available to other processes as memory-mapped .npy files.
+
+    Args:
+        features (AudioFeatures): The feature record.
+        directory (str): Directory for arrays that are not memory-mapped yet.
+        name (str): Unique file name prefix of the record in directory.
+
+    Returns:
+        tuple: A copy of the record with every array replaced by the path of its .npy file, and the names of
+            the replaced fields.
+
+    Raises:
+        OSError: If an array cannot be written.
+
+    Notes:
+        Arrays loaded memory-mapped from a FeatureStore already live in a .npy file and are shared as they are,
+        so features coming from a store are never copied.
+
+    """
+    paths = {}
+    for field in fields(features):
+        value = getattr(features, field.name)
+        if not isinstance(value, np.ndarray):
+            continue
+        if is_mapped_npy(value):
+            paths[field.name] = value.filename
+        else:
+            paths[field.name] = os.path.join(directory, f"{name}-{field.name}.npy")
+            np.save(paths[field.name], value)
+    return replace(features, **paths), tuple(paths)
+
+
+def _attach(handles):
+    global _handles
+    _handles = handles
+
+
+@lru_cache(maxsize=ATTACHED_FILES)
+def _attached(index):
+    handle, array_fields = _handles[index]
+    arrays = {name: np.load(getattr(handle, name), mmap_mode='r') for name in array_fields}
+    return replace(handle, **arrays)
+
+
+def _score_tile(rows, columns, metrics):
+    return similarity_tensor([_attached(i) for i in rows], [_attached(j) for j in columns], metrics)
+
+
+class SimilarityPool:
+    """
+    Process pool that scores tiles of the pair matrix on features shared through memory-mapped files.
+
+    Args:
+        features (list): AudioFeatures records of all files that will be compared.
+        workers (int): Number of worker processes. Default is None, which uses one per CPU.
+        tile_size (int): Number of rows and columns per tile. Default is 128.
+        max_in_flight (int): Maximum number of tiles submitted at the same time. Default is None, which allows
+            four per worker.
+
+    Raises:
+        OSError: If the features cannot be written to a temporary directory.
+
+    Notes:
+        Every feature array is written to a .npy file once, or reused if it is already memory-mapped from a
+        FeatureStore, and workers receive the file paths once when they start. A task only names the row and
+        column indices of its tile, so no arrays are pickled per task, and the operating system shares the
+        mapped pages between all workers. Tiles are small and handed out as workers finish, which balances the
+        load across all cores. Every pair is compared over its own common length, so a score does not depend on
+        the tile it is computed in and the pool produces the same values as one serial pass over all files.
+
+    """
+    def __init__(self, features, workers=None, tile_size=128, max_in_flight=None):
+        self.num_files = len(features)
+        self.tile_size = tile_size
+        self.workers = workers or os.cpu_count() or 1
+        self.max_in_flight = max_in_flight or 4 * self.workers
+
+        self.directory = tempfile.TemporaryDirectory(prefix='shared-features-')
+        handles = [share_features(x, self.directory.name, f"{i:08d}") for i, x in enumerate(features)]
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_attach, initargs=(handles,))
+
+    def close(self):
+        self.executor.shutdown()
+        self.directory.cleanup()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def iter_tiles(self, tiles, metrics):
+        """
+        Score tiles in the pool, yielding them as they finish.
+
+        Args:
+            tiles (iterable): Tuples of a key identifying the tile and its row and column index lists.
+            metrics (list): Names of the metrics to calculate.
+
+        Yields:
+            tuple: The key and the metric tensor of a tile.
+
+        Raises:
+            ValueError: If an unknown metric is requested.
+
+        """
+        tiles = iter(tiles)
+        futures = {}
+        exhausted = False
+        while True:
+            while not exhausted and len(futures) < self.max_in_flight:
+                tile = next(tiles, None)
+                if tile is None:
+                    exhausted = True
+                    break
+                key, rows, columns = tile
+                futures[self.executor.submit(_score_tile, rows, columns, metrics)] = key
+            if not futures:
+                break
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield futures.pop(future), future.result()
+
+    def tensor(self, rows, columns, metrics=None):
+        """
+        Calculate audio similarity metrics for all pairs of the given rows and columns.
+
+        Args:
+            rows (list): Indices of the original files in the features of the pool.
+            columns (list): Indices of the compare files in the features of the pool.
+            metrics (list): Names of the metrics to calculate, see METRIC_NAMES. Default is None, which calculates all.
+
+        Returns:
+            np.ndarray: The metric tensor with shape (len(metrics), len(rows), len(columns)).
+
+        Raises:
+            ValueError: If an unknown metric is requested.
+
+        """
+        metrics = METRIC_NAMES if metrics is None else metrics
+        rows, columns = list(rows), list(columns)
+        tiles = (
+            ((a, b), rows[a:a + self.tile_size], columns[b:b + self.tile_size])
+            for a in range(0, len(rows), self.tile_size)
+            for b in range(0, len(columns), self.tile_size)
+        )
+        similarities = np.empty((len(metrics), len(rows), len(columns)))
+        for (a, b), tile in self.iter_tiles(tiles, metrics):
+            similarities[:, a:a + tile.shape[1], b:b + tile.shape[2]] = tile
+        return similarities
+
+    def condensed(self, metrics=None):
+        """
+        Calculate audio similarity metrics for every unordered pair of distinct files in the pool.
+
+        Args:
+            metrics (list): Names of the metrics to calculate, see METRIC_NAMES. Default is None, which calculates all.
+
+        Returns:
+            np.ndarray: The metrics with shape (len(metrics), n * (n - 1) / 2) in the order of
+                condensed_similarities.
+
+        Raises:
+            ValueError: If an unknown metric is requested.
+
+        Notes:
+            Only tiles on or above the diagonal are scored.
+
+        """
+        metrics = METRIC_NAMES if metrics is None else metrics
+        n = self.num_files
+        starts = range(0, n, self.tile_size)
+        tiles = (
+            ((a, b), list(range(a, min(a + self.tile_size, n))), list(range(b, min(b + self.tile_size, n))))
+            for a in starts for b in starts if b >= a
+        )
+        similarities = np.empty((len(metrics), n * (n - 1) // 2))
+        for (a, b), tile in self.iter_tiles(tiles, metrics):
+            i, j = np.meshgrid(np.arange(a, a + tile.shape[1]), np.arange(b, b + tile.shape[2]), indexing='ij')
+            upper = i < j
+            positions = n * i[upper] - i[upper] * (i[upper] + 1) // 2 + j[upper] - i[upper] - 1
+            similarities[:, positions] = tile[:, upper]
+        return similarities
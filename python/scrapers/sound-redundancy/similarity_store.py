@@ -0,0 +1,166 @@
+import sqlite3
+from similarity_matrix import METRIC_NAMES
+
+SCORE_COLUMNS = [*METRIC_NAMES, 'swass']
+
+
+class SimilarityStore:
+    """
+    Durable SQLite store for pairwise similarity results, keyed by the content hashes of both files.
+
+    Args:
+        path (str): Path of the SQLite database. Created if it does not exist.
+
+    Raises:
+        sqlite3.Error: If the database cannot be opened.
+
+    Notes:
+        Pairs are stored once, ordered so that hash_a < hash_b, which makes (a, b) and (b, a) the same row.
+        The database runs in WAL mode and every call to add_similarities commits its own transaction, so a run
+        that is killed at any point keeps every batch it committed and loses nothing else. The primary key
+        doubles as the index used to skip pairs that were already scored.
+
+    """
+    def __init__(self, path):
+        self.connection = sqlite3.connect(str(path))
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS files (hash TEXT NOT NULL, path TEXT PRIMARY KEY)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS files_hash ON files (hash)")
+            columns = ", ".join(f"{name} REAL" for name in SCORE_COLUMNS)
+            self.connection.execute(
+                f"CREATE TABLE IF NOT EXISTS similarities (hash_a TEXT NOT NULL, hash_b TEXT NOT NULL, {columns}, "
+                "PRIMARY KEY (hash_a, hash_b)) WITHOUT ROWID"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS similarities_hash_b ON similarities (hash_b)")
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @staticmethod
+    def ordered(hash_a, hash_b):
+        return (hash_a, hash_b) if hash_a <= hash_b else (hash_b, hash_a)
+
+    def add_files(self, files):
+        """
+        Record the content hash of audio files.
+
+        Args:
+            files (dict): Mapping of file paths to content hashes.
+
+        Returns:
+            None
+
+        Raises:
+            None
+
+        """
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO files (path, hash) VALUES (?, ?)", files.items())
+
+    def scored_partners(self, file_hash):
+        """
+        Find all files that were already scored against a file.
+
+        Args:
+            file_hash (str): Content hash of the file.
+
+        Returns:
+            set: Content hashes of the files scored against it.
+
+        Raises:
+            None
+
+        """
+        rows = self.connection.execute(
+            "SELECT hash_b FROM similarities WHERE hash_a = ? UNION SELECT hash_a FROM similarities WHERE hash_b = ?",
+            (file_hash, file_hash)
+        )
+        return {row[0] for row in rows}
+
+    def add_similarities(self, rows):
+        """
+        Store similarity results and commit them.
+
+        Args:
+            rows (iterable): Tuples of (hash_a, hash_b, scores), where scores maps column names in SCORE_COLUMNS
+                to values. Missing columns are stored as NULL.
+
+        Returns:
+            None
+
+        Raises:
+            None
+
+        """
+        placeholders = ", ".join("?" for _ in range(len(SCORE_COLUMNS) + 2))
+        with self.connection:
+            self.connection.executemany(
+                f"INSERT OR IGNORE INTO similarities (hash_a, hash_b, {', '.join(SCORE_COLUMNS)}) VALUES ({placeholders})",
+                (
+                    (*self.ordered(hash_a, hash_b), *(scores.get(name) for name in SCORE_COLUMNS))
+                    for hash_a, hash_b, scores in rows
+                )
+            )
+
+    def iter_files(self):
+        """
+        Iterate over the recorded audio files.
+
+        Yields:
+            tuple: The file path and its content hash.
+
+        Raises:
+            None
+
+        """
+        yield from self.connection.execute("SELECT path, hash FROM files ORDER BY path")
+
+    def iter_edges(self, min_swass):
+        """
+        Iterate over the pairs of files at or above a SWASS threshold, without resolving content hashes.
+
+        Args:
+            min_swass (float): Only yield pairs with at least this SWASS.
+
+        Yields:
+            tuple: The content hashes of both files and their SWASS.
+
+        Raises:
+            None
+
+        """
+        yield from self.connection.execute("SELECT hash_a, hash_b, swass FROM similarities WHERE swass >= ?", (min_swass,))
+
+    def iter_similarities(self, min_swass=None):
+        """
+        Iterate over the stored similarities, resolving content hashes to file paths.
+
+        Args:
+            min_swass (float): Only yield pairs with at least this SWASS. Default is None, which yields all pairs.
+
+        Yields:
+            dict: The file paths as audio_file_a and audio_file_b, followed by the scores. Files with identical
+                content yield one row per combination of their paths.
+
+        Raises:
+            None
+
+        """
+        query = (
+            f"SELECT a.path, b.path, {', '.join('s.' + name for name in SCORE_COLUMNS)} FROM similarities s "
+            "JOIN files a ON a.hash = s.hash_a JOIN files b ON b.hash = s.hash_b"
+        )
+        parameters = ()
+        if min_swass is not None:
+            query += " WHERE s.swass >= ?"
+            parameters = (min_swass,)
+        for path_a, path_b, *scores in self.connection.execute(query, parameters):
+            yield dict(audio_file_a=path_a, audio_file_b=path_b, **dict(zip(SCORE_COLUMNS, scores)))
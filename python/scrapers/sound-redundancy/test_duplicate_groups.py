@@ -0,0 +1,35 @@
+import librosa
+import numpy as np
+
+from audio_similarity import HOP_LENGTH
+from conftest import SAMPLE_RATE
+from duplicate_groups import group_duplicates, perceptual_hash
+
+
+def pcm_hash(audio):
+    audio = audio.astype(np.float32)
+    log_mel = librosa.power_to_db(librosa.feature.melspectrogram(y=audio, sr=SAMPLE_RATE, hop_length=HOP_LENGTH))
+    return perceptual_hash(audio, log_mel, SAMPLE_RATE, HOP_LENGTH)
+
+
+def tone(frequency, seconds):
+    return 0.3 * np.sin(2 * np.pi * frequency * np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE)
+
+
+def test_short_and_silent_signals_only_match_identical_audio():
+    assert pcm_hash(tone(220, 1.5)) != pcm_hash(tone(330, 1.5))
+    assert pcm_hash(np.zeros(SAMPLE_RATE)) != pcm_hash(np.zeros(int(1.9 * SAMPLE_RATE)))
+    assert pcm_hash(np.zeros(3 * SAMPLE_RATE)) != pcm_hash(np.full(3 * SAMPLE_RATE, 0.5))
+    assert pcm_hash(tone(220, 1.5)) == pcm_hash(tone(220, 1.5))
+    assert pcm_hash(tone(220, 1.5)) != pcm_hash(0.5 * tone(220, 1.5))
+
+
+def test_hash_survives_gain_but_not_length_changes():
+    noise = 0.1 * np.random.default_rng(0).standard_normal(4 * SAMPLE_RATE)
+    assert pcm_hash(noise) == pcm_hash(0.5 * noise)
+    assert pcm_hash(noise) != pcm_hash(noise[:-HOP_LENGTH])
+
+
+def test_groups_merge_transitively():
+    keys = [('a', 'x'), ('b', 'y'), ('a', 'z'), ('c', 'y'), ('d', None), ('e', None)]
+    assert group_duplicates(keys) == [[0, 2], [1, 3], [4], [5]]
@@ -0,0 +1,27 @@
+from itertools import combinations
+
+import numpy as np
+
+from similarity_matrix import METRIC_NAMES, condensed_similarities, pair_similarities, similarity_tensor
+
+
+def test_pair_scores_do_not_depend_on_batch(features):
+    pairs = list(combinations(range(len(features)), 2))
+    expected = np.stack([similarity_tensor([features[i]], [features[j]], METRIC_NAMES)[:, 0, 0] for i, j in pairs], axis=1)
+    np.testing.assert_allclose(condensed_similarities(features, METRIC_NAMES, block_size=2), expected, equal_nan=True)
+    np.testing.assert_allclose(pair_similarities(features, pairs, METRIC_NAMES), expected, equal_nan=True)
+
+
+def test_frame_features_compared_over_common_length(features):
+    a, b = features[0], features[1]
+    num_frames = min(a.chroma.shape[1], b.chroma.shape[1])
+    chroma = 1 - np.mean(np.abs(a.chroma[:, :num_frames] - b.chroma[:, :num_frames]))
+    tensor = similarity_tensor([a], features, ['chroma_similarity'])
+    np.testing.assert_allclose(tensor[0, 0, 1], chroma, rtol=1e-6)
+
+
+def test_resumed_row_matches_full_row(features):
+    # score-pairs.py scores only the partners of a row that are missing after a killed run
+    full = similarity_tensor(features[:1], features[1:], METRIC_NAMES)
+    resumed = similarity_tensor(features[:1], features[3:], METRIC_NAMES)
+    np.testing.assert_allclose(resumed, full[:, :, 2:], equal_nan=True)
@@ -0,0 +1,13 @@
+import numpy as np
+
+from similarity_matrix import METRIC_NAMES, condensed_similarities
+from similarity_pool import SimilarityPool
+
+
+def test_pool_matches_serial_scores(features):
+    expected = condensed_similarities(features, METRIC_NAMES)
+    with SimilarityPool(features, workers=2, tile_size=2) as pool:
+        condensed = pool.condensed(METRIC_NAMES)
+        tensor = pool.tensor([0, 1], [2, 3, 4], METRIC_NAMES)
+    np.testing.assert_allclose(condensed, expected, equal_nan=True)
+    np.testing.assert_allclose(tensor[:, 0, 0], expected[:, 1], equal_nan=True)
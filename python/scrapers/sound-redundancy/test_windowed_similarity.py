@@ -0,0 +1,14 @@
+from similarity_matrix import WEIGHTS
+from windowed_similarity import compare_windows, num_frames
+
+# Sample rate of the features fixture
+SAMPLE_RATE = 22050
+
+
+def test_compare_windows_is_symmetric(features):
+    # Files 0 and 2 have the same length, files 0 and 1 do not
+    assert num_frames(features[0]) == num_frames(features[2]) != num_frames(features[1])
+    for a, b in [(features[0], features[2]), (features[0], features[1])]:
+        forward = compare_windows(a, b, SAMPLE_RATE, WEIGHTS, window_seconds=0.5, hop_seconds=0.25)
+        backward = compare_windows(b, a, SAMPLE_RATE, WEIGHTS, window_seconds=0.5, hop_seconds=0.25)
+        assert forward == backward
@@ -0,0 +1,195 @@
+import numpy as np
+from similarity_matrix import (
+    HOP_LENGTH, METRIC_NAMES, PERCEPTUAL_HOP_LENGTH, PERCEPTUAL_SAMPLE_RATE, PERCEPTUAL_SEGMENT_FRAMES, blocked_cityblock,
+    contrast_scale, segment_correlations
+)
+
+AGGREGATES = {
+    'max': np.max,
+    'mean': np.mean,
+}
+
+
+def num_frames(features):
+    return min(len(features.zcr_frames), len(features.onset_envelope), features.chroma.shape[1], features.spectral_contrast.shape[1])
+
+
+def window_starts(total_frames, window_frames, hop_frames):
+    """
+    Calculate the first frame of every window of a signal. The last window is aligned to the end of the signal.
+    """
+    starts = np.arange(0, total_frames - window_frames + 1, hop_frames)
+    if starts[-1] + window_frames < total_frames:
+        starts = np.append(starts, total_frames - window_frames)
+    return starts
+
+
+def stack_windows(frames, starts, window_frames):
+    """
+    Cut windows out of frame features with shape (..., frames) and flatten them to shape (windows, -1).
+    """
+    return np.stack([np.asarray(frames[..., start:start + window_frames], dtype=np.float32) for start in starts]).reshape(len(starts), -1)
+
+
+def correlation_matrix(a, b):
+    """
+    Pearson correlation of all pairs of rows of two matrices as one normalized matrix product. Constant rows give NaN.
+    """
+    a = a - a.mean(axis=1, keepdims=True)
+    b = b - b.mean(axis=1, keepdims=True)
+    a_norm = np.linalg.norm(a, axis=1)
+    b_norm = np.linalg.norm(b, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (a @ b.T) / np.outer(a_norm, b_norm)
+
+
+def window_similarities(query, reference, query_starts, reference_starts, window_frames):
+    """
+    Calculate the frame-based similarity metrics of all pairs of query and reference windows.
+
+    Args:
+        query (AudioFeatures): Features of the file whose windows are matched.
+        reference (AudioFeatures): Features of the file that is searched for matches.
+        query_starts (np.ndarray): First frames of the query windows.
+        reference_starts (np.ndarray): First frames of the reference windows.
+        window_frames (int): Number of frames per window.
+
+    Returns:
+        dict: Matrices with shape (query windows, reference windows) keyed by metric name.
+
+    Raises:
+        None
+
+    """
+    query_zcr = stack_windows(query.zcr_frames, query_starts, window_frames).mean(axis=1)
+    reference_zcr = stack_windows(reference.zcr_frames, reference_starts, window_frames).mean(axis=1)
+
+    query_onsets = stack_windows(query.onset_envelope, query_starts, window_frames)
+    reference_onsets = stack_windows(reference.onset_envelope, reference_starts, window_frames)
+
+    query_chroma = stack_windows(query.chroma, query_starts, window_frames)
+    reference_chroma = stack_windows(reference.chroma, reference_starts, window_frames)
+
+    query_contrast = stack_windows(query.spectral_contrast, query_starts, window_frames)
+    reference_contrast = stack_windows(reference.spectral_contrast, reference_starts, window_frames)
+    scale = max(contrast_scale(query), contrast_scale(reference))
+
+    return {
+        'zcr_similarity': 1 - np.abs(query_zcr[:, None] - reference_zcr[None, :]),
+        'rhythm_similarity': (correlation_matrix(query_onsets, reference_onsets) + 1) / 2,
+        'chroma_similarity': 1 - blocked_cityblock(query_chroma, reference_chroma) / query_chroma.shape[1],
+        'spectral_contrast_similarity': 1 - blocked_cityblock(query_contrast, reference_contrast) / query_contrast.shape[1] / scale,
+    }
+
+
+def matched_window_scores(query, reference, sample_rate, weights, metrics, window_seconds, hop_seconds):
+    """
+    Match every window of the query with its best reference window and score the matches.
+
+    Args:
+        query (AudioFeatures): Features of the file whose windows are matched, not longer than the reference.
+        reference (AudioFeatures): Features of the file that is searched for matches.
+        sample_rate (int): Sample rate the features were extracted at.
+        weights (dict): Weight of each metric, used to pick the best matching window.
+        metrics (list): Names of the metrics to calculate.
+        window_seconds (float): Duration of the compared segments.
+        hop_seconds (float): Offset between consecutive segments.
+
+    Returns:
+        dict: Scores of the matched window pairs with shape (query windows,) keyed by metric name.
+
+    Raises:
+        None
+
+    """
+    window_frames = min(int(window_seconds * sample_rate / HOP_LENGTH), num_frames(query))
+    hop_frames = max(1, int(hop_seconds * sample_rate / HOP_LENGTH))
+    query_starts = window_starts(num_frames(query), window_frames, hop_frames)
+    reference_starts = window_starts(num_frames(reference), window_frames, hop_frames)
+
+    similarities = window_similarities(query, reference, query_starts, reference_starts, window_frames)
+
+    # Match every query window with the reference window that scores best on the weighted frame metrics
+    match_weights = {name: weights.get(name, 0) for name in similarities if name in metrics}
+    if not any(match_weights.values()):
+        match_weights = {name: 1 for name in similarities}
+    match_scores = sum(weight * np.nan_to_num(similarities[name]) for name, weight in match_weights.items())
+    matches = np.argmax(match_scores, axis=1)
+    rows = np.arange(len(query_starts))
+
+    window_scores = {name: similarities[name][rows, matches] for name in metrics if name in similarities}
+    if 'perceptual_similarity' in metrics:
+        # Map the matched windows onto the frames of the STOI band envelopes and correlate all matches at once
+        scale = HOP_LENGTH * PERCEPTUAL_SAMPLE_RATE / sample_rate / PERCEPTUAL_HOP_LENGTH
+        query_stoi_starts = (query_starts * scale).astype(np.int64)
+        reference_stoi_starts = (reference_starts[matches] * scale).astype(np.int64)
+        length = min(
+            int(window_frames * scale),
+            query.stoi_envelopes.shape[1] - query_stoi_starts.max(),
+            reference.stoi_envelopes.shape[1] - reference_stoi_starts.max()
+        )
+        if length < PERCEPTUAL_SEGMENT_FRAMES:
+            # Same fallback as pystoi for signals shorter than one segment
+            window_scores['perceptual_similarity'] = np.full(len(query_starts), (1e-5 + 1) / 2)
+        else:
+            correlations = segment_correlations(
+                np.stack([query.stoi_envelopes[:, start:start + length] for start in query_stoi_starts]),
+                np.stack([reference.stoi_envelopes[:, start:start + length] for start in reference_stoi_starts])
+            )
+            window_scores['perceptual_similarity'] = (correlations.mean(axis=(1, 2)) + 1) / 2
+    return window_scores
+
+
+def compare_windows(a, b, sample_rate, weights, metrics=None, window_seconds=30.0, hop_seconds=10.0, aggregate='max'):
+    """
+    Compare two audio files segment by segment, so that trimmed or offset copies of a loop are recognized.
+
+    Args:
+        a (AudioFeatures): Features of the first audio file.
+        b (AudioFeatures): Features of the second audio file.
+        sample_rate (int): Sample rate the features were extracted at.
+        weights (dict): Weight of each metric, used to pick the best matching window and for the SWASS.
+        metrics (list): Names of the metrics to calculate, see METRIC_NAMES. Default is None, which calculates all.
+        window_seconds (float): Duration of the compared segments. Default is 30 seconds.
+        hop_seconds (float): Offset between consecutive segments. Default is 10 seconds.
+        aggregate (str): How window scores are combined, 'max' or 'mean'. Default is 'max'.
+
+    Returns:
+        dict: The aggregated metrics keyed by metric name, including the 'swass'.
+
+    Raises:
+        ValueError: If an unknown metric or aggregate is requested.
+
+    Notes:
+        Every window of the shorter file is compared with every window of the longer file, and the best matching
+        window according to the weighted frame metrics is kept. The metrics of these matches are then aggregated
+        over the windows of the shorter file. Rhythm is compared via the onset strength envelope at frame rate,
+        so memory per comparison grows with the number of frames rather than samples. Perceptual similarity is
+        only evaluated on the matched window pairs. Matching is directed from the shorter file to the longer one.
+        If both files have the same number of frames, the windows are matched in both directions and the results
+        averaged, so compare_windows(a, b) equals compare_windows(b, a).
+
+    """
+    if metrics is None:
+        metrics = METRIC_NAMES
+    unknown = [name for name in metrics if name not in METRIC_NAMES]
+    if unknown:
+        raise ValueError(f"Invalid metrics: {unknown}. Choose from {METRIC_NAMES}.")
+    if aggregate not in AGGREGATES:
+        raise ValueError(f"Invalid aggregate: {aggregate}. Choose from {list(AGGREGATES)}.")
+
+    if num_frames(a) < num_frames(b):
+        directions = [(a, b)]
+    elif num_frames(a) > num_frames(b):
+        directions = [(b, a)]
+    else:
+        directions = [(a, b), (b, a)]
+
+    results = []
+    for query, reference in directions:
+        window_scores = matched_window_scores(query, reference, sample_rate, weights, metrics, window_seconds, hop_seconds)
+        swass = sum(weights.get(name, 0) * values for name, values in window_scores.items())
+        result = {name: float(AGGREGATES[aggregate](window_scores[name])) for name in metrics}
+        result['swass'] = float(AGGREGATES[aggregate](swass))
+        results.append(result)
+    return {name: sum(result[name] for result in results) / len(results) for name in results[0]}